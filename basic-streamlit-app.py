@@ -2,6 +2,7 @@ import streamlit as st
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
+from datawhisperer.export import ExportCache
 
 # Set page configuration
 st.set_page_config(
@@ -10,6 +11,11 @@ st.set_page_config(
     layout="wide"
 )
 
+# Downloads are serialized when clicked and kept on disk for repeat clicks
+@st.cache_resource
+def get_exports():
+    return ExportCache()
+
 # Header
 st.title("My Basic Streamlit App")
 st.markdown("### Welcome to my first Streamlit application!")
@@ -126,10 +132,11 @@ elif page == "Chart Generator":
     # Show the chart
     st.pyplot(fig)
     
-    # Download option
+    # Download option; the CSV is only written when the button is clicked
     st.download_button(
         label="Download data as CSV",
-        data=pd.DataFrame({'x': x, 'y': y}).to_csv(index=False),
+        data=get_exports().download(f"chart-data-{data_size}-{random_seed}",
+                                    lambda: pd.DataFrame({'x': x, 'y': y}), "csv"),
         file_name='chart_data.csv',
         mime='text/csv',
     )
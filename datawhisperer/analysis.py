@@ -0,0 +1,347 @@
+import re
+
+import pandas as pd
+import plotly.express as px
+
+from datawhisperer import charts, tracing
+from datawhisperer.columns import column_index
+from datawhisperer.eda import outlier_table, summary_table
+from datawhisperer.filters import BoolOp, FilterError, filtered, format_expr, parse_filter
+from datawhisperer.intents import IntentRouter
+from datawhisperer.stats import stats_for
+
+# Aggregation keywords and the pandas method they map to, in matching order
+AGG_FUNCS = {
+    "mean": "mean", "average": "mean", "avg": "mean", "sum": "sum",
+    "max": "max", "maximum": "max", "min": "min", "minimum": "min", "count": "count",
+}
+
+# Words asking for an exact answer instead of one from the ingest sketches
+EXACT_WORDS = {"exact", "exactly", "precise", "precisely"}
+DEFAULT_PERCENTILES = (0.25, 0.5, 0.75, 0.9, 0.99)
+PERCENTILE_KEYWORDS = ["p1", "p5", "p10", "p25", "p50", "p75", "p90", "p95", "p99", "p999", "p9999"]
+# "p99", "p99.9", "95th percentile"
+_PERCENTILE = re.compile(r"\bp(\d+(?:\.\d+)?)\b|\b(\d+(?:\.\d+)?)(?:st|nd|rd|th)?[ -]percentile", re.IGNORECASE)
+MAX_TOP_VALUES = 100
+
+UNKNOWN_COMMAND = "I'm not sure how to process that command. Try asking for statistics, columns, correlations, or to create plots."
+
+def column_positions(tokens, columns=None):
+    """Positions of ``tokens`` that spell a column name, so "Top_Speed" is never read as "top" """
+    if columns is None:
+        return set()
+    return {i for start, stop, _ in column_index(columns).spans(tokens) for i in range(start, stop)}
+
+
+ROUTER = IntentRouter(mask=column_positions)
+
+
+def extract_columns(command, available_columns):
+    """Extract column names from the command, in the order they are mentioned"""
+    return column_index(available_columns).match(command)
+
+
+def with_note(response, note):
+    return f"{response} ({note[0].lower()}{note[1:]})" if note else response
+
+
+def command_args(command, tokens, keyword, columns=None):
+    """Columns, row count and aggregation function mentioned in a command"""
+    args = {"columns": extract_columns(command, columns) if columns is not None else []}
+    numbers = [int(t) for t in tokens if t.isdigit()]
+    args["count"] = numbers[0] if numbers else None
+    token_set = set(tokens)
+    args["func_name"] = next((name for name in AGG_FUNCS if name in token_set), None)
+    return args
+
+
+@ROUTER.intent("summary", ["describe", "description", "summary", "summarize", "statistics", "stats", "info", "information"],
+               extract=command_args)
+def show_summary(df, intent, session):
+    summary = _precomputed(session, "summary")
+    if summary is None:
+        summary = summary_table(df)
+    response = f"Here's a summary of your data:\n\n{summary.to_string()}\n\n"
+    response += f"Dataset has {df.shape[0]} rows and {df.shape[1]} columns."
+    return response, None
+
+
+def _precomputed(session, name):
+    """An artifact the background EDA already computed for the session's dataset, or None.
+
+    Artifacts describe the whole dataset, so they are not used while a filter is active.
+    """
+    eda = session.get("eda")
+    if eda is None or session.get("filter") is not None:
+        return None
+    return eda.get(name)
+
+
+def _sketches(columns, intent, session):
+    """The ingest sketches of the session's dataset when they can answer for ``columns``.
+
+    They describe the whole unfiltered file, so they are not used while a
+    filter is active or when the command asks for an exact answer.
+    """
+    sketches = session.get("sketches")
+    if sketches is None or session.get("filter") is not None or EXACT_WORDS & set(intent.tokens):
+        return None
+    return sketches if all(col in sketches for col in columns) else None
+
+
+def _exact_note(df, session):
+    """Warn when an exact answer only covers the sample of a file that was loaded sampled"""
+    sketches = session.get("sketches")
+    if sketches is None or session.get("filter") is not None or sketches.rows <= len(df):
+        return ""
+    return f"\n\nComputed on the {len(df):,} loaded rows, a sample of the file's {sketches.rows:,}."
+
+
+def percentile_args(command, tokens, keyword, columns=None):
+    """command_args plus the percentiles named in the command, as fractions"""
+    args = command_args(command, tokens, keyword, columns)
+    qs = []
+    for digits, ordinal in _PERCENTILE.findall(command):
+        if digits:
+            # p5 is the 5th percentile, p50 the median and p999 the 99.9th
+            q = float(digits) / 100 if "." in digits or len(digits) <= 2 else int(digits) / 10 ** len(digits)
+        else:
+            q = float(ordinal) / 100
+        if 0 < q < 1:
+            qs.append(q)
+    if "median" in tokens:
+        qs.append(0.5)
+    args["percentiles"] = sorted(set(qs)) or list(DEFAULT_PERCENTILES)
+    return args
+
+
+def percentile_label(q):
+    return f"p{q * 100:g}"
+
+
+@ROUTER.intent("distinct", ["unique", "distinct", "nunique", "cardinality", "how many different"], extract=command_args)
+def distinct_count(df, intent, session):
+    cols = intent.args["columns"] or list(df.columns)
+    sketches = _sketches(cols, intent, session)
+    if sketches is not None:
+        estimates = [sketches.distinct(col) for col in cols]
+        error = 2 * estimates[0][1]
+        lines = [f"{col}: about {estimate:,.0f}" for col, (estimate, _) in zip(cols, estimates)]
+        response = (f"Distinct values, estimated over all {sketches.rows:,} rows:\n\n" + "\n".join(lines)
+                    + f"\n\nEstimates are within ±{error:.1%} with 95% confidence (HyperLogLog). "
+                    "Ask for an exact count to compute it from the data.")
+        return response, None
+    counts = df[cols].nunique()
+    response = "Distinct values:\n\n" + "\n".join(f"{col}: {int(n):,}" for col, n in counts.items())
+    return response + _exact_note(df, session), None
+
+
+@ROUTER.intent("percentile", ["percentile", "percentiles", "quantile", "quantiles", "median", *PERCENTILE_KEYWORDS],
+               extract=percentile_args)
+def percentiles(df, intent, session):
+    qs = intent.args["percentiles"]
+    numeric_cols = stats_for(df).numeric_columns()
+    if not numeric_cols:
+        return "No numeric columns available for percentiles.", None
+    cols = intent.args["columns"] or numeric_cols
+    # Quantiles of text columns raise, so only the numeric ones are used
+    cols = [col for col in cols if col in numeric_cols]
+    if not cols:
+        return f"{', '.join(intent.args['columns'])} is not numeric, so it has no percentiles.", None
+    sketches = _sketches(cols, intent, session)
+    if sketches is not None and all(sketches[col].quantiles is not None for col in cols):
+        rows = []
+        for col in cols:
+            bounded, error = sketches.quantiles(col, qs)
+            rows += [{"column": col, "percentile": percentile_label(q), "value": value, "at least": low,
+                      "at most": high} for q, value, low, high in bounded]
+        response = (f"Percentiles estimated over all {sketches.rows:,} rows. Each value's rank is within "
+                    f"±{error:.2%} with 99% confidence, so the true value lies between the bounds shown (KLL sketch). "
+                    "Ask for exact percentiles to compute them from the data.")
+        return response, pd.DataFrame(rows)
+    values = df[cols].quantile(qs)
+    rows = [{"column": col, "percentile": percentile_label(q), "value": values.loc[q, col]} for col in cols for q in qs]
+    return f"Percentiles of {', '.join(cols)}:" + _exact_note(df, session), pd.DataFrame(rows)
+
+
+def asks_for_top_values(args, keyword):
+    """Only "most common" and similar ask for top values without naming a column ("top 5 rows" doesn't)"""
+    return bool(args["columns"]) or keyword in ("most common", "most frequent", "heavy hitters")
+
+
+@ROUTER.intent("top", ["top", "most common", "most frequent", "frequent", "heavy hitters"], extract=command_args,
+               accept=asks_for_top_values)
+def top_values(df, intent, session):
+    cols = intent.args["columns"]
+    if not cols:
+        return "Please specify which column to find the most common values of.", None
+    col = cols[0]
+    k = min(intent.args["count"] or 10, MAX_TOP_VALUES)
+    sketches = _sketches([col], intent, session)
+    if sketches is not None:
+        top, seen = sketches.top(col, k)
+        bound = int((top["count ≤"] - top["count ≥"]).max()) if len(top) else 0
+        response = (f"Top {len(top)} values of {col}, counted over all {seen:,} non-null rows. Counts are "
+                    f"lower bounds that are at most {bound:,} below the true count (Misra-Gries). "
+                    "Ask for exact counts to compute them from the data.")
+        return response, top
+    if isinstance(df, pd.DataFrame):
+        counts = df[col].value_counts().head(k)
+    else:
+        counts, _ = df.top_counts(col, k)
+    top = pd.DataFrame({"value": counts.index, "count": counts.to_numpy()})
+    return f"Top {len(top)} values of {col}:" + _exact_note(df, session), top
+
+
+# Before "columns", so "which columns have outliers?" asks for outliers
+@ROUTER.intent("outliers", ["outlier", "outliers", "anomaly", "anomalies", "unusual"], extract=command_args)
+def show_outliers(df, intent, session):
+    table = _precomputed(session, "outliers")
+    if table is None:
+        table = outlier_table(df)
+    if not len(table):
+        return "No numeric columns to look for outliers in.", None
+    cols = intent.args["columns"]
+    if cols:
+        table = table.loc[[col for col in cols if col in table.index]]
+    table = table.sort_values("share", ascending=False)
+    flagged = int((table["outliers"] > 0).sum())
+    response = (f"{flagged} of {len(table)} numeric columns have values more than 1.5 IQRs outside their "
+                f"quartiles (Tukey's fences):")
+    return response, table.rename_axis("column").reset_index()
+
+
+# Before "columns", so "what's the correlation between columns?" asks for correlations
+@ROUTER.intent("correlation", ["correlation", "correlations", "correlate", "correlated", "corr"], extract=command_args)
+def correlation(df, intent, session):
+    corr = _precomputed(session, "correlation")
+    if corr is None:
+        stats = stats_for(df)
+        if not stats.numeric_columns():
+            return "No numeric columns available for correlation analysis.", None
+        corr = stats.corr()
+    elif corr.empty:
+        return "No numeric columns available for correlation analysis.", None
+    fig = px.imshow(corr,
+                    color_continuous_scale='RdBu_r',
+                    title='Correlation Matrix')
+    return "Generated correlation matrix for numeric columns.", fig
+
+
+@ROUTER.intent("columns", ["columns", "features", "variables"], extract=command_args)
+def show_columns(df, intent, session):
+    return f"Your dataset contains the following columns:\n\n{', '.join(df.columns)}", None
+
+
+@ROUTER.intent("missing", ["missing", "null", "nulls", "na", "nan", "empty"], extract=command_args)
+def show_missing(df, intent, session):
+    response = "Missing values in each column:\n\n"
+    missing = _precomputed(session, "missing")
+    if missing is None:
+        missing = stats_for(df).null_counts()
+    response += missing.to_string()
+    return response, None
+
+
+@ROUTER.intent("scatter", ["scatter"], extract=command_args)
+def scatter_plot(df, intent, session):
+    cols = intent.args["columns"]
+    if len(cols) >= 2:
+        fig, note = charts.scatter(df, cols[0], cols[1])
+        return with_note(f"Created scatter plot of {cols[0]} vs {cols[1]}", note), fig
+    return "Please specify which columns to use for the scatter plot.", None
+
+
+@ROUTER.intent("histogram", ["histogram", "distribution"], extract=command_args)
+def histogram(df, intent, session):
+    cols = intent.args["columns"]
+    if cols:
+        precomputed = _precomputed(session, f"histogram:{cols[0]}")
+        fig, note = precomputed if precomputed is not None else charts.histogram(df, cols[0], nbins=20)
+        return with_note(f"Created histogram for {cols[0]}", note), fig
+    return "Please specify which column to use for the histogram.", None
+
+
+@ROUTER.intent("bar", ["bar"], extract=command_args)
+def bar_chart(df, intent, session):
+    cols = intent.args["columns"]
+    if len(cols) >= 2:
+        fig, note = charts.bar(df, cols[0], cols[1])
+        return with_note(f"Created bar chart of {cols[1]} by {cols[0]}", note), fig
+    return "Please specify which columns to use for the bar chart.", None
+
+
+@ROUTER.intent("aggregate", list(AGG_FUNCS), extract=command_args)
+def aggregate(df, intent, session):
+    func_name = intent.args["func_name"]
+    func = AGG_FUNCS[func_name]
+    cols = intent.args["columns"]
+    stats = stats_for(df)
+    numeric_cols = stats.numeric_columns()
+    if cols:
+        if all(col in numeric_cols for col in cols):
+            result = stats.agg(func, cols)
+        else:
+            result = getattr(df[cols], func)()
+        return f"{func_name.capitalize()} of {', '.join(cols)}:\n\n{result.to_string()}", None
+    result = stats.agg(func)
+    return f"{func_name.capitalize()} of numeric columns:\n\n{result.to_string()}", None
+
+
+@ROUTER.intent("reset_filter", ["clear filter", "clear filters", "reset filter", "reset filters", "remove filter", "unfilter"],
+               extract=command_args, priority=-2)
+def reset_filter(df, intent, session):
+    session["filter"] = None
+    return f"Filter cleared. Using all {len(df):,} rows again.", None
+
+
+@ROUTER.intent("filter", ["where"], extract=command_args)
+def filter_rows(df, intent, session):
+    try:
+        node = parse_filter(intent.command, df.columns)
+    except FilterError as e:
+        return str(e), None
+    # A new condition narrows the rows already selected
+    if session.get("filter") is not None:
+        node = BoolOp("and", (session["filter"], node))
+    view = filtered(df, node)
+    session["filter"] = node
+    response = (f"Filtered to {len(view):,} of {len(df):,} rows where {format_expr(node)}. "
+                f"Other commands now use these rows until you clear the filter.")
+    return response, view.head(10)
+
+
+# Explicit filter requests win over keywords that appear inside the condition
+ROUTER.register("filter", ["filter", "query"], filter_rows, command_args, priority=-1)
+
+
+@ROUTER.intent("sample", ["sample", "show", "display", "head", "preview"], extract=command_args)
+def show_sample(df, intent, session):
+    count = 5  # Default
+    if intent.args["count"] is not None:
+        count = min(intent.args["count"], 20)  # Limit to 20 rows
+    response = f"Here's a sample of {count} rows from your data:\n\n"
+    return response, df.head(count)
+
+
+def analyze_command(command, df, session=None):
+    """Process natural language commands for data analysis.
+
+    ``df`` is a pandas DataFrame or an out-of-core frame from
+    ``backends.open_dataset``. ``session`` is a mutable mapping such as
+    ``st.session_state`` that keeps the active filter between commands.
+    """
+    if session is None:
+        session = {}
+    # No row count here: on an out-of-core frame it would be a scan
+    with tracing.span("analyze_command", backend=type(df).__name__, columns=len(df.columns)) as span:
+        intent = ROUTER.route(command, columns=df.columns)
+        if intent is None:
+            span.set("intent", "unknown")
+            return UNKNOWN_COMMAND, None
+        span.set("intent", intent.name)
+        if session.get("filter") is not None and intent.name not in ("filter", "reset_filter"):
+            with tracing.span("filter.view"):
+                df = filtered(df, session["filter"])
+        with tracing.span(f"intent.{intent.name}"):
+            return intent.handler(df, intent, session)
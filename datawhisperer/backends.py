@@ -0,0 +1,500 @@
+import hashlib
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from datawhisperer.filters import FALSE_WORDS, TRUE_WORDS, BoolOp, Compare, FilterError, Not
+from datawhisperer.store import DEFAULT_ROOT
+
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+# Files up to this size are read into pandas; larger ones are queried in place
+LAZY_THRESHOLD_BYTES = int(os.environ.get("DATAWHISPERER_LAZY_THRESHOLD_BYTES", 512 * 1024 ** 2))
+# Memory DuckDB may use before spilling to its temp directory
+DUCKDB_MEMORY_LIMIT = os.environ.get("DATAWHISPERER_DUCKDB_MEMORY_LIMIT", "2GB")
+# Parquet copies of large CSVs, reused while the CSV is unchanged
+PARQUET_DIR = os.path.join(DEFAULT_ROOT, "parquet")
+
+_INTEGER_TYPES = {"TINYINT", "SMALLINT", "INTEGER", "BIGINT", "HUGEINT",
+                  "UTINYINT", "USMALLINT", "UINTEGER", "UBIGINT", "UHUGEINT"}
+_FLOAT_TYPES = {"FLOAT", "DOUBLE", "REAL"}
+_DATE_TYPES = {"DATE", "TIMESTAMP", "TIMESTAMP_NS", "TIMESTAMP_MS", "TIMESTAMP_S", "TIMESTAMP WITH TIME ZONE"}
+
+_SQL_FUNCS = {"mean": "avg", "sum": "sum", "max": "max", "min": "min", "count": "count"}
+
+
+def quote(name):
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def literal(value):
+    if isinstance(value, bool):
+        return "TRUE" if value else "FALSE"
+    if isinstance(value, (int, np.integer)):
+        # Integers keep every digit; a float literal would round ids above 2**53
+        return str(int(value))
+    if isinstance(value, (float, np.floating)):
+        return repr(float(value))
+    if isinstance(value, pd.Timestamp):
+        return f"TIMESTAMP '{value.isoformat(sep=' ')}'"
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def _pandas_dtype(sql_type):
+    base = sql_type.split("(")[0]
+    if base in _INTEGER_TYPES:
+        return np.dtype(np.int64)
+    if base in _FLOAT_TYPES or base == "DECIMAL":
+        return np.dtype(np.float64)
+    if base == "BOOLEAN":
+        return np.dtype(bool)
+    if base in _DATE_TYPES:
+        return np.dtype("datetime64[ns]")
+    return np.dtype(object)
+
+
+def _coerce(column, kind, value):
+    """SQL literal for ``value`` compared with a column of pandas dtype kind ``kind``"""
+    if kind == "b":
+        text = str(value).lower()
+        if text in TRUE_WORDS:
+            return "TRUE"
+        if text in FALSE_WORDS:
+            return "FALSE"
+        raise FilterError(f"'{value}' is not a true/false value for {column}")
+    if kind in "iu":
+        try:
+            return literal(int(str(value).strip()))
+        except ValueError:
+            pass
+    if kind in "iuf":
+        try:
+            return literal(float(value))
+        except ValueError:
+            raise FilterError(f"{column} is numeric, so '{value}' can't be compared with it") from None
+    if kind == "M":
+        try:
+            return literal(pd.Timestamp(str(value)))
+        except ValueError:
+            raise FilterError(f"'{value}' is not a date") from None
+    return literal(value)
+
+
+def _compare_sql(node, dtypes):
+    if node.column not in dtypes.index:
+        raise FilterError(f"Unknown column {node.column}")
+    column, op, value = quote(node.column), node.op, node.value
+    kind = dtypes[node.column].kind
+    text = kind not in "iufbM"
+    if op == "isnull":
+        return f"{column} IS NULL"
+    if op == "notnull":
+        return f"{column} IS NOT NULL"
+    if op == "contains":
+        return f"contains(lower(CAST({column} AS VARCHAR)), lower({literal(str(value))}))"
+    if op == "between":
+        low, high = (_coerce(node.column, kind, v) for v in value)
+        return f"{column} BETWEEN {low} AND {high}"
+    if text and op in ("==", "!=", "in", "not in"):
+        # Text matches ignore case, like the pandas engine's fallback
+        values = value if op in ("in", "not in") else [value]
+        items = ", ".join(literal(str(v).lower()) for v in values)
+        negate = "NOT " if op in ("!=", "not in") else ""
+        return f"lower(CAST({column} AS VARCHAR)) {negate}IN ({items})"
+    if op in ("in", "not in"):
+        items = ", ".join(_coerce(node.column, kind, v) for v in value)
+        return f"{column} {'NOT IN' if op == 'not in' else 'IN'} ({items})"
+    sql_op = {"==": "=", "!=": "<>"}.get(op, op)
+    return f"{column} {sql_op} {_coerce(node.column, kind, value)}"
+
+
+def filter_sql(node, dtypes):
+    """SQL condition for a parsed filter expression; rows where it is unknown don't match"""
+    if isinstance(node, BoolOp):
+        joiner = " AND " if node.op == "and" else " OR "
+        return "(" + joiner.join(filter_sql(item, dtypes) for item in node.items) + ")"
+    if isinstance(node, Not):
+        return f"(NOT {filter_sql(node.item, dtypes)})"
+    if isinstance(node, Compare):
+        return f"coalesce({_compare_sql(node, dtypes)}, FALSE)"
+    raise FilterError(f"Unsupported filter expression {node!r}")
+
+
+def _bin_edges(lo, hi, nbins):
+    # Same edges np.histogram picks for data spanning [lo, hi]
+    return np.histogram_bin_edges(np.array([lo, hi], dtype=np.float64), bins=nbins)
+
+
+class _Source:
+    """A file opened in DuckDB, shared by every frame derived from it"""
+
+    def __init__(self, path, sql):
+        self.path = path
+        self.sql = sql
+        self.con = duckdb.connect()
+        self.con.execute(f"SET memory_limit = {literal(DUCKDB_MEMORY_LIMIT)}")
+        self.lock = threading.Lock()
+        schema = self.query(f"DESCRIBE SELECT * FROM {sql}")
+        self.columns = pd.Index([row[0] for row in schema])
+        self.dtypes = pd.Series([_pandas_dtype(row[1]) for row in schema], index=self.columns, dtype=object)
+
+    def query(self, sql):
+        with self.lock:
+            return self.con.execute(sql).fetchall()
+
+    def query_df(self, sql):
+        with self.lock:
+            return self.con.execute(sql).df()
+
+
+class DuckDBFrame:
+    """A lazily evaluated dataset queried with DuckDB instead of loaded into pandas.
+
+    Supports the subset of the DataFrame interface the analysis intents use
+    (``columns``, ``dtypes``, ``len()``, ``shape``, ``head()``, column
+    selection and the basic reductions). Statistics, histogram binning,
+    group totals and filters are pushed down to DuckDB as single columnar
+    scans that read only the columns involved, so the data never has to fit
+    in memory. Filtering returns a new frame with the condition added.
+    """
+
+    def __init__(self, source, where=(), columns=None):
+        self._source = source
+        self._where = tuple(where)
+        self.columns = source.columns if columns is None else pd.Index(columns)
+        self.dtypes = source.dtypes[self.columns]
+        self._rows = None
+        self._stats = None
+
+    @property
+    def path(self):
+        return self._source.path
+
+    @property
+    def relation(self):
+        """FROM clause selecting this frame's rows"""
+        if not self._where:
+            return self._source.sql
+        return f"(SELECT * FROM {self._source.sql} WHERE {' AND '.join(self._where)})"
+
+    def _select(self, expressions, where=None, tail=""):
+        sql = f"SELECT {expressions} FROM {self.relation}"
+        if where:
+            sql += f" WHERE {where}"
+        return sql + tail
+
+    def __len__(self):
+        if self._rows is None:
+            self._rows = self._source.query(self._select("count(*)"))[0][0]
+        return self._rows
+
+    @property
+    def shape(self):
+        return len(self), len(self.columns)
+
+    def __getitem__(self, key):
+        columns = [key] if isinstance(key, str) else list(key)
+        missing = [c for c in columns if c not in self._source.columns]
+        if missing:
+            raise KeyError(missing)
+        return DuckDBFrame(self._source, self._where, columns)
+
+    def _projection(self):
+        return ", ".join(quote(c) for c in self.columns)
+
+    def head(self, n=5):
+        return self._source.query_df(self._select(self._projection(), tail=f" LIMIT {int(n)}"))
+
+    def sample(self, n, seed=0, dropna=False):
+        """Uniform random sample of up to ``n`` rows, optionally only rows without nulls"""
+        where = " AND ".join(f"{quote(c)} IS NOT NULL" for c in self.columns) if dropna else None
+        relation = f"({self._select(self._projection(), where)})"
+        return self._source.query_df(
+            f"SELECT * FROM {relation} USING SAMPLE reservoir({int(n)} ROWS) REPEATABLE ({int(seed)})")
+
+    def to_pandas(self):
+        return self._source.query_df(self._select(self._projection()))
+
+    def record_batches(self, rows=100_000):
+        """Stream the frame as pyarrow RecordBatches of up to ``rows`` rows"""
+        # A cursor of its own, so other queries can run while the stream is read
+        with self._source.lock:
+            cursor = self._source.con.cursor()
+        try:
+            yield from cursor.execute(self._select(self._projection())).fetch_record_batch(rows)
+        finally:
+            cursor.close()
+
+    def filter(self, node):
+        """Frame of the rows matching a parsed filter expression"""
+        return DuckDBFrame(self._source, self._where + (filter_sql(node, self._source.dtypes),), self.columns)
+
+    def stats(self):
+        if self._stats is None:
+            self._stats = DuckDBStats(self)
+        return self._stats
+
+    def _reduce(self, func):
+        sql_func = _SQL_FUNCS[func]
+        if func in ("mean", "sum"):
+            non_numeric = [c for c in self.columns if self.dtypes[c].kind not in "iufb"]
+            if non_numeric:
+                raise TypeError(f"Can't compute the {func} of non-numeric columns {', '.join(non_numeric)}")
+        expressions = [f"{sql_func}(CAST({quote(c)} AS INTEGER))" if self.dtypes[c].kind == "b" and func in ("mean", "sum")
+                       else f"{sql_func}({quote(c)})" for c in self.columns]
+        row = self._source.query(self._select(", ".join(expressions)))[0]
+        return pd.Series(row, index=self.columns)
+
+    def mean(self):
+        return self._reduce("mean")
+
+    def sum(self):
+        return self._reduce("sum")
+
+    def max(self):
+        return self._reduce("max")
+
+    def min(self):
+        return self._reduce("min")
+
+    def count(self):
+        return self._reduce("count")
+
+    def nunique(self):
+        row = self._source.query(self._select(", ".join(f"count(DISTINCT {quote(c)})" for c in self.columns)))[0]
+        return pd.Series(row, index=self.columns)
+
+    def quantile(self, qs):
+        """Exact quantiles of every column, interpolated like pandas"""
+        qs = list(qs)
+        items = ", ".join(repr(float(q)) for q in qs)
+        row = self._source.query(self._select(", ".join(
+            f"quantile_cont({quote(c)}, [{items}])" for c in self.columns)))[0]
+        return pd.DataFrame({c: values for c, values in zip(self.columns, row)}, index=qs)
+
+    def describe(self):
+        """Count and distinct values of every column, for data without numeric columns"""
+        cols = [quote(c) for c in self.columns]
+        row = self._source.query(self._select(", ".join(
+            [f"count({c})" for c in cols] + [f"count(DISTINCT {c})" for c in cols])))[0]
+        k = len(cols)
+        return pd.DataFrame([row[:k], row[k:]], index=["count", "unique"], columns=self.columns)
+
+    def _numeric_expr(self, column):
+        if self.dtypes[column].kind == "M":
+            return f"epoch_ns(CAST({quote(column)} AS TIMESTAMP))"
+        return f"CAST({quote(column)} AS DOUBLE)"
+
+    def _bucket(self, expr, edges):
+        lo, width = float(edges[0]), float(edges[1] - edges[0])
+        nbins = len(edges) - 1
+        return f"least(greatest(CAST(floor(({expr} - {lo!r}) / {width!r}) AS BIGINT), 0), {nbins - 1})"
+
+    def _range(self, column):
+        expr = self._numeric_expr(column)
+        return self._source.query(self._select(f"min({expr}), max({expr})"))[0]
+
+    def bin_counts(self, column, nbins):
+        """(counts, edges, is_date) of a numeric or date column, or None for other columns"""
+        kind = self.dtypes[column].kind
+        if kind not in "iufM":
+            return None
+        lo, hi = self._range(column)
+        if lo is None:
+            return np.zeros(nbins, dtype=np.int64), _bin_edges(0, 1, nbins), kind == "M"
+        edges = _bin_edges(lo, hi, nbins)
+        expr = self._numeric_expr(column)
+        rows = self._source.query(self._select(
+            f"{self._bucket(expr, edges)} AS b, count(*)", f"{quote(column)} IS NOT NULL", " GROUP BY b"))
+        counts = np.zeros(nbins, dtype=np.int64)
+        for b, n in rows:
+            counts[b] = n
+        return counts, edges, kind == "M"
+
+    def bin_counts_2d(self, x, y, nbins):
+        """(counts[x_bin, y_bin], x_edges, y_edges) of two numeric columns, like np.histogram2d"""
+        x_edges = _bin_edges(*self._range(x), nbins)
+        y_edges = _bin_edges(*self._range(y), nbins)
+        rows = self._source.query(self._select(
+            f"{self._bucket(self._numeric_expr(x), x_edges)} AS bx, "
+            f"{self._bucket(self._numeric_expr(y), y_edges)} AS by, count(*)",
+            f"{quote(x)} IS NOT NULL AND {quote(y)} IS NOT NULL", " GROUP BY bx, by"))
+        counts = np.zeros((nbins, nbins))
+        for bx, by, n in rows:
+            counts[bx, by] = n
+        return counts, x_edges, y_edges
+
+    def top_counts(self, column, limit):
+        """(the ``limit`` most frequent values with their counts, number of distinct values)"""
+        col = quote(column)
+        rows = self._source.query(self._select(
+            f"{col} AS v, count(*) AS n", f"{col} IS NOT NULL", f" GROUP BY v ORDER BY n DESC LIMIT {int(limit)}"))
+        distinct = self._source.query(self._select(f"count(DISTINCT {col})"))[0][0]
+        return pd.Series([n for _, n in rows], index=[v for v, _ in rows], name="count"), distinct
+
+    def group_totals(self, x, y, limit):
+        """(largest ``limit`` per-``x`` totals of ``y``, whether they are sums, number of groups)"""
+        numeric = self.dtypes[y].kind in "iuf"
+        total = f"sum({quote(y)})" if numeric else f"count({quote(y)})"
+        col = quote(x)
+        rows = self._source.query(self._select(
+            f"{col} AS k, {total} AS t", f"{col} IS NOT NULL", f" GROUP BY k ORDER BY t DESC LIMIT {int(limit)}"))
+        groups = self._source.query(self._select(f"count(DISTINCT {col})"))[0][0]
+        totals = pd.Series([t for _, t in rows], index=[k for k, _ in rows], name=y)
+        totals.index.name = x
+        return totals, numeric, groups
+
+    def count_outside(self, low, high):
+        """Per column of ``low``/``high`` (Series by column), rows below low or above high, in one scan"""
+        expressions = []
+        for c in low.index:
+            if np.isnan(low[c]) or np.isnan(high[c]):
+                expressions.append("0")
+            else:
+                value = f"CAST({quote(c)} AS DOUBLE)"
+                expressions.append(f"count(*) FILTER (WHERE {value} < {literal(low[c])} OR {value} > {literal(high[c])})")
+        row = self._source.query(self._select(", ".join(expressions)))[0] if expressions else []
+        return pd.Series(row, index=low.index, dtype=np.int64)
+
+    def count_present(self, columns):
+        """Number of rows where none of ``columns`` is null"""
+        condition = " AND ".join(f"{quote(c)} IS NOT NULL" for c in columns)
+        return self._source.query(self._select("count(*)", condition))[0][0]
+
+    def __repr__(self):
+        return f"DuckDBFrame({self.path!r}, columns={len(self.columns)}, filters={len(self._where)})"
+
+
+class DuckDBStats:
+    """StatsEngine counterpart for a DuckDBFrame, computed with aggregate queries.
+
+    Every statistic is one scan over the columns involved and is memoized
+    on the frame. Quartiles use DuckDB's approximate (t-digest) quantiles,
+    which keep memory constant however large the file is.
+    """
+
+    def __init__(self, frame):
+        self.frame = frame
+        self._memo = {}
+
+    def _memoized(self, key, compute):
+        if key not in self._memo:
+            self._memo[key] = compute()
+        return self._memo[key]
+
+    def _query(self, expressions):
+        return self.frame._source.query(self.frame._select(", ".join(expressions)))[0]
+
+    def numeric_columns(self):
+        return [c for c in self.frame.columns if self.frame.dtypes[c].kind in "iuf"]
+
+    def null_counts(self):
+        def compute():
+            cols = self.frame.columns
+            row = self._query(f"count(*) - count({quote(c)})" for c in cols)
+            return pd.Series(row, index=cols, dtype=np.int64)
+        return self._memoized("nulls", compute)
+
+    def describe(self):
+        """Same layout as DataFrame.describe() for the numeric columns"""
+        def compute():
+            cols = self.numeric_columns()
+            expressions = []
+            for c in cols:
+                q = f"CAST({quote(c)} AS DOUBLE)"
+                expressions += [f"count({q})", f"avg({q})", f"stddev_samp({q})", f"min({q})",
+                                f"approx_quantile({q}, [0.25, 0.5, 0.75])", f"max({q})"]
+            row = self._query(expressions) if cols else []
+            data = []
+            for i in range(len(cols)):
+                count, mean, std, lo, quartiles, hi = row[i * 6:i * 6 + 6]
+                data.append([count, mean, std, lo, *(quartiles or [None] * 3), hi])
+            return pd.DataFrame(np.array(data, dtype=np.float64).T.reshape(8, len(cols)),
+                                index=["count", "mean", "std", "min", "25%", "50%", "75%", "max"], columns=cols)
+        return self._memoized("describe", compute)
+
+    def corr(self):
+        def compute():
+            cols = self.numeric_columns()
+            pairs = [(i, j) for i in range(len(cols)) for j in range(i + 1, len(cols))]
+            row = self._query(f"corr(CAST({quote(cols[i])} AS DOUBLE), CAST({quote(cols[j])} AS DOUBLE))"
+                              for i, j in pairs) if pairs else []
+            matrix = np.eye(len(cols))
+            for (i, j), value in zip(pairs, row):
+                matrix[i, j] = matrix[j, i] = np.nan if value is None else value
+            return pd.DataFrame(matrix, index=cols, columns=cols)
+        return self._memoized("corr", compute)
+
+    def agg(self, func, cols=None):
+        """Mean, sum, max, min or count of numeric columns"""
+        cols = self.numeric_columns() if cols is None else list(cols)
+        return self._memoized(("agg", func, tuple(cols)), lambda: self.frame[cols]._reduce(func))
+
+
+def _file_sql(path):
+    lower = path.lower()
+    if lower.endswith((".parquet", ".pq")):
+        return f"read_parquet({literal(path)})"
+    return f"read_csv({literal(path)})"
+
+
+def parquet_copy(path, cache_dir=PARQUET_DIR):
+    """Path of a zstd Parquet copy of the CSV at ``path``, converted by DuckDB once per file version.
+
+    The conversion streams through DuckDB, so it works on files larger than
+    memory, and later scans read only the columns a query needs.
+    """
+    stat = os.stat(path)
+    key = hashlib.sha256(f"{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}".encode()).hexdigest()
+    target = os.path.join(cache_dir, f"{key}.parquet")
+    if not os.path.exists(target):
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_path = f"{target}.{os.getpid()}.tmp"
+        con = duckdb.connect()
+        try:
+            con.execute(f"SET memory_limit = {literal(DUCKDB_MEMORY_LIMIT)}")
+            con.execute(f"COPY (SELECT * FROM {_file_sql(path)}) TO {literal(tmp_path)} "
+                        f"(FORMAT parquet, COMPRESSION zstd)")
+            os.replace(tmp_path, target)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        finally:
+            con.close()
+    return target
+
+
+def open_lazy(path, convert=True):
+    """A DuckDBFrame over a CSV or Parquet file; CSVs are converted to Parquet first if ``convert``"""
+    if duckdb is None:
+        raise ImportError("The out-of-core backend needs duckdb (pip install duckdb)")
+    source_path = parquet_copy(path) if convert and not path.lower().endswith((".parquet", ".pq")) else path
+    return DuckDBFrame(_Source(path, _file_sql(source_path)))
+
+
+def open_dataset(path, backend="auto", lazy_threshold=LAZY_THRESHOLD_BYTES, memory_budget=None):
+    """Open a file with the backend suited to its size.
+
+    ``backend="auto"`` reads files up to ``lazy_threshold`` bytes into a
+    pandas DataFrame and opens larger ones as a DuckDBFrame (falling back to
+    a sampled pandas read when duckdb is not installed). ``"pandas"`` and
+    ``"duckdb"`` force one or the other.
+    """
+    if backend == "auto":
+        large = os.path.getsize(path) > lazy_threshold
+        backend = "duckdb" if large and duckdb is not None else "pandas"
+    if backend == "duckdb":
+        return open_lazy(path)
+    if backend != "pandas":
+        raise ValueError(f"Unknown backend {backend!r}")
+    if path.lower().endswith((".parquet", ".pq")):
+        return pd.read_parquet(path)
+    from datawhisperer import ingest
+
+    return ingest.read_csv(path, memory_budget=memory_budget)
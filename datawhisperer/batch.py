@@ -0,0 +1,213 @@
+"""Run analysis commands over many CSV files without the UI.
+
+Each file is loaded with the same ingest path as the apps and the commands
+are run against it in order, as one chat session, so a filter command
+applies to the commands after it. Files are processed in parallel on a
+process pool. Text answers, tables and figures are written to one
+directory per file, with a summary.json for the whole run:
+
+    python -m datawhisperer.batch 'extracts/*.csv' -c summary -c "missing values" --out results/
+    python -m datawhisperer.batch extracts/ --commands-file questions.txt --out results/ --jobs 8
+"""
+import argparse
+import glob
+import json
+import multiprocessing
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+FIGURE_FORMATS = ("html", "json", "png")
+# Files picked up when a directory is given
+DATA_EXTENSIONS = (".csv", ".parquet")
+
+
+def expand_inputs(patterns):
+    """Sorted, de-duplicated data file paths for files, directories and glob patterns"""
+    paths = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            for extension in DATA_EXTENSIONS:
+                paths.update(glob.glob(os.path.join(pattern, f"*{extension}")))
+        elif glob.has_magic(pattern):
+            paths.update(p for p in glob.glob(pattern, recursive=True) if os.path.isfile(p))
+        elif os.path.isfile(pattern):
+            paths.add(pattern)
+        else:
+            raise FileNotFoundError(f"No such file or directory: {pattern}")
+    return sorted(os.path.abspath(p) for p in paths)
+
+
+def read_commands(path):
+    """Commands from a file, one per line; blank lines and # comments are skipped"""
+    with open(path, encoding="utf-8") as fh:
+        lines = (line.strip() for line in fh)
+        return [line for line in lines if line and not line.startswith("#")]
+
+
+def slug(text, max_length=40):
+    return re.sub(r"[^a-z0-9]+", "-", text.lower()).strip("-")[:max_length] or "command"
+
+
+def output_dirs(paths, out_dir):
+    """One output directory per input, named after the file and unique within the run"""
+    dirs, seen = {}, {}
+    for path in paths:
+        stem = os.path.splitext(os.path.basename(path))[0]
+        seen[stem] = seen.get(stem, 0) + 1
+        name = stem if seen[stem] == 1 else f"{stem}-{seen[stem]}"
+        dirs[path] = os.path.join(out_dir, name)
+    return dirs
+
+
+def write_result(result, base, figure_format="html"):
+    """Write a table or figure next to ``base`` and return the file name, or None"""
+    import pandas as pd
+
+    if isinstance(result, pd.DataFrame):
+        path = f"{base}.csv"
+        result.to_csv(path, index=not isinstance(result.index, pd.RangeIndex))
+    elif hasattr(result, "to_plotly_json"):
+        if figure_format == "png":
+            from datawhisperer.history import figure_png
+
+            png = figure_png(result)
+            if png is None:
+                return write_result(result, base, "html")
+            path = f"{base}.png"
+            with open(path, "wb") as fh:
+                fh.write(png)
+        elif figure_format == "json":
+            path = f"{base}.json"
+            with open(path, "w", encoding="utf-8") as fh:
+                fh.write(result.to_json(validate=False))
+        else:
+            path = f"{base}.html"
+            result.write_html(path, include_plotlyjs="cdn", full_html=True)
+    elif hasattr(result, "savefig"):
+        path = f"{base}.png"
+        result.savefig(path, bbox_inches="tight")
+    else:
+        return None
+    return os.path.basename(path)
+
+
+def run_file(path, commands, out_dir, memory_budget=None, figure_format="html", backend="auto"):
+    """Load ``path``, run every command against it and write the outputs to ``out_dir``"""
+    from datawhisperer.backends import open_dataset
+    from datawhisperer.analysis import ROUTER, UNKNOWN_COMMAND, analyze_command
+
+    start = time.perf_counter()
+    report = {"file": path, "out_dir": out_dir, "commands": []}
+    try:
+        df = open_dataset(path, backend, memory_budget=memory_budget)
+    except Exception as e:
+        report.update(error=f"{type(e).__name__}: {e}", seconds=time.perf_counter() - start)
+        return report
+    info = df.attrs.get("ingest", {}) if hasattr(df, "attrs") else {}
+    report.update(rows=len(df), columns=len(df.columns), sampled=info.get("sampled", False),
+                  backend=type(df).__name__)
+    os.makedirs(out_dir, exist_ok=True)
+
+    session = {}
+    for i, command in enumerate(commands, 1):
+        entry = {"command": command}
+        command_start = time.perf_counter()
+        base = os.path.join(out_dir, f"{i:02d}-{slug(command)}")
+        try:
+            intent = ROUTER.route(command, columns=df.columns)
+            entry["intent"] = intent.name if intent is not None else None
+            response, result = analyze_command(command, df, session)
+            with open(f"{base}.txt", "w", encoding="utf-8") as fh:
+                fh.write(response + "\n")
+            entry["outputs"] = [os.path.basename(f"{base}.txt")]
+            written = write_result(result, base, figure_format) if result is not None else None
+            if written:
+                entry["outputs"].append(written)
+            if response == UNKNOWN_COMMAND:
+                entry["error"] = "unknown command"
+        except Exception as e:
+            entry["error"] = f"{type(e).__name__}: {e}"
+        entry["seconds"] = time.perf_counter() - command_start
+        report["commands"].append(entry)
+    report["seconds"] = time.perf_counter() - start
+    with open(os.path.join(out_dir, "results.json"), "w", encoding="utf-8") as fh:
+        json.dump(report, fh, indent=2)
+    return report
+
+
+def run(paths, commands, out_dir, jobs=None, memory_budget=None, figure_format="html", backend="auto", log=print):
+    """Run ``commands`` over every file in ``paths`` on a process pool; returns the run summary"""
+    start = time.perf_counter()
+    os.makedirs(out_dir, exist_ok=True)
+    dirs = output_dirs(paths, out_dir)
+    jobs = max(1, min(jobs or os.cpu_count() or 1, len(paths) or 1))
+    reports = {}
+    # Workers are spawned rather than forked so they don't inherit the caller's threads
+    with ProcessPoolExecutor(max_workers=jobs, mp_context=multiprocessing.get_context("spawn")) as pool:
+        futures = {pool.submit(run_file, path, commands, dirs[path], memory_budget, figure_format, backend): path
+                   for path in paths}
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                report = future.result()
+            except Exception as e:
+                # The worker died, e.g. killed for running out of memory
+                report = {"file": path, "out_dir": dirs[path], "commands": [], "error": f"{type(e).__name__}: {e}"}
+            reports[path] = report
+            failed = sum(1 for entry in report["commands"] if "error" in entry)
+            status = report.get("error") or f"{len(report['commands']) - failed}/{len(commands)} commands ok"
+            log(f"{os.path.basename(path)}: {status} ({report.get('seconds', 0):.1f}s)")
+
+    summary = {
+        "commands": commands,
+        "jobs": jobs,
+        "seconds": time.perf_counter() - start,
+        "files": [reports[path] for path in paths],
+    }
+    with open(os.path.join(out_dir, "summary.json"), "w", encoding="utf-8") as fh:
+        json.dump(summary, fh, indent=2)
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("inputs", nargs="+", help="CSV or Parquet files, directories of them or glob patterns")
+    parser.add_argument("-c", "--command", dest="commands", action="append", default=[],
+                        help="analysis command to run; repeat for several")
+    parser.add_argument("--commands-file", help="file with one command per line")
+    parser.add_argument("-o", "--out", required=True, help="output directory")
+    parser.add_argument("-j", "--jobs", type=int, help="worker processes (default: CPU count)")
+    parser.add_argument("--memory-budget-mb", type=int, help="ingest memory budget per file (default: ingest's)")
+    parser.add_argument("--figure-format", choices=FIGURE_FORMATS, default="html")
+    parser.add_argument("--backend", choices=("auto", "pandas", "duckdb"), default="auto",
+                        help="auto queries files over the lazy threshold in place with DuckDB")
+    args = parser.parse_args(argv)
+
+    commands = list(args.commands)
+    if args.commands_file:
+        commands.extend(read_commands(args.commands_file))
+    if not commands:
+        parser.error("no commands given; use --command or --commands-file")
+    try:
+        paths = expand_inputs(args.inputs)
+    except FileNotFoundError as e:
+        parser.error(str(e))
+    if not paths:
+        parser.error("no CSV files matched")
+    memory_budget = args.memory_budget_mb * 1024 ** 2 if args.memory_budget_mb else None
+
+    log = lambda message: print(message, file=sys.stderr)
+    summary = run(paths, commands, args.out, args.jobs, memory_budget, args.figure_format, args.backend, log=log)
+    files = summary["files"]
+    failed_files = sum(1 for report in files if "error" in report)
+    failed_commands = sum(1 for report in files for entry in report["commands"] if "error" in entry)
+    print(f"{len(files)} files, {failed_files} failed to load, {failed_commands} failed commands "
+          f"in {summary['seconds']:.1f}s; results in {args.out}")
+    return 1 if failed_files or failed_commands else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,359 @@
+"""Headless benchmark suite for the analysis path.
+
+Generates synthetic CSVs, then times CSV parsing, column extraction, every
+analyze_command intent, figure serialization and the chat prompt path (with
+a stub LLM) for each of them in a fresh subprocess, recording its peak RSS.
+Results are written as JSON and can be checked against an earlier run:
+
+    python -m datawhisperer.bench --preset quick --out bench.json
+    python -m datawhisperer.bench --preset quick --baseline bench.json --threshold 0.2
+    python -m datawhisperer.bench --sizes 1000000x50,100000x2000 --out big.json
+
+No network access or API key is needed.
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+DEFAULT_DATA_DIR = os.path.join(tempfile.gettempdir(), "datawhisperer-bench")
+GENERATE_BLOCK_ROWS = 500_000
+
+# (rows, columns) per preset
+PRESETS = {
+    "quick": [(10_000, 5), (100_000, 20), (10_000, 500)],
+    "standard": [(10_000, 5), (1_000_000, 5), (1_000_000, 50), (100_000, 2_000)],
+    "full": [(10_000, 5), (1_000_000, 5), (1_000_000, 50), (100_000, 2_000),
+             (10_000_000, 5), (10_000_000, 50), (50_000_000, 5), (250_000, 2_000)],
+}
+
+# Column kinds, cycled through so every width has mixed dtypes
+COLUMN_KINDS = ("count", "value", "group", "date", "score", "flag")
+GROUPS = ["north", "south", "east", "west", "central", "coastal", "inland", "metro"]
+
+# Timings that grow by less than this are noise, whatever the ratio
+MIN_REGRESSION_SECONDS = 0.002
+
+
+def column_names(n_cols):
+    return [f"{COLUMN_KINDS[i % len(COLUMN_KINDS)]}_{i}" for i in range(n_cols)]
+
+
+def make_csv(path, rows, cols, seed=0):
+    """Write a synthetic CSV of ``rows`` x ``cols`` with mixed dtypes and some nulls"""
+    import numpy as np
+    import pandas as pd
+
+    rng = np.random.default_rng(seed)
+    names = column_names(cols)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", newline="") as fh:
+        for start in range(0, rows, GENERATE_BLOCK_ROWS):
+            n = min(GENERATE_BLOCK_ROWS, rows - start)
+            data = {}
+            for i, name in enumerate(names):
+                kind = COLUMN_KINDS[i % len(COLUMN_KINDS)]
+                if kind == "count":
+                    data[name] = rng.integers(0, 1_000, n)
+                elif kind == "value":
+                    data[name] = rng.normal(50_000, 15_000, n).round(2)
+                elif kind == "group":
+                    data[name] = rng.choice(GROUPS, n)
+                elif kind == "date":
+                    data[name] = (pd.Timestamp("2020-01-01")
+                                  + pd.to_timedelta(np.arange(start, start + n) % 1_500, unit="D"))
+                elif kind == "score":
+                    scores = rng.random(n).round(4)
+                    scores[rng.random(n) < 0.1] = np.nan
+                    data[name] = scores
+                else:
+                    data[name] = rng.random(n) < 0.5
+            pd.DataFrame(data).to_csv(fh, header=start == 0, index=False)
+    os.replace(tmp_path, path)
+    return path
+
+
+def dataset_path(data_dir, rows, cols, seed=0):
+    """Path of a cached synthetic CSV, generating it on first use"""
+    os.makedirs(data_dir, exist_ok=True)
+    path = os.path.join(data_dir, f"synthetic-{rows}x{cols}-s{seed}.csv")
+    if not os.path.exists(path):
+        make_csv(path, rows, cols, seed)
+    return path
+
+
+def intent_commands(columns):
+    """One representative command per intent for a synthetic dataset"""
+    def first(kind):
+        return next(c for c in columns if c.startswith(f"{kind}_"))
+
+    count = first("count")
+    value = first("value") if any(c.startswith("value_") for c in columns) else count
+    group = first("group") if any(c.startswith("group_") for c in columns) else count
+    return {
+        "summary": "show me a summary of the data",
+        "columns": "what columns are there",
+        "missing": "how many missing values are there",
+        "scatter": f"scatter plot of {count} and {value}",
+        "histogram": f"histogram of {value}",
+        "bar": f"bar chart of {group} and {value}",
+        "correlation": "correlation matrix",
+        "aggregate": f"average of {value}",
+        "filter": f"filter where {value} > 50000 and {count} < 500",
+        "reset_filter": "clear filter",
+        "sample": "show a sample of 10 rows",
+        "distinct": f"how many distinct values of {group}",
+        "percentile": f"90th percentile of {value}",
+        "top": f"most common values of {group}",
+        "outliers": "show the outliers",
+    }
+
+
+# The sidebar's example questions and the intents they must be routed to
+EXAMPLE_QUESTIONS = {
+    "Show me a summary of the data": "summary",
+    "Create a histogram of Age": "histogram",
+    "What's the correlation between columns?": "correlation",
+    "Show me a sample of 10 rows": "sample",
+    "How many unique Region values are there?": "distinct",
+    "What is the p99 of Income?": "percentile",
+    "Which columns have outliers?": "outliers",
+    "Filter where Income > 50000 and Region is West": "filter",
+}
+EXAMPLE_COLUMNS = ["Age", "Region", "Income"]
+
+
+def check_routing(examples=EXAMPLE_QUESTIONS, columns=EXAMPLE_COLUMNS):
+    """Raise RuntimeError when a question is routed to another intent than the one given"""
+    from datawhisperer.analysis import ROUTER
+
+    for question, name in examples.items():
+        routed = ROUTER.route(question, columns=columns)
+        if routed is None or routed.name != name:
+            raise RuntimeError(f"{question!r} is routed to {routed and routed.name}, not {name}")
+
+
+def _timed(fn, repeats):
+    """(result of the last call, cold seconds, warm timing summary)"""
+    seconds = []
+    result = None
+    for _ in range(max(repeats, 1)):
+        start = time.perf_counter()
+        result = fn()
+        seconds.append(time.perf_counter() - start)
+    warm = seconds[1:] or seconds
+    return result, seconds[0], {"median": statistics.median(warm), "min": min(warm), "runs": len(warm)}
+
+
+def run_dataset(path, repeats=3, memory_budget=None, seed=0):
+    """Time every stage for one CSV in this process; returns a result dict"""
+    import random
+
+    from datawhisperer import ingest
+    from datawhisperer.analysis import ROUTER, analyze_command, extract_columns
+    from datawhisperer.context import ChatContext
+    from datawhisperer.llm_gateway import LLMGateway
+    from datawhisperer.profile import get_profile, render_digest
+    from datawhisperer.stub_llm import StubLLM
+
+    timings = {}
+    rows_hint = os.path.getsize(path)
+    parse_repeats = repeats if rows_hint < 500 * 1024 ** 2 else 1
+    df, cold, warm = _timed(lambda: ingest.read_csv(path, memory_budget=memory_budget), parse_repeats)
+    timings["parse"] = dict(warm, cold=cold)
+
+    columns = list(df.columns)
+    rng = random.Random(seed)
+    commands = [f"scatter of {rng.choice(columns)} and {rng.choice(columns)}" for _ in range(200)]
+    _, cold, _ = _timed(lambda: extract_columns(commands[0], df.columns), 1)
+    start = time.perf_counter()
+    for command in commands:
+        extract_columns(command, df.columns)
+    timings["extract_columns"] = {"median": (time.perf_counter() - start) / len(commands),
+                                  "min": None, "runs": len(commands), "cold": cold}
+
+    figure_bytes = {}
+    for name, command in intent_commands(columns).items():
+        routed = ROUTER.route(command, columns=df.columns)
+        if routed is None or routed.name != name:
+            raise RuntimeError(f"{command!r} is routed to {routed and routed.name}, not {name}")
+        # A fresh session per call, so filters do not pile up across repeats
+        (response, result), cold, warm = _timed(lambda: analyze_command(command, df, {}), repeats)
+        timings[f"intent.{name}"] = dict(warm, cold=cold)
+        if hasattr(result, "to_plotly_json"):
+            text, cold, warm = _timed(lambda: result.to_json(), repeats)
+            timings[f"figure_json.{name}"] = dict(warm, cold=cold)
+            figure_bytes[name] = len(text)
+
+    llm = StubLLM(respond=lambda messages: "The average value is about fifty thousand. " * 20)
+    gateway = LLMGateway(llm, max_concurrency=2)
+    context = ChatContext(budget_tokens=8000)
+    question = f"What drives {columns[1]}?"
+
+    def chat_turn():
+        digest = render_digest("synthetic.csv", get_profile(path, df), question, 3000)
+        payload = context.build([{"role": "system", "content": digest}], [{"role": "user", "content": question}])
+        return "".join(gateway.stream(payload))
+
+    _, cold, warm = _timed(chat_turn, repeats)
+    timings["chat_turn"] = dict(warm, cold=cold)
+    gateway.close()
+
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak_rss = usage.ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+    return {
+        "rows": len(df),
+        "columns": len(columns),
+        "csv_bytes": os.path.getsize(path),
+        "ingest": {k: v for k, v in df.attrs.get("ingest", {}).items() if k != "dtype_plan"},
+        "figure_json_bytes": figure_bytes,
+        "peak_rss_bytes": peak_rss,
+        "timings": timings,
+    }
+
+
+def _run_worker(path, repeats, memory_budget):
+    """Run one dataset in a fresh interpreter so peak RSS is its own"""
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [root, os.environ.get("PYTHONPATH")])))
+    cmd = [sys.executable, "-m", "datawhisperer.bench", "--worker", path, "--repeat", str(repeats)]
+    if memory_budget is not None:
+        cmd += ["--memory-budget-mb", str(memory_budget // 1024 ** 2)]
+    proc = subprocess.run(cmd, capture_output=True, text=True, env=env)
+    if proc.returncode < 0:
+        # Killed by a signal, typically SIGKILL from the kernel's OOM killer
+        return {"error": f"benchmark worker killed by signal {-proc.returncode}"}
+    if proc.returncode != 0:
+        return {"error": (proc.stderr.strip().splitlines() or ["benchmark worker failed"])[-1]}
+    return json.loads(proc.stdout)
+
+
+def run(sizes, repeats=3, data_dir=DEFAULT_DATA_DIR, memory_budget=None, log=print):
+    """Benchmark every (rows, cols) in ``sizes`` and return the JSON-ready results"""
+    import numpy
+    import pandas
+
+    results = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "pandas": pandas.__version__,
+            "numpy": numpy.__version__,
+            "cpus": os.cpu_count(),
+            "repeats": repeats,
+        },
+        "datasets": {},
+    }
+    check_routing()
+    for rows, cols in sizes:
+        key = f"{rows}x{cols}"
+        start = time.perf_counter()
+        path = dataset_path(data_dir, rows, cols)
+        log(f"{key}: data ready in {time.perf_counter() - start:.1f}s, benchmarking...")
+        results["datasets"][key] = _run_worker(path, repeats, memory_budget)
+        if "error" in results["datasets"][key]:
+            log(f"{key}: failed: {results['datasets'][key]['error']}")
+    return results
+
+
+def flatten(results):
+    """{"<dataset>/<metric>": value} for the warm medians and peak RSS of a run"""
+    flat = {}
+    for key, dataset in results["datasets"].items():
+        for metric, timing in dataset.get("timings", {}).items():
+            flat[f"{key}/{metric}"] = timing["median"]
+        if "peak_rss_bytes" in dataset:
+            flat[f"{key}/peak_rss_bytes"] = dataset["peak_rss_bytes"]
+    return flat
+
+
+def compare(baseline, current, threshold=0.2, min_seconds=MIN_REGRESSION_SECONDS):
+    """Metrics that got worse by more than ``threshold`` (a fraction) since ``baseline``.
+
+    Returns (metric, baseline value, current value) tuples. A metric of the
+    baseline that the current run lacks, such as one of a dataset whose
+    worker failed, is a regression with a current value of None; metrics
+    new in the current run are ignored.
+    """
+    old, new = flatten(baseline), flatten(current)
+    regressions = []
+    for metric in sorted(old):
+        before, after = old[metric], new.get(metric)
+        if after is None:
+            regressions.append((metric, before, None))
+            continue
+        if not before:
+            continue
+        if not metric.endswith("peak_rss_bytes") and after - before < min_seconds:
+            continue
+        if after > before * (1 + threshold):
+            regressions.append((metric, before, after))
+    return regressions
+
+
+def format_results(results):
+    lines = []
+    for key, dataset in results["datasets"].items():
+        if "error" in dataset:
+            lines.append(f"{key}: error: {dataset['error']}")
+            continue
+        lines.append(f"{key}: peak RSS {dataset['peak_rss_bytes'] / 1024 ** 2:.0f} MB")
+        for metric, timing in dataset["timings"].items():
+            lines.append(f"  {metric:28s} {timing['median'] * 1000:10.2f} ms  (cold {timing['cold'] * 1000:.2f} ms)")
+    return "\n".join(lines)
+
+
+def parse_sizes(text):
+    return [tuple(int(n) for n in size.lower().split("x")) for size in text.split(",") if size]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--preset", choices=sorted(PRESETS), default="quick")
+    parser.add_argument("--sizes", type=parse_sizes, help="comma-separated ROWSxCOLS, overrides --preset")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--data-dir", default=DEFAULT_DATA_DIR, help="where synthetic CSVs are cached")
+    parser.add_argument("--memory-budget-mb", type=int, help="ingest memory budget (default: ingest's)")
+    parser.add_argument("--out", help="write the JSON results here")
+    parser.add_argument("--baseline", help="JSON results of an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed slowdown, as a fraction")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    memory_budget = args.memory_budget_mb * 1024 ** 2 if args.memory_budget_mb else None
+
+    if args.worker:
+        json.dump(run_dataset(args.worker, args.repeat, memory_budget), sys.stdout)
+        return 0
+
+    log = lambda message: print(message, file=sys.stderr)
+    results = run(args.sizes or PRESETS[args.preset], args.repeat, args.data_dir, memory_budget, log=log)
+    print(format_results(results))
+    if args.out:
+        with open(args.out, "w") as fh:
+            json.dump(results, fh, indent=2)
+    # A dataset whose worker errored, crashed or ran out of memory fails the run
+    failed = any("error" in dataset for dataset in results["datasets"].values())
+    if args.baseline:
+        with open(args.baseline) as fh:
+            baseline = json.load(fh)
+        regressions = compare(baseline, results, args.threshold)
+        for metric, before, after in regressions:
+            if after is None:
+                print(f"REGRESSION {metric}: {before:.6g} -> missing", file=sys.stderr)
+            else:
+                print(f"REGRESSION {metric}: {before:.6g} -> {after:.6g} ({after / before - 1:+.0%})",
+                      file=sys.stderr)
+        failed = failed or bool(regressions)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
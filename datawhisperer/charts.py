@@ -0,0 +1,166 @@
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+from pandas.api.types import is_bool_dtype, is_datetime64_any_dtype, is_numeric_dtype
+
+from datawhisperer import tracing
+
+# Above this many points a scatter plot is downsampled
+MAX_SCATTER_POINTS = 10_000
+# Above this many points a scatter plot becomes a 2D density heatmap
+DENSITY_THRESHOLD = 500_000
+DENSITY_BINS = 200
+MAX_CATEGORIES = 50
+
+
+def _with_note(fig, title, note):
+    if note:
+        title = f"{title}<br><sup>{note}</sup>"
+    fig.update_layout(title=title)
+    return fig
+
+
+def _is_numeric(series):
+    return is_numeric_dtype(series) and not is_bool_dtype(series)
+
+
+def lttb(x, y, n_out):
+    """Largest-Triangle-Three-Buckets downsampling of a series sorted by x.
+
+    Returns the indices of the ``n_out`` points that best preserve the
+    visual shape of the line.
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    keep = np.empty(n_out, dtype=np.int64)
+    keep[0], keep[-1] = 0, n - 1
+    prev = 0
+    for i in range(n_out - 2):
+        start, stop = edges[i], edges[i + 1]
+        nxt_start, nxt_stop = stop, edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[nxt_start:nxt_stop].mean()
+        avg_y = y[nxt_start:nxt_stop].mean()
+        area = np.abs((x[prev] - avg_x) * (y[start:stop] - y[prev])
+                      - (x[prev] - x[start:stop]) * (avg_y - y[prev]))
+        prev = start + int(np.argmax(area))
+        keep[i + 1] = prev
+    return keep
+
+
+@tracing.traced("chart.histogram")
+def histogram(df, col, nbins=20):
+    """Histogram binned on the server, so the figure holds counts rather than rows.
+
+    Out-of-core frames bin with a query instead of loading the column.
+    """
+    title = f"Distribution of {col}"
+    binned = None
+    if isinstance(df, pd.DataFrame):
+        values = df[col].dropna()
+        if _is_numeric(values) or is_datetime64_any_dtype(values):
+            is_date = is_datetime64_any_dtype(values)
+            if is_date:
+                data = values.to_numpy(dtype="datetime64[ns]").astype(np.int64)
+            else:
+                data = values.to_numpy(dtype=np.float64)
+            binned = (*np.histogram(data, bins=nbins), is_date)
+        else:
+            counts = values.value_counts()
+            n_values = len(counts)
+    else:
+        binned = df.bin_counts(col, nbins)
+        if binned is None:
+            counts, n_values = df.top_counts(col, MAX_CATEGORIES)
+
+    if binned is not None:
+        counts, edges, is_date = binned
+        centers = (edges[:-1] + edges[1:]) / 2
+        widths = np.diff(edges)
+        if is_date:
+            # Plotly date axes measure bar widths in milliseconds
+            centers = pd.to_datetime(centers.astype(np.int64), unit="ns")
+            widths = widths / 1e6
+        fig = go.Figure(go.Bar(x=centers, y=counts, width=widths, marker_line_width=0))
+        fig.update_layout(bargap=0, xaxis_title=col, yaxis_title="count")
+        return _with_note(fig, title, None), None
+
+    note = None
+    if n_values > MAX_CATEGORIES:
+        note = f"Showing the {MAX_CATEGORIES} most frequent of {n_values} values"
+        counts = counts.iloc[:MAX_CATEGORIES]
+    fig = go.Figure(go.Bar(x=counts.index.astype(str), y=counts.to_numpy()))
+    fig.update_layout(xaxis_title=col, yaxis_title="count")
+    return _with_note(fig, title, note), note
+
+
+@tracing.traced("chart.bar")
+def bar(df, x, y):
+    """Bar chart of ``y`` summed per ``x`` (counted when ``y`` is not numeric)"""
+    if isinstance(df, pd.DataFrame):
+        grouped = df.groupby(x, observed=True, sort=False)[y]
+        numeric = _is_numeric(df[y])
+        totals = grouped.sum() if numeric else grouped.count()
+        n_groups = len(totals)
+    else:
+        totals, numeric, n_groups = df.group_totals(x, y, MAX_CATEGORIES)
+    label = f"sum of {y}" if numeric else f"count of {y}"
+    note = None
+    if n_groups > MAX_CATEGORIES:
+        note = f"Showing the top {MAX_CATEGORIES} of {n_groups} {x} values"
+        totals = totals.nlargest(MAX_CATEGORIES)
+    elif _is_numeric(totals.index.to_series()) or is_datetime64_any_dtype(totals.index):
+        totals = totals.sort_index()
+    fig = go.Figure(go.Bar(x=totals.index, y=totals.to_numpy()))
+    fig.update_layout(xaxis_title=x, yaxis_title=label)
+    return _with_note(fig, f"{y} by {x}", note), note
+
+
+@tracing.traced("chart.scatter")
+def scatter(df, x, y, max_points=MAX_SCATTER_POINTS, density_threshold=DENSITY_THRESHOLD, seed=0):
+    """Scatter plot whose size does not grow with the number of rows.
+
+    Up to ``max_points`` points are plotted as is. Larger data is reduced
+    with LTTB when ``x`` is sorted (a series over time or index). Otherwise
+    it becomes a binned 2D density heatmap above ``density_threshold``
+    points and a uniform random sample below that. Out-of-core frames are
+    binned or sampled with a query.
+    """
+    title = f"{x} vs {y}"
+    note = None
+    if isinstance(df, pd.DataFrame):
+        data = df[[x, y]].dropna()
+        n = len(data)
+        numeric = _is_numeric(data[x]) and _is_numeric(data[y])
+    else:
+        data = None
+        n = df.count_present([x, y])
+        numeric = all(df.dtypes[c].kind in "iuf" for c in (x, y))
+    if data is not None and n > max_points and numeric and data[x].is_monotonic_increasing:
+        keep = lttb(data[x].to_numpy(dtype=np.float64), data[y].to_numpy(dtype=np.float64), max_points)
+        data = data.iloc[keep]
+        note = f"Downsampled from {n:,} to {len(data):,} points (LTTB)"
+    elif n > density_threshold and numeric:
+        if data is None:
+            counts, x_edges, y_edges = df.bin_counts_2d(x, y, DENSITY_BINS)
+        else:
+            counts, x_edges, y_edges = np.histogram2d(
+                data[x].to_numpy(dtype=np.float64), data[y].to_numpy(dtype=np.float64), bins=DENSITY_BINS)
+        fig = go.Figure(go.Heatmap(
+            x=(x_edges[:-1] + x_edges[1:]) / 2, y=(y_edges[:-1] + y_edges[1:]) / 2,
+            z=np.where(counts.T > 0, counts.T, np.nan), colorscale="Viridis", colorbar_title="points"))
+        note = f"Density of {n:,} points in {DENSITY_BINS}x{DENSITY_BINS} bins"
+        fig.update_layout(xaxis_title=x, yaxis_title=y)
+        return _with_note(fig, title, note), note
+    elif n > max_points:
+        if data is None:
+            data = df[[x, y]].sample(max_points, seed=seed, dropna=True)
+        else:
+            data = data.sample(n=max_points, random_state=seed)
+        note = f"Random sample of {max_points:,} of {n:,} points"
+    elif data is None:
+        data = df[[x, y]].sample(max_points, seed=seed, dropna=True)
+    fig = go.Figure(go.Scattergl(x=data[x], y=data[y], mode="markers"))
+    fig.update_layout(xaxis_title=x, yaxis_title=y)
+    return _with_note(fig, title, note), note
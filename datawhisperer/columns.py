@@ -0,0 +1,182 @@
+import difflib
+import random
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+
+MAX_CACHED_INDEXES = 32
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def name_tokens(name):
+    """Lowercase word tokens of a column name, splitting snake and camel case"""
+    name = re.sub(r"([a-z0-9])([A-Z])", r"\1 \2", str(name))
+    return re.findall(r"[a-z0-9]+", name.lower())
+
+
+class ColumnIndex:
+    """Token-level Aho-Corasick automaton over the column names of a dataset.
+
+    Column names and commands are split into the same word tokens, so a
+    column only matches whole words ("Age" does not match inside "Average").
+    A command is scanned once, whatever the number of columns. Overlapping
+    matches are resolved leftmost-longest ("Income Net" beats "Income"),
+    and with ``fuzzy`` enabled, leftover words that are close to a one-word
+    column name (typos) are matched too.
+    """
+
+    def __init__(self, columns, fuzzy=True, cutoff=0.85):
+        self.columns = list(columns)
+        self.fuzzy = fuzzy
+        self.cutoff = cutoff
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+        self._single = {}
+        self._names = {}
+        self.max_words = 0
+        for col in self.columns:
+            tokens = name_tokens(col)
+            if tokens:
+                self._add(tokens, col)
+        self._build_fail_links()
+        self._vocab = sorted(self._single)
+
+    def _add(self, tokens, col):
+        state = 0
+        for token in tokens:
+            nxt = self._goto[state].get(token)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][token] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            state = nxt
+        self._names.setdefault(tuple(tokens), col)
+        self.max_words = max(self.max_words, len(tokens))
+        # Keep the first column when two names normalize to the same tokens
+        if not any(length == len(tokens) for length, _ in self._out[state]):
+            self._out[state].append((len(tokens), col))
+            if len(tokens) == 1:
+                self._single[tokens[0]] = col
+
+    def _build_fail_links(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for token, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fail = self._fail[state]
+                while fail and token not in self._goto[fail]:
+                    fail = self._fail[fail]
+                target = self._goto[fail].get(token, 0)
+                self._fail[nxt] = target if target != nxt else 0
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def lookup(self, tokens, fuzzy=None):
+        """The column whose name is exactly ``tokens``, or None"""
+        col = self._names.get(tuple(tokens))
+        if col is None and len(tokens) == 1 and (self.fuzzy if fuzzy is None else fuzzy):
+            close = difflib.get_close_matches(tokens[0], self._vocab, n=1, cutoff=self.cutoff)
+            if close:
+                col = self._single[close[0]]
+        return col
+
+    def _scan(self, tokens):
+        """All (start, end, column) matches of column names in ``tokens``"""
+        matches = []
+        state = 0
+        for i, token in enumerate(tokens):
+            while state and token not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(token, 0)
+            for length, col in self._out[state]:
+                matches.append((i + 1 - length, i + 1, col))
+        return matches
+
+    def spans(self, tokens):
+        """Non-overlapping (start, end, column) exact matches in ``tokens``, leftmost-longest"""
+        chosen = []
+        end = 0
+        for start, stop, col in sorted(self._scan(tokens), key=lambda m: (m[0], m[0] - m[1])):
+            if start >= end:
+                chosen.append((start, stop, col))
+                end = stop
+        return chosen
+
+    def match(self, command):
+        """Columns mentioned in ``command``, in the order they appear"""
+        tokens = name_tokens(command)
+        chosen = []
+        covered = set()
+        for start, stop, col in self.spans(tokens):
+            chosen.append((start, col))
+            covered.update(range(start, stop))
+        if self.fuzzy and self._vocab:
+            for i, token in enumerate(tokens):
+                if i in covered or len(token) < 4 or token.isdigit():
+                    continue
+                close = difflib.get_close_matches(token, self._vocab, n=1, cutoff=self.cutoff)
+                if close:
+                    chosen.append((i, self._single[close[0]]))
+        result = []
+        for _, col in sorted(chosen, key=lambda c: c[0]):
+            if col not in result:
+                result.append(col)
+        return result
+
+
+def column_index(columns):
+    """Return the ColumnIndex for a dataset's columns, building it only once"""
+    key = id(columns)
+    with _cache_lock:
+        cached = _cache.get(key)
+        if cached is not None and cached[0] is columns:
+            _cache.move_to_end(key)
+            return cached[1]
+    index = ColumnIndex(columns)
+    with _cache_lock:
+        # Holding on to ``columns`` keeps its id from being reused while cached
+        _cache[key] = (columns, index)
+        while len(_cache) > MAX_CACHED_INDEXES:
+            _cache.popitem(last=False)
+    return index
+
+
+def benchmark(n_columns=10_000, n_commands=200, seed=0):
+    """Time the substring scan the chatbot used against ColumnIndex.
+
+    Returns seconds per command for each approach plus the one-off build
+    time of the index.
+    """
+    rng = random.Random(seed)
+    words = ["income", "age", "region", "spend", "score", "net", "total", "count", "rate", "days"]
+    columns = [f"{rng.choice(words)}_{rng.choice(words)}_{i}" for i in range(n_columns)]
+    commands = [f"scatter of {rng.choice(columns)} and {rng.choice(columns)} by region" for _ in range(n_commands)]
+
+    def substring_scan(command, available_columns):
+        return [col for col in available_columns if col.lower() in command.lower()]
+
+    start = time.perf_counter()
+    for command in commands:
+        substring_scan(command, columns)
+    naive = (time.perf_counter() - start) / n_commands
+
+    start = time.perf_counter()
+    index = ColumnIndex(columns)
+    build = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for command in commands:
+        index.match(command)
+    indexed = (time.perf_counter() - start) / n_commands
+    return {"columns": n_columns, "substring_scan": naive, "index_build": build, "index_match": indexed}
+
+
+if __name__ == "__main__":
+    for name, value in benchmark().items():
+        print(f"{name}: {value}")
@@ -0,0 +1,131 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_HEADER = "Summary of the earlier conversation:"
+
+SUMMARIZE_INSTRUCTIONS = (
+    "Update the running summary of a data analysis conversation. Keep dataset "
+    "names, column names, numbers and conclusions; drop pleasantries. "
+    "Answer with the updated summary only, in at most {max_words} words."
+)
+
+
+def estimate_tokens(text):
+    """Rough token count (about four characters per token) without an API call"""
+    return len(text) // 4 + 1
+
+
+def message_tokens(messages, count_tokens=estimate_tokens):
+    # Each message carries a few tokens of role/formatting overhead
+    return sum(count_tokens(m["content"]) + 4 for m in messages)
+
+
+def truncate_summarizer(max_chars=2000, per_message=200):
+    """Summarizer that keeps the start of each folded message, no LLM needed"""
+    def summarize(summary, messages):
+        lines = [summary] if summary else []
+        for m in messages:
+            text = " ".join(m["content"].split())
+            if len(text) > per_message:
+                text = text[:per_message] + "..."
+            lines.append(f"{m['role']}: {text}")
+        joined = "\n".join(lines)
+        return joined[-max_chars:]
+    return summarize
+
+
+def llm_summarizer(complete, max_words=200, fallback=None):
+    """Summarizer that asks an LLM to fold new messages into the summary.
+
+    ``complete`` takes a message list and returns the answer text, such as
+    LLMGateway.complete. When the call fails the messages are folded by
+    ``fallback`` (truncate_summarizer() by default) instead, so a rate
+    limit while summarizing never fails the turn.
+    """
+    fallback = fallback or truncate_summarizer()
+
+    def summarize(summary, messages):
+        transcript = "\n".join(f"{m['role']}: {m['content']}" for m in messages)
+        request = [
+            {"role": "system", "content": SUMMARIZE_INSTRUCTIONS.format(max_words=max_words)},
+            {"role": "user", "content": f"Current summary:\n{summary or '(none)'}\n\nNew messages:\n{transcript}"},
+        ]
+        try:
+            return complete(request)
+        except Exception:
+            logger.warning("LLM summary failed, truncating instead", exc_info=True)
+            return fallback(summary, messages)
+    return summarize
+
+
+class ChatContext:
+    """Keeps the prompt sent to the LLM under a fixed token budget.
+
+    The system prompt and the last ``keep_turns`` user/assistant turns are
+    sent verbatim. Older messages are folded into a rolling summary which is
+    only extended with the messages that newly fall out of the window, so
+    the summarizer runs once per folded message rather than once per turn.
+    """
+
+    def __init__(self, budget_tokens=8000, keep_turns=6, summarize=None, count_tokens=estimate_tokens):
+        self.budget_tokens = budget_tokens
+        self.keep_turns = keep_turns
+        self.summarize = summarize or truncate_summarizer()
+        self.count_tokens = count_tokens
+        self.summary = ""
+        self.summarized = 0
+        self.turn_tokens = []
+
+    def reset(self):
+        self.summary = ""
+        self.summarized = 0
+
+    def _fold(self, messages, upto):
+        if upto > self.summarized:
+            self.summary = self.summarize(self.summary, messages[self.summarized:upto])
+            self.summarized = upto
+            # The summary may use at most half of the budget, oldest text goes first
+            max_chars = self.budget_tokens // 2 * 4
+            if len(self.summary) > max_chars:
+                self.summary = self.summary[-max_chars:]
+
+    def _payload(self, system_messages, recent):
+        system = [dict(m) for m in system_messages]
+        if self.summary:
+            note = f"\n\n{SUMMARY_HEADER}\n{self.summary}"
+            if system:
+                system[0]["content"] += note
+            else:
+                system = [{"role": "system", "content": note.strip()}]
+        # Messages may carry UI artifacts besides role and content; only those two are sent
+        return system + [{"role": m["role"], "content": m["content"]} for m in recent]
+
+    def build(self, system_messages, messages):
+        """Return the message list to send for the next LLM call"""
+        if len(messages) < self.summarized:
+            # History was cleared or rewritten; start a new summary
+            self.reset()
+
+        cut = max(len(messages) - 2 * self.keep_turns, 0)
+        self._fold(messages, cut)
+        payload = self._payload(system_messages, messages[self.summarized:])
+        tokens = message_tokens(payload, self.count_tokens)
+
+        # Shrink the verbatim window until the payload fits, keeping the last message
+        while tokens > self.budget_tokens and self.summarized < len(messages) - 1:
+            self._fold(messages, self.summarized + 1)
+            payload = self._payload(system_messages, messages[self.summarized:])
+            tokens = message_tokens(payload, self.count_tokens)
+
+        # A long summary is trimmed from its oldest end as a last resort
+        if tokens > self.budget_tokens and self.summary:
+            excess_chars = (tokens - self.budget_tokens) * 4
+            self.summary = self.summary[excess_chars:]
+            payload = self._payload(system_messages, messages[self.summarized:])
+            tokens = message_tokens(payload, self.count_tokens)
+
+        self.turn_tokens.append(tokens)
+        logger.info("LLM prompt: %d tokens, %d verbatim messages, %d summarized",
+                    tokens, len(messages) - self.summarized, self.summarized)
+        return payload
@@ -0,0 +1,233 @@
+import contextvars
+import itertools
+import queue
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from datawhisperer import charts, tracing
+from datawhisperer.stats import stats_for
+
+# Standard artifacts, computed in this order after an upload: the ones the
+# first questions usually ask for go first, per-column histograms last
+DEFAULT_ARTIFACTS = ("summary", "missing", "correlation", "outliers", "histograms")
+PRIORITIES = {"profile": 0, "summary": 1, "missing": 1, "correlation": 2, "outliers": 3, "histograms": 4}
+HISTOGRAM_BINS = 20
+# Values further than this many IQRs outside the quartiles are flagged (Tukey's fences)
+OUTLIER_IQR = 1.5
+# Weaker correlations are left out of the prompt
+MIN_REPORTED_CORRELATION = 0.5
+# Datasets whose artifacts are kept once no session uses them any more
+MAX_IDLE_DATASETS = 8
+
+
+def summary_table(df):
+    """describe() of the numeric columns, or of all columns when none is numeric"""
+    stats = stats_for(df)
+    return stats.describe() if stats.numeric_columns() else df.describe()
+
+
+def outlier_table(df):
+    """Per numeric column: Tukey fences, and how many values fall outside them"""
+    stats = stats_for(df)
+    cols = stats.numeric_columns()
+    if not cols:
+        return pd.DataFrame(columns=["low", "high", "outliers", "share"])
+    described = stats.describe()
+    q1, q3 = described.loc["25%"], described.loc["75%"]
+    low, high = q1 - OUTLIER_IQR * (q3 - q1), q3 + OUTLIER_IQR * (q3 - q1)
+    if isinstance(df, pd.DataFrame):
+        values = df[cols]
+        outside = (values.lt(low, axis=1) | values.gt(high, axis=1)).sum()
+    else:
+        # Out-of-core frames count in one pushed-down scan
+        outside = df.count_outside(low, high)
+    present = described.loc["count"]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        share = outside / present
+    return pd.DataFrame({"low": low, "high": high, "outliers": outside.astype(np.int64), "share": share})
+
+
+def _compute(name, df):
+    if name == "summary":
+        return summary_table(df)
+    if name == "missing":
+        return stats_for(df).null_counts()
+    if name == "correlation":
+        return stats_for(df).corr()
+    if name == "outliers":
+        return outlier_table(df)
+    if name.startswith("histogram:"):
+        return charts.histogram(df, name.split(":", 1)[1], nbins=HISTOGRAM_BINS)
+    raise ValueError(f"Unknown EDA artifact: {name}")
+
+
+class EDAResults:
+    """Artifacts of one dataset, filled in by the scheduler as they finish.
+
+    Readers call get(), which returns None for an artifact that is not
+    ready, so they can compute it themselves instead of waiting.
+    """
+
+    def __init__(self, key, load):
+        self.key = key
+        self.cancelled = False
+        self.sessions = 0
+        self._load = load
+        self._frame = None
+        self._artifacts = {}
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._frame_lock = threading.Lock()
+
+    def frame(self):
+        # A separate lock, so readers of finished artifacts never wait for the load
+        with self._frame_lock:
+            frame = self._frame
+            if frame is None:
+                frame = self._frame = self._load()
+            return frame
+
+    def get(self, name):
+        with self._lock:
+            return self._artifacts.get(name)
+
+    def put(self, name, value):
+        with self._lock:
+            if not self.cancelled:
+                self._artifacts[name] = value
+
+    def _schedule(self, name):
+        with self._lock:
+            self._pending.add(name)
+
+    def _finish(self, name):
+        with self._lock:
+            self._pending.discard(name)
+            if not self._pending:
+                # Don't pin the frame once nothing is left to compute
+                self._frame = None
+
+    def progress(self):
+        """(artifacts ready, artifacts scheduled)"""
+        with self._lock:
+            return len(self._artifacts), len(self._artifacts) + len(self._pending)
+
+    @property
+    def done(self):
+        with self._lock:
+            return not self._pending
+
+
+class EDAScheduler:
+    """Computes the standard EDA artifacts of uploads on background threads.
+
+    Jobs of all datasets share one priority queue, so the summary of a new
+    upload is computed before the histograms of an older one. Datasets are
+    keyed by content (the store digest), so sessions that load the same
+    file share one set of artifacts. A dataset is cancelled once every
+    session that submitted it has released it: its queued jobs are
+    skipped and a running job's result is dropped.
+    """
+
+    def __init__(self, max_workers=2):
+        self._queue = queue.PriorityQueue()
+        self._seq = itertools.count()
+        self._results = OrderedDict()
+        self._lock = threading.Lock()
+        for i in range(max_workers):
+            threading.Thread(target=self._work, name=f"eda-{i}", daemon=True).start()
+
+    def submit(self, key, load, columns, artifacts=DEFAULT_ARTIFACTS):
+        """Schedule ``artifacts`` for the dataset ``key`` and return its EDAResults.
+
+        ``load`` returns the DataFrame and is called on a worker thread.
+        "histograms" expands to one histogram per column of ``columns``.
+        """
+        with self._lock:
+            results = self._results.get(key)
+            if results is not None:
+                self._results.move_to_end(key)
+                results.sessions += 1
+                return results
+            results = self._results[key] = EDAResults(key, load)
+            results.sessions = 1
+            self._evict()
+        # The caller's context carries the trace session into the workers
+        context = contextvars.copy_context()
+        for artifact in artifacts:
+            names = [f"histogram:{col}" for col in columns] if artifact == "histograms" else [artifact]
+            for name in names:
+                results._schedule(name)
+                self._queue.put((PRIORITIES[artifact], next(self._seq), name, results, context))
+        return results
+
+    def release(self, results):
+        """A session stopped using ``results``; cancels them when it was the last one"""
+        with self._lock:
+            results.sessions -= 1
+            if results.sessions <= 0 and not results.done:
+                self._cancel(results)
+
+    def cancel(self, key):
+        with self._lock:
+            results = self._results.get(key)
+            if results is not None:
+                self._cancel(results)
+
+    def _cancel(self, results):
+        results.cancelled = True
+        self._results.pop(results.key, None)
+
+    def _evict(self):
+        idle = [key for key, r in self._results.items() if r.sessions <= 0]
+        for key in idle[:max(len(idle) - MAX_IDLE_DATASETS, 0)]:
+            self._cancel(self._results[key])
+
+    def results(self, key):
+        with self._lock:
+            return self._results.get(key)
+
+    def _work(self):
+        while True:
+            _, _, name, results, context = self._queue.get()
+            try:
+                if not results.cancelled:
+                    # A context can only be entered by one thread at a time
+                    context.copy().run(self._run, name, results)
+            except Exception:
+                # A failed artifact is computed on demand instead
+                pass
+            finally:
+                results._finish(name)
+
+    def _run(self, name, results):
+        with tracing.span(f"eda.{name.split(':', 1)[0]}", artifact=name):
+            df = results.frame()
+            if name == "profile":
+                from datawhisperer.profile import get_profile
+
+                value = get_profile(results.key, df)
+            else:
+                value = _compute(name, df)
+        results.put(name, value)
+
+
+def render_findings(results, max_items=5):
+    """Prompt text about the outliers and strongest correlations found so far"""
+    lines = []
+    outliers = results.get("outliers")
+    if outliers is not None:
+        flagged = outliers[outliers["outliers"] > 0].sort_values("share", ascending=False).head(max_items)
+        for col, row in flagged.iterrows():
+            lines.append(f"- {col}: {int(row['outliers'])} outliers ({row['share']:.1%}) "
+                         f"outside {row['low']:.4g} to {row['high']:.4g}")
+    corr = results.get("correlation")
+    if corr is not None and len(corr) > 1:
+        upper = corr.where(np.triu(np.ones(corr.shape, dtype=bool), k=1)).stack()
+        upper = upper[upper.abs() >= MIN_REPORTED_CORRELATION]
+        strongest = upper.reindex(upper.abs().sort_values(ascending=False).index).head(max_items)
+        lines += [f"- correlation of {a} and {b}: {value:.2f}" for (a, b), value in strongest.items()]
+    return "\n".join(lines)
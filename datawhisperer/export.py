@@ -0,0 +1,257 @@
+import gzip
+import hashlib
+import io
+import os
+import tempfile
+import threading
+
+from datawhisperer import tracing
+from datawhisperer.store import DEFAULT_ROOT
+
+EXPORT_DIR = os.path.join(DEFAULT_ROOT, "exports")
+# Rows serialized at a time; bounds the memory an export needs besides its source
+CHUNK_ROWS = 100_000
+# Format: (file extension, MIME type)
+FORMATS = {
+    "csv": (".csv", "text/csv"),
+    "parquet": (".parquet", "application/vnd.apache.parquet"),
+    "arrow": (".arrow", "application/vnd.apache.arrow.file"),
+}
+COMPRESSIONS = (None, "gzip", "zstd")
+# Compressions the format applies to its own pages or buffers; others wrap the whole file
+_NATIVE = {("parquet", "gzip"), ("parquet", "zstd"), ("arrow", "zstd")}
+_SUFFIXES = {"gzip": ".gz", "zstd": ".zst"}
+# gzip at level 1 is several times faster than the usual 6 or 9 and,
+# on typical tables, only a few percent larger
+GZIP_LEVEL = 1
+
+
+class _Chunks(io.RawIOBase):
+    """Write-only file that keeps what is written until drain() hands it on"""
+
+    def __init__(self):
+        super().__init__()
+        self._parts = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        data = bytes(data)
+        self._parts.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self):
+        data = b"".join(self._parts)
+        self._parts.clear()
+        return data
+
+
+def file_name(base, fmt, compression=None):
+    """Download name for an export, e.g. results.csv.gz"""
+    name = os.path.splitext(base)[0] + FORMATS[fmt][0]
+    if compression is not None and (fmt, compression) not in _NATIVE:
+        name += _SUFFIXES[compression]
+    return name
+
+
+def mime_type(fmt, compression=None):
+    if compression is not None and (fmt, compression) not in _NATIVE:
+        return "application/gzip" if compression == "gzip" else "application/zstd"
+    return FORMATS[fmt][1]
+
+
+def _frames(source, chunk_rows):
+    """pandas chunks of a DataFrame, a pyarrow Table or an out-of-core frame"""
+    import pandas as pd
+
+    if isinstance(source, pd.DataFrame):
+        for start in range(0, len(source), chunk_rows):
+            yield source.iloc[start:start + chunk_rows]
+        return
+    for batch in _batches(source, chunk_rows):
+        yield batch.to_pandas()
+
+
+def _batches(source, chunk_rows):
+    """pyarrow RecordBatches of a DataFrame, a pyarrow Table or an out-of-core frame"""
+    import pandas as pd
+    import pyarrow as pa
+
+    if isinstance(source, pd.DataFrame):
+        # One schema for the whole frame, so chunks whose object columns are all null still match
+        schema = pa.Schema.from_pandas(source, preserve_index=False)
+        for start in range(0, len(source), chunk_rows):
+            yield pa.RecordBatch.from_pandas(source.iloc[start:start + chunk_rows], schema=schema,
+                                             preserve_index=False)
+    elif isinstance(source, pa.Table):
+        yield from source.to_batches(max_chunksize=chunk_rows)
+    else:
+        # Out-of-core frames stream their rows from the query
+        yield from source.record_batches(chunk_rows)
+
+
+def _schema(source):
+    import pandas as pd
+    import pyarrow as pa
+
+    if isinstance(source, pd.DataFrame):
+        return pa.Schema.from_pandas(source, preserve_index=False)
+    if isinstance(source, pa.Table):
+        return source.schema
+    return None
+
+
+def stream(source, fmt="csv", compression=None, chunk_rows=CHUNK_ROWS):
+    """Serialize ``source`` chunk by chunk, yielding the bytes of the file as they are produced.
+
+    ``source`` is a DataFrame, a pyarrow Table or an out-of-core frame
+    from backends.open_dataset. At most ``chunk_rows`` rows are held in
+    serialized form at a time. CSV is written like ``to_csv(index=False)``.
+    gzip and zstd compress Parquet pages and zstd Arrow buffers natively;
+    otherwise the whole file is compressed as a stream.
+    """
+    import pyarrow as pa
+
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown export format: {fmt}")
+    if compression not in COMPRESSIONS:
+        raise ValueError(f"Unknown compression: {compression}")
+    native = compression if (fmt, compression) in _NATIVE else None
+    outer = compression if native is None else None
+
+    sink = _Chunks()
+    if outer == "gzip":
+        out = gzip.GzipFile(fileobj=sink, mode="wb", compresslevel=GZIP_LEVEL, mtime=0)
+    elif outer is not None:
+        out = pa.CompressedOutputStream(sink, outer)
+    else:
+        out = sink
+
+    if fmt == "csv":
+        first = True
+        for chunk in _frames(source, chunk_rows):
+            out.write(chunk.to_csv(index=False, header=first).encode("utf-8"))
+            first = False
+            yield sink.drain()
+        if first:
+            # No rows: still write the header
+            out.write(",".join(map(str, source.columns)).encode("utf-8") + b"\n")
+    else:
+        import pyarrow.parquet as pq
+
+        batches = _batches(source, chunk_rows)
+        schema = _schema(source)
+        first_batch = None
+        if schema is None:
+            first_batch = next(batches, None)
+            schema = first_batch.schema if first_batch is not None else pa.schema([])
+        if fmt == "parquet":
+            level = GZIP_LEVEL if native == "gzip" else None
+            writer = pq.ParquetWriter(out, schema, compression=native or "none", compression_level=level)
+        else:
+            writer = pa.ipc.new_file(out, schema, options=pa.ipc.IpcWriteOptions(compression=native))
+        if first_batch is not None:
+            writer.write_batch(first_batch)
+            yield sink.drain()
+        for batch in batches:
+            writer.write_batch(batch)
+            yield sink.drain()
+        writer.close()
+    if out is not sink:
+        out.close()
+    yield sink.drain()
+
+
+class ExportCache:
+    """Exported files on disk, one per (result version, format, compression).
+
+    ``version`` identifies the exported data, such as a dataset digest plus
+    the active filter, so a second download of the same result reads the
+    file written for the first one. Exports are streamed into the file,
+    never built in memory. The least recently used files are deleted
+    once the directory goes over ``max_bytes``.
+    """
+
+    def __init__(self, root=EXPORT_DIR, max_bytes=4 * 1024 ** 3):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._building = {}
+        os.makedirs(root, exist_ok=True)
+
+    def path_for(self, version, fmt, compression=None):
+        digest = hashlib.sha256(f"{version}\0{fmt}\0{compression}".encode()).hexdigest()[:32]
+        return os.path.join(self.root, file_name(digest, fmt, compression))
+
+    def get(self, version, source, fmt="csv", compression=None):
+        """Path of the export of ``source``, serializing it on a miss.
+
+        ``source`` may be a callable returning the data, so nothing is
+        computed while the export is cached.
+        """
+        path = self.path_for(version, fmt, compression)
+        with self._lock:
+            lock = self._building.setdefault(path, threading.Lock())
+        # Concurrent requests for one export wait for a single writer
+        with lock:
+            if os.path.exists(path):
+                os.utime(path)
+                with self._lock:
+                    self.hits += 1
+                return path
+            with self._lock:
+                self.misses += 1
+            with tracing.span("export.write", format=fmt, compression=str(compression)) as span:
+                data = source() if callable(source) else source
+                fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix=".tmp")
+                try:
+                    with os.fdopen(fd, "wb") as fh:
+                        for part in stream(data, fmt, compression):
+                            fh.write(part)
+                    os.replace(tmp_path, path)
+                except BaseException:
+                    os.unlink(tmp_path)
+                    raise
+                span.set("bytes", os.path.getsize(path))
+        self.gc()
+        return path
+
+    def download(self, version, source, fmt="csv", compression=None):
+        """A callable for ``st.download_button(data=...)`` that exports only when clicked"""
+        def data():
+            with open(self.get(version, source, fmt, compression), "rb") as fh:
+                return fh.read()
+        return data
+
+    def gc(self):
+        """Delete the least recently used exports until the directory fits in max_bytes"""
+        entries = []
+        for entry in os.scandir(self.root):
+            if entry.name.endswith(".tmp"):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}
@@ -0,0 +1,396 @@
+import operator
+import re
+import threading
+import weakref
+from collections import OrderedDict, namedtuple
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import is_bool_dtype, is_datetime64_any_dtype, is_numeric_dtype
+
+from datawhisperer.columns import column_index, name_tokens
+
+try:
+    import numexpr
+except ImportError:
+    numexpr = None
+
+# numexpr only pays off on large arrays
+NUMEXPR_MIN_ROWS = 100_000
+MAX_CACHED_VIEWS = 4
+# Masks of recent comparisons and sub-expressions kept per dataset, one byte per row each
+MAX_MASK_BYTES = 64 * 1024 ** 2
+
+Compare = namedtuple("Compare", ["column", "op", "value"])
+BoolOp = namedtuple("BoolOp", ["op", "items"])
+Not = namedtuple("Not", ["item"])
+
+_TOKEN = re.compile(r"""\s*(?:
+    (?P<date>\d{4}-\d{2}-\d{2}(?:[T ]\d{2}:\d{2}(?::\d{2})?)?)
+  | (?P<num>-?\d+(?:\.\d+)?(?:e-?\d+)?)(?![\w.])
+  | (?P<str>"[^"]*"|'[^']*')
+  | (?P<op>>=|<=|!=|==|=|>|<)
+  | (?P<punct>[(),])
+  | (?P<word>[^\s(),<>=!"']+)
+)""", re.VERBOSE | re.IGNORECASE)
+
+_PREFIX = re.compile(
+    r"\b(?:filter|where|query)\b(?:\s+(?:the\s+)?(?:data|dataset|rows|table)\b)?"
+    r"(?:\s+(?:by|for|on|to|where|with|only))*\s*:?", re.IGNORECASE)
+
+SYMBOL_OPS = {"=": "==", "==": "==", "!=": "!=", ">": ">", "<": "<", ">=": ">=", "<=": "<="}
+
+# Word phrases for operators; longer phrases are tried first
+WORD_OPS = sorted([
+    ("is not equal to", "!="), ("not equal to", "!="), ("is not", "!="), ("does not equal", "!="),
+    ("is not null", "notnull"), ("is not missing", "notnull"), ("is not empty", "notnull"),
+    ("is null", "isnull"), ("is missing", "isnull"), ("is empty", "isnull"),
+    ("is greater than or equal to", ">="), ("greater than or equal to", ">="), ("at least", ">="),
+    ("is less than or equal to", "<="), ("less than or equal to", "<="), ("at most", "<="),
+    ("is greater than", ">"), ("greater than", ">"), ("more than", ">"), ("is above", ">"),
+    ("above", ">"), ("over", ">"), ("after", ">"),
+    ("is less than", "<"), ("less than", "<"), ("fewer than", "<"), ("is below", "<"),
+    ("below", "<"), ("under", "<"), ("before", "<"),
+    ("is not in", "not in"), ("not in", "not in"), ("is in", "in"), ("in", "in"),
+    ("is between", "between"), ("between", "between"),
+    ("contains", "contains"), ("includes", "contains"),
+    ("is equal to", "=="), ("equal to", "=="), ("equals", "=="), ("is", "=="),
+], key=lambda phrase: -len(phrase[0].split()))
+
+CONNECTORS = {"and", "or"}
+TRUE_WORDS = {"true", "yes", "y", "1"}
+FALSE_WORDS = {"false", "no", "n", "0"}
+
+_COMPARE = {">": operator.gt, "<": operator.lt, ">=": operator.ge, "<=": operator.le,
+            "==": operator.eq, "!=": operator.ne}
+
+
+class FilterError(ValueError):
+    """Raised when a filter condition cannot be understood or applied"""
+
+
+def format_expr(node):
+    """Readable, canonical text of a filter expression"""
+    if isinstance(node, BoolOp):
+        return f" {node.op} ".join(
+            f"({format_expr(item)})" if isinstance(item, BoolOp) else format_expr(item) for item in node.items)
+    if isinstance(node, Not):
+        return f"not ({format_expr(node.item)})"
+    if node.op in ("isnull", "notnull"):
+        return f"{node.column} {'is' if node.op == 'isnull' else 'is not'} null"
+    if node.op == "between":
+        return f"{node.column} between {node.value[0]!r} and {node.value[1]!r}"
+    return f"{node.column} {node.op} {node.value!r}"
+
+
+class _Parser:
+    """Recursive-descent parser for conditions such as ``Income > 50000 and Region is West``"""
+
+    def __init__(self, text, columns):
+        self.tokens = []
+        for m in _TOKEN.finditer(text):
+            kind = m.lastgroup
+            self.tokens.append((kind, m.group(kind)))
+        self.pos = 0
+        self.index = column_index(columns)
+
+    def peek(self, offset=0):
+        i = self.pos + offset
+        return self.tokens[i] if i < len(self.tokens) else (None, None)
+
+    def peek_word(self, offset=0):
+        kind, text = self.peek(offset)
+        return text.lower() if kind == "word" else None
+
+    def parse(self):
+        if not self.tokens:
+            raise FilterError("Please specify a condition, for example: filter where Income > 50000")
+        node = self.parse_or()
+        if self.pos < len(self.tokens):
+            raise FilterError(f"I didn't understand the condition near '{self.tokens[self.pos][1]}'")
+        return node
+
+    def parse_or(self):
+        items = [self.parse_and()]
+        while self.peek_word() == "or":
+            self.pos += 1
+            items.append(self.parse_and())
+        return items[0] if len(items) == 1 else BoolOp("or", tuple(items))
+
+    def parse_and(self):
+        items = [self.parse_not()]
+        while self.peek_word() == "and":
+            self.pos += 1
+            items.append(self.parse_not())
+        return items[0] if len(items) == 1 else BoolOp("and", tuple(items))
+
+    def parse_not(self):
+        if self.peek_word() == "not":
+            self.pos += 1
+            return Not(self.parse_not())
+        if self.peek() == ("punct", "("):
+            self.pos += 1
+            node = self.parse_or()
+            if self.peek() != ("punct", ")"):
+                raise FilterError("Missing closing parenthesis in the filter condition")
+            self.pos += 1
+            return node
+        return self.parse_comparison()
+
+    def parse_column(self):
+        # Longest run of words that names a column
+        words = []
+        while self.peek(len(words))[0] in ("word", "num") and len(words) < self.index.max_words + 2:
+            words.append(self.peek(len(words))[1])
+        for k in range(len(words), 0, -1):
+            tokens = [t for word in words[:k] for t in name_tokens(word)]
+            col = self.index.lookup(tokens, fuzzy=(k == 1))
+            if col is not None:
+                self.pos += k
+                return col
+        found = self.peek()[1]
+        raise FilterError(f"I couldn't find a column named '{found}'" if found else "The condition is missing a column")
+
+    def parse_operator(self):
+        kind, text = self.peek()
+        if kind == "op":
+            self.pos += 1
+            return SYMBOL_OPS[text]
+        for phrase, op in WORD_OPS:
+            words = phrase.split()
+            if all(self.peek_word(i) == w for i, w in enumerate(words)):
+                self.pos += len(words)
+                return op
+        raise FilterError(f"I didn't understand the comparison '{text}'" if text else "The condition is missing a comparison")
+
+    def parse_value(self, stop_at_and=True):
+        kind, text = self.peek()
+        if kind is None:
+            raise FilterError("The condition is missing a value")
+        if kind == "num":
+            self.pos += 1
+            number = float(text)
+            return int(number) if number.is_integer() and "." not in text and "e" not in text.lower() else number
+        if kind in ("str", "date"):
+            self.pos += 1
+            return text[1:-1] if kind == "str" else text
+        words = []
+        while True:
+            kind, text = self.peek()
+            if kind != "word" or (text.lower() in CONNECTORS and (stop_at_and or text.lower() != "and")):
+                break
+            words.append(text)
+            self.pos += 1
+            if not stop_at_and:
+                break
+        if not words:
+            raise FilterError("The condition is missing a value")
+        return " ".join(words)
+
+    def parse_list(self):
+        values = []
+        parens = self.peek() == ("punct", "(")
+        if parens:
+            self.pos += 1
+        while True:
+            values.append(self.parse_value())
+            if self.peek() != ("punct", ","):
+                break
+            self.pos += 1
+        if parens:
+            if self.peek() != ("punct", ")"):
+                raise FilterError("Missing closing parenthesis in the list of values")
+            self.pos += 1
+        return tuple(values)
+
+    def parse_comparison(self):
+        col = self.parse_column()
+        op = self.parse_operator()
+        if op in ("isnull", "notnull"):
+            return Compare(col, op, None)
+        if op in ("in", "not in"):
+            return Compare(col, op, self.parse_list())
+        if op == "between":
+            low = self.parse_value(stop_at_and=False)
+            if self.peek_word() != "and":
+                raise FilterError("Use 'between <low> and <high>'")
+            self.pos += 1
+            return Compare(col, op, (low, self.parse_value()))
+        return Compare(col, op, self.parse_value())
+
+
+def condition_text(command):
+    """The condition part of a command such as ``filter where Age > 30``"""
+    m = _PREFIX.search(command)
+    return command[m.end():] if m else command
+
+
+def parse_filter(command, columns):
+    """Parse the condition in ``command`` into an expression tree"""
+    return _Parser(condition_text(command), columns).parse()
+
+
+def _coerce(series, value):
+    """Convert a parsed value to something comparable with ``series``"""
+    if is_bool_dtype(series):
+        text = str(value).lower()
+        if text in TRUE_WORDS:
+            return True
+        if text in FALSE_WORDS:
+            return False
+        raise FilterError(f"'{value}' is not a true/false value for {series.name}")
+    if is_numeric_dtype(series):
+        if isinstance(value, (int, float)):
+            return value
+        try:
+            return float(value)
+        except ValueError:
+            raise FilterError(f"{series.name} is numeric, so '{value}' can't be compared with it") from None
+    if is_datetime64_any_dtype(series):
+        try:
+            return pd.Timestamp(str(value))
+        except ValueError:
+            raise FilterError(f"'{value}' is not a date") from None
+    return value
+
+
+def _text_equal(series, value):
+    """Equality on text columns, falling back to a case-insensitive match"""
+    value = str(value)
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        categories = series.cat.categories.astype(str)
+        hits = np.flatnonzero(categories == value)
+        if not len(hits):
+            hits = np.flatnonzero(categories.str.lower() == value.lower())
+        return np.isin(series.cat.codes.to_numpy(), hits)
+    mask = (series == value).to_numpy(dtype=bool, na_value=False)
+    if not mask.any():
+        mask = (series.str.lower() == value.lower()).to_numpy(dtype=bool, na_value=False)
+    return mask
+
+
+def _compare(series, op, value):
+    """Boolean mask for one comparison, computed column-wise"""
+    if op == "isnull":
+        return series.isna().to_numpy()
+    if op == "notnull":
+        return series.notna().to_numpy()
+    if op in ("in", "not in"):
+        values = [_coerce(series, v) for v in value]
+        if is_numeric_dtype(series) or is_datetime64_any_dtype(series):
+            mask = series.isin(values).to_numpy()
+        else:
+            mask = np.zeros(len(series), dtype=bool)
+            for v in values:
+                mask |= _text_equal(series, v)
+        return ~mask & series.notna().to_numpy() if op == "not in" else mask
+    if op == "between":
+        low, high = (_coerce(series, v) for v in value)
+        return _compare(series, ">=", low) & _compare(series, "<=", high)
+    if op == "contains":
+        return series.astype(str).str.contains(str(value), case=False, regex=False, na=False).to_numpy(dtype=bool)
+
+    value = _coerce(series, value)
+    text = not (is_numeric_dtype(series) or is_datetime64_any_dtype(series))
+    if text and op in ("==", "!="):
+        mask = _text_equal(series, value)
+        mask = ~mask if op == "!=" else mask
+    elif is_numeric_dtype(series) and not is_bool_dtype(series):
+        values = series.to_numpy(dtype=np.float64, na_value=np.nan)
+        if numexpr is not None and len(values) >= NUMEXPR_MIN_ROWS:
+            mask = numexpr.evaluate(f"values {op} value", local_dict={"values": values, "value": float(value)})
+        else:
+            mask = _COMPARE[op](values, value)
+    else:
+        try:
+            mask = _COMPARE[op](series, value).to_numpy(dtype=bool, na_value=False)
+        except TypeError:
+            raise FilterError(f"Can't compare {series.name} with '{value}' using {op}") from None
+    # As in SQL, a missing value matches no comparison, != included
+    return mask & series.notna().to_numpy() if op == "!=" else mask
+
+
+class FilterEngine:
+    """Evaluates filter expressions on one dataset with cached masks.
+
+    The masks of the most recent comparisons and sub-expressions are kept
+    by their canonical text, up to ``max_mask_bytes``, so repeating or
+    refining a filter reuses the work already done. The most recent
+    filtered views are kept as well.
+    """
+
+    def __init__(self, df, max_mask_bytes=MAX_MASK_BYTES):
+        self._frame = weakref.ref(df)
+        self.max_mask_bytes = max_mask_bytes
+        self._masks = OrderedDict()
+        self._mask_bytes = 0
+        self._views = OrderedDict()
+        self._lock = threading.Lock()
+
+    def mask(self, node):
+        key = format_expr(node)
+        with self._lock:
+            cached = self._masks.get(key)
+            if cached is not None:
+                self._masks.move_to_end(key)
+                return cached
+        df = self._frame()
+        if isinstance(node, BoolOp):
+            masks = [self.mask(item) for item in node.items]
+            combine = np.logical_and if node.op == "and" else np.logical_or
+            mask = combine.reduce(masks)
+        elif isinstance(node, Not):
+            mask = ~self.mask(node.item)
+        else:
+            mask = np.asarray(_compare(df[node.column], node.op, node.value), dtype=bool)
+        with self._lock:
+            if key not in self._masks and mask.nbytes <= self.max_mask_bytes:
+                self._masks[key] = mask
+                self._mask_bytes += mask.nbytes
+                while self._mask_bytes > self.max_mask_bytes:
+                    _, evicted = self._masks.popitem(last=False)
+                    self._mask_bytes -= evicted.nbytes
+        return mask
+
+    def view(self, node):
+        """The rows of the dataset matching ``node``"""
+        key = format_expr(node)
+        with self._lock:
+            if key in self._views:
+                self._views.move_to_end(key)
+                return self._views[key]
+        view = self._frame()[self.mask(node)].reset_index(drop=True)
+        with self._lock:
+            self._views[key] = view
+            while len(self._views) > MAX_CACHED_VIEWS:
+                self._views.popitem(last=False)
+        return view
+
+
+_engines = {}
+_engines_lock = threading.Lock()
+
+
+def _forget(key, engine):
+    with _engines_lock:
+        if _engines.get(key) is engine:
+            del _engines[key]
+
+
+def filtered(df, node):
+    """The rows of ``df`` matching ``node``; out-of-core frames push the condition down"""
+    if isinstance(df, pd.DataFrame):
+        return filter_engine(df).view(node)
+    return df.filter(node)
+
+
+def filter_engine(df):
+    """The FilterEngine of ``df``, kept for as long as ``df`` lives"""
+    with _engines_lock:
+        engine = _engines.get(id(df))
+    if engine is None or engine._frame() is not df:
+        engine = FilterEngine(df)
+        with _engines_lock:
+            _engines[id(df)] = engine
+        weakref.finalize(df, _forget, id(df), engine)
+    return engine
@@ -0,0 +1,177 @@
+import base64
+import html
+import io
+
+# Turns at the end of the transcript rendered as live, interactive elements
+LIVE_TURNS = 10
+# Rows of a DataFrame kept in a static snapshot
+SNAPSHOT_ROWS = 20
+SNAPSHOT_DPI = 80
+
+
+def _matplotlib_png(fig):
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format="png", dpi=SNAPSHOT_DPI, bbox_inches="tight")
+    return buffer.getvalue()
+
+
+def _plotly_png(fig):
+    """Static image of a plotly figure.
+
+    Uses kaleido when it is installed. Otherwise the bar, scatter and
+    heatmap traces the analysis commands produce are redrawn with
+    matplotlib; other figures have no snapshot.
+    """
+    try:
+        return fig.to_image(format="png", scale=1)
+    except (ImportError, ValueError, RuntimeError):
+        pass
+    import numpy as np
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    figure = Figure(figsize=(7, 4))
+    FigureCanvasAgg(figure)
+    ax = figure.add_subplot()
+    for trace in fig.data:
+        x, y = _values(trace.x), _values(trace.y)
+        if trace.type == "bar":
+            if x is not None and _is_numeric(x):
+                ax.bar(x, y, width=_values(trace.width) if trace.width is not None else 0.8)
+            else:
+                ax.bar([str(v) for v in x], y)
+        elif trace.type in ("scatter", "scattergl"):
+            ax.scatter(x, y, s=4)
+        elif trace.type == "heatmap":
+            z = np.asarray(_values(trace.z), dtype=np.float64)
+            if x is not None and y is not None and _is_numeric(x) and _is_numeric(y):
+                mesh = ax.pcolormesh(x, y, z, shading="auto")
+            else:
+                mesh = ax.imshow(z, aspect="auto")
+                if x is not None:
+                    ax.set_xticks(range(len(x)), [str(v) for v in x])
+                if y is not None:
+                    ax.set_yticks(range(len(y)), [str(v) for v in y])
+            figure.colorbar(mesh, ax=ax)
+        else:
+            return None
+    layout = fig.layout
+    title = layout.title.text or ""
+    ax.set_title(title.split("<br>")[0])
+    ax.set_xlabel(layout.xaxis.title.text or "")
+    ax.set_ylabel(layout.yaxis.title.text or "")
+    ax.tick_params(axis="x", labelrotation=45)
+    return _matplotlib_png(figure)
+
+
+def _values(values):
+    """Array of trace data, decoding the base64 typed arrays plotly's JSON uses"""
+    if isinstance(values, dict) and "bdata" in values:
+        import numpy as np
+
+        array = np.frombuffer(base64.b64decode(values["bdata"]), dtype=values["dtype"])
+        shape = values.get("shape")
+        if isinstance(shape, str):
+            shape = [int(n) for n in shape.split(",")]
+        return array.reshape(shape) if shape else array
+    return values
+
+
+def _is_numeric(values):
+    import numpy as np
+
+    return np.asarray(values).dtype.kind in "iuf"
+
+
+def figure_png(fig):
+    """PNG bytes of a plotly or matplotlib figure, or None"""
+    if hasattr(fig, "savefig"):
+        return _matplotlib_png(fig)
+    if hasattr(fig, "to_plotly_json"):
+        return _plotly_png(fig)
+    return None
+
+
+def _image_html(png):
+    encoded = base64.b64encode(png).decode("ascii")
+    return f'<img src="data:image/png;base64,{encoded}" style="max-width: 100%;">'
+
+
+def artifacts_snapshot(message, store):
+    """Static markdown/HTML for the figures, tables and code output of a message"""
+    parts = []
+    for ref in message.artifacts:
+        value = store.get(ref)
+        if ref.label:
+            parts.append(f"<p><em>{html.escape(ref.label)}</em></p>")
+        if ref.kind == "plotly":
+            png = figure_png(value)
+            parts.append(_image_html(png) if png else "<p><em>Chart not available in the condensed history</em></p>")
+        elif ref.kind == "png":
+            parts.append(_image_html(value))
+        elif ref.kind == "frame":
+            parts.append(value.head(SNAPSHOT_ROWS).to_html(border=0))
+            if len(value) > SNAPSHOT_ROWS:
+                parts.append(f"<p><em>{SNAPSHOT_ROWS} of {len(value)} rows</em></p>")
+        elif ref.kind in ("text", "error"):
+            parts.append(f"<pre>{html.escape(value)}</pre>")
+    return "\n\n".join(parts)
+
+
+def message_snapshot(message, store):
+    """Static markdown of a chat message with its artifacts.
+
+    The archive is rendered with HTML allowed, for the images and tables of
+    the artifacts, so the message text itself is escaped.
+    """
+    label = "**You:**" if message.role == "user" else "**DataWhisperer:**"
+    parts = [f"{label} {html.escape(message.content, quote=False)}", artifacts_snapshot(message, store)]
+    return "\n\n".join(part for part in parts if part)
+
+
+class TranscriptView:
+    """Splits a chat transcript into a static archive and a live tail.
+
+    Only the last ``live_turns`` turns (a user message and the replies to
+    it) are rendered as Streamlit elements. Older messages are converted
+    once, when they leave the live window, into static markdown with
+    figures as inline PNG images. The snapshots are kept in the session's
+    ArtifactStore, so they count against its memory cap and spill to disk
+    like any other artifact, and a rerun costs the same after 500 turns as
+    after 5. ``snapshot(message, store)`` turns a message into markdown.
+    """
+
+    def __init__(self, store, live_turns=LIVE_TURNS, snapshot=message_snapshot):
+        self.store = store
+        self.live_turns = live_turns
+        self.snapshot = snapshot
+        self._archived = []
+        self._parts = []
+
+    def _live_start(self, messages):
+        turns = 0
+        for i in range(len(messages) - 1, -1, -1):
+            if messages[i].role == "user":
+                turns += 1
+                if turns == self.live_turns:
+                    return i
+        return 0
+
+    def split(self, messages):
+        """Return (number of archived messages, live messages)"""
+        start = self._live_start(messages)
+        if len(self._archived) > start or any(a is not m for a, m in zip(self._archived, messages)):
+            # The history was cleared or rewritten; rebuild the archive
+            self.store.discard(self._parts)
+            self._archived, self._parts = [], []
+        for message in messages[len(self._archived):start]:
+            self._archived.append(message)
+            self._parts.append(self.store.put(self.snapshot(message, self.store), kind="snapshot"))
+        live = messages[start:]
+        # Every rerun renders the live artifacts; keep them decoded
+        self.store.pin(ref for message in live for ref in message.artifacts)
+        return len(self._archived), live
+
+    def archive(self):
+        """Markdown of the archived messages"""
+        return "\n\n---\n\n".join(self.store.get(ref) for ref in self._parts)
@@ -0,0 +1,111 @@
+"""Startup import benchmark for the Streamlit entry points.
+
+Runs the top-level imports of an entry script in a fresh interpreter under
+``python -X importtime`` and reports how long they took and which heavy
+packages they pulled in. Used as a regression guard for cold start:
+
+    python -m datawhisperer.importtime            # check the default budgets
+    python -m datawhisperer.importtime main.py --budget-ms 1200 --top 15
+"""
+import argparse
+import ast
+import os
+import subprocess
+import sys
+from collections import namedtuple
+
+ImportTiming = namedtuple("ImportTiming", ["module", "self_us", "cumulative_us", "depth"])
+Report = namedtuple("Report", ["script", "total_ms", "timings", "heavy", "error"])
+
+# Packages that must stay off the startup path of each entry point
+HEAVY_PACKAGES = ("pandas", "pyarrow", "matplotlib", "seaborn", "plotly.express",
+                  "langchain_experimental", "langchain_google_genai", "duckdb", "polars")
+
+# Entry script -> (import time budget in ms, packages it must not import at startup)
+BUDGETS = {
+    "main.py": (1500, HEAVY_PACKAGES),
+}
+
+
+def startup_imports(script):
+    """Source of the module-level import statements of ``script``"""
+    with open(script, encoding="utf-8") as fh:
+        tree = ast.parse(fh.read(), filename=script)
+    return "\n".join(ast.unparse(node) for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom)))
+
+
+def parse_importtime(stderr):
+    """ImportTiming rows from ``-X importtime`` output"""
+    timings = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        depth = (len(name) - len(name.lstrip(" ")) - 1) // 2
+        timings.append(ImportTiming(name.strip(), int(self_us), int(cumulative_us), depth))
+    return timings
+
+
+def _run(code, cwd):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [cwd, os.environ.get("PYTHONPATH")])))
+    return subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                          capture_output=True, text=True, cwd=cwd, env=env)
+
+
+def measure(script):
+    """Report on the startup imports of ``script``, excluding interpreter start"""
+    cwd = os.path.dirname(os.path.abspath(script))
+    baseline = {t.module for t in parse_importtime(_run("pass", cwd).stderr)}
+    result = _run(startup_imports(script), cwd)
+    timings = [t for t in parse_importtime(result.stderr) if t.module not in baseline]
+    total_ms = sum(t.cumulative_us for t in timings if t.depth == 0) / 1000
+    loaded = {t.module for t in timings}
+    heavy = sorted(p for p in HEAVY_PACKAGES if p in loaded)
+    error = None
+    if result.returncode != 0:
+        error = (result.stderr.strip().splitlines() or ["import failed"])[-1]
+    return Report(script, total_ms, timings, heavy, error)
+
+
+def check(report, budget_ms, forbidden=HEAVY_PACKAGES):
+    """Problems with a report against a time budget and forbidden packages"""
+    problems = []
+    if report.error:
+        problems.append(f"{report.script}: imports failed: {report.error}")
+    if report.total_ms > budget_ms:
+        problems.append(f"{report.script}: startup imports took {report.total_ms:.0f} ms, budget {budget_ms} ms")
+    for package in report.heavy:
+        if package in forbidden:
+            problems.append(f"{report.script}: {package} is imported at startup")
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("scripts", nargs="*", help="entry scripts (default: the ones with a budget)")
+    parser.add_argument("--budget-ms", type=float, help="override the time budget")
+    parser.add_argument("--top", type=int, default=10, help="show the slowest N top-level imports")
+    args = parser.parse_args(argv)
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    scripts = args.scripts or [os.path.join(root, name) for name in BUDGETS]
+    problems = []
+    for script in scripts:
+        budget_ms, forbidden = BUDGETS.get(os.path.basename(script), (float("inf"), ()))
+        if args.budget_ms is not None:
+            budget_ms = args.budget_ms
+        report = measure(script)
+        print(f"{os.path.basename(script)}: {report.total_ms:.0f} ms of startup imports")
+        top = sorted((t for t in report.timings if t.depth == 0), key=lambda t: -t.cumulative_us)
+        for t in top[:args.top]:
+            print(f"  {t.cumulative_us / 1000:8.1f} ms  {t.module}")
+        if report.heavy:
+            print(f"  heavy packages loaded: {', '.join(report.heavy)}")
+        problems.extend(check(report, budget_ms, forbidden))
+    for problem in problems:
+        print(f"FAIL {problem}", file=sys.stderr)
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,221 @@
+import io
+import os
+import warnings
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import (is_datetime64_any_dtype, is_float_dtype, is_integer_dtype, is_object_dtype,
+                              is_string_dtype, union_categoricals)
+
+from datawhisperer import tracing
+
+# Memory a single parsed upload may take, overridable per deployment
+DEFAULT_MEMORY_BUDGET = int(os.environ.get("DATAWHISPERER_MEMORY_BUDGET_MB", 1024)) * 1024 ** 2
+
+HEAD_BYTES = 4 * 1024 ** 2
+SAMPLE_ROWS = 10_000
+CHUNK_ROWS = 250_000
+
+
+class MemoryBudgetExceeded(Exception):
+    """Raised when a file would not fit in the configured memory budget"""
+
+
+def _source_size(source):
+    if isinstance(source, (str, os.PathLike)):
+        return os.path.getsize(source)
+    size = getattr(source, "size", None)
+    if size is None:
+        pos = source.tell()
+        size = source.seek(0, io.SEEK_END)
+        source.seek(pos)
+    return size
+
+
+def _read_head(source):
+    """Read the first complete lines of a file, up to HEAD_BYTES"""
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as fh:
+            head = fh.read(HEAD_BYTES)
+    else:
+        source.seek(0)
+        head = source.read(HEAD_BYTES)
+        source.seek(0)
+    if len(head) == HEAD_BYTES and b"\n" in head:
+        head = head[:head.rindex(b"\n") + 1]
+    return head
+
+
+def _exact_float32(values):
+    """True when every value of a float column survives the round trip through float32"""
+    values = values.to_numpy(dtype=np.float64)
+    back = values.astype(np.float32).astype(np.float64)
+    return bool(((back == values) | (np.isnan(back) & np.isnan(values))).all())
+
+
+def _parse_dates(values):
+    """``values`` parsed as datetimes, or None when any non-null value doesn't parse"""
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        parsed = pd.to_datetime(values, errors="coerce")
+    return parsed if parsed.notna().sum() == values.notna().sum() else None
+
+
+def infer_dtypes(sample, category_ratio=0.5):
+    """Pick a compact target type for each column of a sample frame.
+
+    Returns a dict mapping column name to one of ``"integer"``, ``"float32"``,
+    ``"category"`` or ``"datetime"``. Columns that should keep the parser's
+    type are left out. Conversions are lossless: floats are only narrowed
+    and text only parsed as dates when every value of the sample converts
+    exactly, and apply_dtypes checks every chunk again.
+    """
+    plan = {}
+    for col in sample.columns:
+        values = sample[col]
+        non_null = values.dropna()
+        if is_integer_dtype(values):
+            plan[col] = "integer"
+        elif is_float_dtype(values):
+            if _exact_float32(values):
+                plan[col] = "float32"
+        elif (is_object_dtype(values) or is_string_dtype(values)) and len(non_null):
+            if _parse_dates(non_null) is not None:
+                plan[col] = "datetime"
+            elif non_null.nunique() <= category_ratio * len(non_null):
+                plan[col] = "category"
+    return plan
+
+
+def apply_dtypes(df, plan):
+    """Convert the columns of ``df`` in place according to ``plan``.
+
+    A float32 or datetime conversion that would lose values, such as an id
+    float32 can't represent or text that isn't a date, leaves the column as
+    it is.
+    """
+    for col, kind in plan.items():
+        if col not in df.columns:
+            continue
+        if kind == "integer":
+            if is_integer_dtype(df[col]):
+                df[col] = pd.to_numeric(df[col], downcast="integer")
+        elif kind == "float32":
+            if (is_float_dtype(df[col]) or is_integer_dtype(df[col])) and _exact_float32(df[col]):
+                df[col] = df[col].astype(np.float32)
+        elif kind == "datetime":
+            parsed = _parse_dates(df[col])
+            if parsed is not None:
+                df[col] = parsed
+        elif kind == "category":
+            df[col] = df[col].astype("category")
+    return df
+
+
+def _concat(chunks, plan):
+    """Concatenate chunks, keeping categorical columns categorical"""
+    if len(chunks) == 1:
+        return chunks[0].reset_index(drop=True)
+    for col, kind in plan.items():
+        if kind != "category":
+            continue
+        parts = [chunk[col] for chunk in chunks if isinstance(chunk[col].dtype, pd.CategoricalDtype)]
+        if len(parts) != len(chunks):
+            continue
+        dtype = pd.CategoricalDtype(union_categoricals(parts).categories)
+        for chunk in chunks:
+            chunk[col] = chunk[col].astype(dtype)
+    return pd.concat(chunks, ignore_index=True)
+
+
+def estimate_memory(source, sample_rows=SAMPLE_ROWS, **read_kwargs):
+    """Estimate the optimized in-memory size of a CSV from its first rows.
+
+    Returns ``(estimated_bytes, plan, sample)``.
+    """
+    head = _read_head(source)
+    sample = pd.read_csv(io.BytesIO(head), nrows=sample_rows, **read_kwargs)
+    plan = infer_dtypes(sample)
+    optimized = apply_dtypes(sample.copy(), plan)
+    if sample.empty:
+        return 0, plan, sample
+    lines = max(head.count(b"\n") - 1, 1)
+    est_rows = _source_size(source) / (len(head) / lines)
+    per_row = optimized.memory_usage(index=True, deep=True).sum() / len(optimized)
+    return int(est_rows * per_row), plan, sample
+
+
+@tracing.traced("ingest.read_csv")
+def read_csv(source, memory_budget=None, on_exceed="sample", chunksize=CHUNK_ROWS,
+             sample_rows=SAMPLE_ROWS, random_state=0, sketches=None, **read_kwargs):
+    """Read a CSV in chunks with compact dtypes inferred from a sample.
+
+    ``source`` is a path or a binary file object such as a Streamlit upload.
+    When the estimated in-memory size goes over ``memory_budget``, the file
+    is either refused (``on_exceed="refuse"``) or uniformly sampled down to
+    fit (``on_exceed="sample"``). Details of the read are stored in
+    ``df.attrs["ingest"]``. A ``sketches.DatasetSketch`` passed as
+    ``sketches`` is updated with every chunk before sampling, so it
+    describes the whole file.
+    """
+    if memory_budget is None:
+        memory_budget = DEFAULT_MEMORY_BUDGET
+    estimated, plan, sample = estimate_memory(source, sample_rows, **read_kwargs)
+
+    fraction = 1.0
+    if estimated > memory_budget:
+        if on_exceed == "refuse":
+            raise MemoryBudgetExceeded(
+                f"File needs about {estimated / 1024 ** 2:.0f} MB in memory, "
+                f"over the {memory_budget / 1024 ** 2:.0f} MB budget")
+        fraction = memory_budget / estimated
+
+    if not isinstance(source, (str, os.PathLike)):
+        source.seek(0)
+    plan = dict(plan)
+    # The text of date columns is kept until the end, in case a later chunk
+    # holds a value that isn't a date and the column has to stay text
+    raw_dates = {col: [] for col, kind in plan.items() if kind == "datetime"}
+    chunks = []
+    rows_read = 0
+    with pd.read_csv(source, chunksize=chunksize, **read_kwargs) as reader:
+        for chunk in reader:
+            rows_read += len(chunk)
+            if fraction < 1.0 and sketches is None:
+                # Nothing needs the whole chunk, so only the kept rows are converted
+                chunk = chunk.sample(frac=fraction, random_state=random_state).sort_index()
+            originals = {col: chunk[col] for col in raw_dates if col in chunk.columns}
+            chunk = apply_dtypes(chunk, plan)
+            for col in originals:
+                if plan.get(col) == "datetime" and not is_datetime64_any_dtype(chunk[col]):
+                    del plan[col]
+                    if sketches is not None:
+                        sketches.columns.pop(col, None)
+            if sketches is not None:
+                unsketched = [col for col in raw_dates if col not in plan and col in chunk.columns]
+                sketches.update(chunk.drop(columns=unsketched) if unsketched else chunk)
+            if fraction < 1.0 and sketches is not None:
+                chunk = chunk.sample(frac=fraction, random_state=random_state).sort_index()
+            for col, original in originals.items():
+                raw_dates[col].append(original.loc[chunk.index])
+            chunks.append(chunk)
+    df = _concat(chunks, plan) if chunks else sample.iloc[0:0]
+    for col, parts in raw_dates.items():
+        if col not in plan and parts:
+            df[col] = pd.concat(parts, ignore_index=True)
+    # Record the conversions that were applied to every chunk
+    plan = {col: kind for col, kind in plan.items()
+            if kind != "float32" or col not in df.columns or df[col].dtype == np.float32}
+
+    df.attrs["ingest"] = {
+        "rows_read": rows_read,
+        "rows_kept": len(df),
+        "sampled": fraction < 1.0,
+        "sample_fraction": fraction,
+        "estimated_bytes": estimated,
+        "dtype_plan": dict(plan),
+    }
+    span = tracing.current_span()
+    span.set("rows", len(df))
+    span.set("sampled", fraction < 1.0)
+    return df
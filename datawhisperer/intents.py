@@ -0,0 +1,81 @@
+import re
+from collections import namedtuple
+
+Intent = namedtuple("Intent", ["name", "keyword", "command", "tokens", "args", "handler"])
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(command):
+    """Lowercase word tokens of a command"""
+    return _TOKEN.findall(command.lower())
+
+
+class IntentRouter:
+    """Maps a command to the first matching intent in priority order.
+
+    Each intent is registered with a list of whole-word keywords (multi-word
+    keywords are allowed) and an optional argument extractor. All keywords
+    live in one table keyed by token tuples, so routing a command is a
+    single scan over its tokens however many intents are registered.
+    Intents registered earlier win when several of them match. An intent
+    registered with ``accept`` only matches when ``accept(args, keyword)``
+    is true for the extracted arguments; otherwise the next match is tried.
+    ``mask(tokens, **context)`` returns token positions that are never read
+    as keywords, such as the words of column names ("Top_Speed").
+    """
+
+    def __init__(self, mask=None):
+        self.mask = mask
+        self._intents = []
+        self._table = {}
+        self._max_words = 1
+
+    def register(self, name, keywords, handler=None, extract=None, priority=None, accept=None):
+        """Add an intent; lower ``priority`` wins, defaulting to registration order"""
+        if priority is None:
+            priority = len(self._intents)
+        entry = (priority, name, handler, extract, accept)
+        self._intents.append(entry)
+        for keyword in keywords:
+            words = tuple(tokenize(keyword))
+            self._table.setdefault(words, []).append(entry)
+            self._max_words = max(self._max_words, len(words))
+        return entry
+
+    def intent(self, name, keywords, extract=None, priority=None, accept=None):
+        """Decorator form of register() for handler functions"""
+        def decorator(handler):
+            self.register(name, keywords, handler, extract, priority, accept)
+            return handler
+        return decorator
+
+    def names(self):
+        return [entry[1] for entry in sorted(self._intents, key=lambda e: e[0])]
+
+    def route(self, command, **context):
+        """Return the Intent for ``command``, or None when nothing matches.
+
+        ``context`` (such as the available columns) is passed on to the
+        mask and to the intent's argument extractor.
+        """
+        tokens = tokenize(command)
+        masked = self.mask(tokens, **context) if self.mask else ()
+        matches = []
+        for i in range(len(tokens)):
+            for n in range(1, min(self._max_words, len(tokens) - i) + 1):
+                if any(j in masked for j in range(i, i + n)):
+                    continue
+                for entry in self._table.get(tuple(tokens[i:i + n]), ()):
+                    matches.append((entry, " ".join(tokens[i:i + n])))
+        # Stable sort: on equal priority the first keyword in the command wins
+        matches.sort(key=lambda m: m[0][0])
+        tried = set()
+        for (priority, name, handler, extract, accept), keyword in matches:
+            if (name, keyword) in tried:
+                continue
+            tried.add((name, keyword))
+            args = extract(command, tokens, keyword, **context) if extract else {}
+            if accept is None or accept(args, keyword):
+                return Intent(name, keyword, command, tokens, args, handler)
+        return None
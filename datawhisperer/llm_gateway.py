@@ -0,0 +1,310 @@
+import asyncio
+import concurrent.futures
+import hashlib
+import json
+import random
+import statistics
+import threading
+import time
+from collections import deque
+
+from datawhisperer import tracing
+from datawhisperer.context import estimate_tokens
+from datawhisperer.response_cache import chunk_text
+
+# Status codes worth another attempt: rate limiting and server-side failures
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+# Requests kept for the latency and throughput percentiles
+METRICS_WINDOW = 200
+
+_DONE = object()
+
+# Threads stepping the iterators of models without astream
+_sync_steps = concurrent.futures.ThreadPoolExecutor(thread_name_prefix="llm-stream")
+
+
+class LLMRequestError(Exception):
+    """An LLM request failed after all attempts"""
+
+
+class LLMTimeout(LLMRequestError, TimeoutError):
+    pass
+
+
+def request_key(messages):
+    """Identical message lists share a key, and therefore one in-flight call"""
+    text = json.dumps([[m["role"], m["content"]] for m in messages], ensure_ascii=False)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def is_retryable(error):
+    """Timeouts, dropped connections, rate limits and 5xx responses are retried"""
+    status = getattr(error, "status_code", None) or getattr(error, "code", None)
+    if isinstance(status, int):
+        return status in RETRYABLE_STATUS
+    return isinstance(error, (TimeoutError, ConnectionError))
+
+
+def backoff_delay(attempt, base=0.5, cap=8.0, rng=random):
+    """Full-jitter exponential backoff before retry number ``attempt`` (1-based)"""
+    return rng.uniform(0, min(cap, base * 2 ** (attempt - 1)))
+
+
+async def _chunks(llm, messages):
+    """Text chunks of a streamed answer from a chat model, async or not"""
+    if hasattr(llm, "astream"):
+        async for chunk in llm.astream(messages):
+            yield chunk_text(chunk)
+        return
+    # Synchronous models are stepped in a worker thread to keep the loop free
+    iterator = iter(llm.stream(messages))
+    step = None
+    try:
+        while True:
+            step = _sync_steps.submit(next, iterator, _DONE)
+            chunk = await asyncio.wrap_future(step)
+            if chunk is _DONE:
+                return
+            yield chunk_text(chunk)
+    finally:
+        close = getattr(iterator, "close", None)
+        if close is not None:
+            # On cancel or timeout a next() may still be running; the
+            # iterator is closed once it returns, which releases the connection
+            if step is None:
+                close()
+            else:
+                step.add_done_callback(lambda _: close())
+
+
+class GatewayMetrics:
+    """Counters and recent latency samples of an LLMGateway"""
+
+    def __init__(self):
+        self.queue_depth = 0
+        self.in_flight = 0
+        self.requests = 0
+        self.coalesced = 0
+        self.retries = 0
+        self.timeouts = 0
+        self.errors = 0
+        self.cancelled = 0
+        self.ttft = deque(maxlen=METRICS_WINDOW)
+        self.tokens_per_second = deque(maxlen=METRICS_WINDOW)
+
+    def snapshot(self):
+        ttft = list(self.ttft)
+        rates = list(self.tokens_per_second)
+        return {
+            "queue_depth": self.queue_depth,
+            "in_flight": self.in_flight,
+            "requests": self.requests,
+            "coalesced": self.coalesced,
+            "retries": self.retries,
+            "timeouts": self.timeouts,
+            "errors": self.errors,
+            "cancelled": self.cancelled,
+            "ttft_p50": statistics.median(ttft) if ttft else None,
+            "ttft_p95": statistics.quantiles(ttft, n=20)[-1] if len(ttft) >= 2 else (ttft[0] if ttft else None),
+            "tokens_per_second": statistics.mean(rates) if rates else None,
+        }
+
+
+class _Flight:
+    """One upstream call, fanned out to every session that asked the same thing"""
+
+    def __init__(self):
+        self.chunks = []
+        self.queues = []
+        self.task = None
+        self.first_token_at = None
+
+    def subscribe(self):
+        queue = asyncio.Queue()
+        for chunk in self.chunks:
+            queue.put_nowait(chunk)
+        self.queues.append(queue)
+        return queue
+
+    def unsubscribe(self, queue):
+        self.queues.remove(queue)
+        return not self.queues
+
+    def publish(self, item):
+        if item is not _DONE and not isinstance(item, BaseException):
+            self.chunks.append(item)
+        for queue in self.queues:
+            queue.put_nowait(item)
+
+
+class LLMGateway:
+    """Process-wide front door for streaming LLM calls.
+
+    Requests run on one asyncio loop in a background thread. A semaphore
+    caps how many calls are upstream at once and the rest wait in line.
+    Identical in-flight requests are coalesced into one call whose chunks
+    are fanned out to every caller, late joiners included. Each attempt is
+    bounded by ``first_token_timeout`` and the whole request by
+    ``timeout``. Transient failures before the first chunk are retried up
+    to ``max_attempts`` times with full-jitter exponential backoff; after
+    text has been streamed a failure is final, since a retry would repeat
+    it. When every caller of a call goes away, the call is cancelled.
+
+    ``llm`` is any chat model with ``astream`` or ``stream``; retries of
+    the model client itself should be turned off.
+    """
+
+    def __init__(self, llm, max_concurrency=4, timeout=120.0, first_token_timeout=30.0,
+                 max_attempts=3, backoff=0.5, max_backoff=8.0, retryable=is_retryable):
+        self.llm = llm
+        self.timeout = timeout
+        self.first_token_timeout = first_token_timeout
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.retryable = retryable
+        self.metrics = GatewayMetrics()
+        self._flights = {}
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="llm-gateway", daemon=True)
+        self._thread.start()
+
+    async def _attempt(self, flight, messages, deadline, started):
+        chunks = _chunks(self.llm, messages)
+        try:
+            first = True
+            while True:
+                remaining = deadline - time.monotonic()
+                wait = min(remaining, self.first_token_timeout) if first else remaining
+                if wait <= 0:
+                    raise LLMTimeout(f"No answer within {self.timeout:g}s")
+                try:
+                    text = await asyncio.wait_for(anext(chunks, _DONE), wait)
+                except asyncio.TimeoutError:
+                    self.metrics.timeouts += 1
+                    if first:
+                        raise LLMTimeout(f"No first token within {wait:g}s") from None
+                    raise LLMTimeout(f"No answer within {self.timeout:g}s") from None
+                if text is _DONE:
+                    return
+                if first:
+                    first = False
+                    flight.first_token_at = time.perf_counter()
+                    self.metrics.ttft.append(flight.first_token_at - started)
+                flight.publish(text)
+        finally:
+            await chunks.aclose()
+
+    async def _run(self, key, flight, messages):
+        started = time.perf_counter()
+        deadline = time.monotonic() + self.timeout
+        self.metrics.queue_depth += 1
+        waiting = True
+        try:
+            async with self._semaphore:
+                self.metrics.queue_depth -= 1
+                waiting = False
+                self.metrics.in_flight += 1
+                try:
+                    for attempt in range(1, self.max_attempts + 1):
+                        try:
+                            await self._attempt(flight, messages, deadline, started)
+                            break
+                        except Exception as e:
+                            final = (flight.chunks or attempt == self.max_attempts
+                                     or not self.retryable(e) or time.monotonic() >= deadline)
+                            if final:
+                                raise
+                            self.metrics.retries += 1
+                            await asyncio.sleep(backoff_delay(attempt, self.backoff, self.max_backoff))
+                finally:
+                    self.metrics.in_flight -= 1
+            if flight.chunks:
+                elapsed = time.perf_counter() - flight.first_token_at
+                if elapsed > 0:
+                    self.metrics.tokens_per_second.append(estimate_tokens("".join(flight.chunks)) / elapsed)
+            flight.publish(_DONE)
+        except asyncio.CancelledError:
+            self.metrics.cancelled += 1
+            raise
+        except Exception as e:
+            self.metrics.errors += 1
+            error = e if isinstance(e, LLMRequestError) else LLMRequestError(str(e) or type(e).__name__)
+            if error is not e:
+                error.__cause__ = e
+            flight.publish(error)
+        finally:
+            if waiting:
+                self.metrics.queue_depth -= 1
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+
+    async def astream(self, messages):
+        """Yield the text chunks of the answer to ``messages``"""
+        key = request_key(messages)
+        self.metrics.requests += 1
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = _Flight()
+            self._flights[key] = flight
+            flight.task = asyncio.create_task(self._run(key, flight, messages))
+        else:
+            self.metrics.coalesced += 1
+        queue = flight.subscribe()
+        try:
+            while True:
+                item = await queue.get()
+                if item is _DONE:
+                    return
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            # The last caller to leave cancels the upstream call
+            if flight.unsubscribe(queue) and not flight.task.done():
+                flight.task.cancel()
+
+    def stream(self, messages):
+        """Blocking iterator over ``astream`` for the Streamlit script thread.
+
+        Closing the iterator early, as Streamlit does when the user stops
+        or leaves the run, unsubscribes from the call.
+        """
+        chunks = self.astream(messages)
+        span = tracing.start_span("llm.stream", messages=len(messages))
+        started = time.perf_counter()
+        parts = 0
+
+        async def step():
+            return await anext(chunks, _DONE)
+
+        error = None
+        try:
+            while True:
+                item = asyncio.run_coroutine_threadsafe(step(), self._loop).result()
+                if item is _DONE:
+                    return
+                if not parts:
+                    span.set("llm.ttft_ms", round((time.perf_counter() - started) * 1000, 1))
+                parts += 1
+                yield item
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            span.set("llm.chunks", parts)
+            span.end(error if isinstance(error, Exception) else None)
+            asyncio.run_coroutine_threadsafe(chunks.aclose(), self._loop).result()
+
+    def complete(self, messages):
+        """The whole answer to ``messages`` as one string, with the retries and limits of stream()"""
+        return "".join(self.stream(messages))
+
+    def close(self):
+        def stop():
+            for flight in list(self._flights.values()):
+                flight.task.cancel()
+            self._loop.stop()
+        self._loop.call_soon_threadsafe(stop)
+        self._thread.join(5)
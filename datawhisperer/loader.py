@@ -0,0 +1,59 @@
+import contextvars
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from datawhisperer import tracing
+
+LoadResult = namedtuple("LoadResult", ["name", "df", "error", "seconds", "handle"], defaults=(None,))
+
+
+@tracing.traced("load_file")
+def load_file(uploaded_file, cache=None, read=None, store=None):
+    """Parse one upload, returning a LoadResult instead of raising.
+
+    With a ``store`` the upload is persisted there and the result carries
+    only its DatasetHandle, leaving ``df`` empty. ``read`` defaults to
+    ingest.read_csv.
+    """
+    if read is None:
+        # Imported on first load so pandas stays off the app's startup path
+        from datawhisperer.ingest import read_csv as read
+    start = time.perf_counter()
+    tracing.current_span().set("file.name", uploaded_file.name)
+    try:
+        if store is not None:
+            handle = store.ingest_upload(uploaded_file, read)
+            return LoadResult(uploaded_file.name, None, None, time.perf_counter() - start, handle)
+        if cache is not None:
+            df = cache.get_or_load(uploaded_file, read)
+        else:
+            df = read(uploaded_file)
+        return LoadResult(uploaded_file.name, df, None, time.perf_counter() - start)
+    except Exception as e:
+        tracing.current_span().set("error", f"{type(e).__name__}: {e}")
+        return LoadResult(uploaded_file.name, None, e, time.perf_counter() - start)
+
+
+class BackgroundLoader:
+    """Parses uploads concurrently on a bounded thread pool.
+
+    The pandas and pyarrow CSV parsers spend most of their time outside the
+    GIL, so threads overlap well without copying frames between processes.
+    """
+
+    def __init__(self, max_workers=4):
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="csv-loader")
+
+    def submit(self, uploaded_file, cache=None, read=None, store=None):
+        # The caller's context carries the trace and session into the worker thread
+        context = contextvars.copy_context()
+        return self._pool.submit(context.run, load_file, uploaded_file, cache, read, store)
+
+    def load_all(self, uploaded_files, cache=None, read=None, store=None):
+        """Parse several uploads and return their results in upload order"""
+        futures = [self.submit(f, cache, read, store) for f in uploaded_files]
+        return [future.result() for future in futures]
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,209 @@
+import io
+import itertools
+import os
+import shutil
+import tempfile
+import threading
+import weakref
+from collections import OrderedDict, namedtuple
+
+# Serialized artifacts a session keeps in memory before spilling to disk
+DEFAULT_MAX_BYTES = 32 * 1024 ** 2
+# Recently used artifacts kept deserialized besides the pinned ones of the live turns
+DECODED_CACHE_SIZE = 8
+
+ArtifactRef = namedtuple("ArtifactRef", ["id", "kind", "label", "nbytes"])
+
+class Message:
+    """One chat message; heavy results are kept in an ArtifactStore and referenced.
+
+    Supports ``message["role"]`` style access so it can be passed wherever
+    the plain ``{"role": ..., "content": ...}`` dicts are accepted.
+    """
+
+    __slots__ = ("role", "content", "artifacts")
+
+    def __init__(self, role, content, artifacts=()):
+        self.role = role
+        self.content = content
+        self.artifacts = tuple(artifacts)
+
+    def __getitem__(self, key):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def get(self, key, default=None):
+        return getattr(self, key, default) if key in self.__slots__ else default
+
+    def __repr__(self):
+        return f"Message({self.role!r}, {self.content[:40]!r}, artifacts={len(self.artifacts)})"
+
+
+def _encode(obj):
+    """(kind, bytes) for a figure, DataFrame, PNG image or text"""
+    import pandas as pd
+
+    if isinstance(obj, pd.DataFrame):
+        import pyarrow as pa
+
+        table = pa.Table.from_pandas(obj)
+        sink = pa.BufferOutputStream()
+        options = pa.ipc.IpcWriteOptions(compression="zstd" if pa.Codec.is_available("zstd") else None)
+        with pa.ipc.new_stream(sink, table.schema, options=options) as writer:
+            writer.write_table(table)
+        return "frame", sink.getvalue().to_pybytes()
+    if hasattr(obj, "to_plotly_json"):
+        return "plotly", obj.to_json(validate=False).encode("utf-8")
+    if hasattr(obj, "savefig"):
+        buffer = io.BytesIO()
+        obj.savefig(buffer, format="png", bbox_inches="tight")
+        return "png", buffer.getvalue()
+    if isinstance(obj, bytes):
+        return "png", obj
+    if isinstance(obj, str):
+        return "text", obj.encode("utf-8")
+    raise TypeError(f"Cannot store a {type(obj).__name__} as a chat artifact")
+
+
+def _decode(kind, data):
+    if kind == "frame":
+        import pyarrow as pa
+
+        return pa.ipc.open_stream(data).read_all().to_pandas()
+    if kind == "plotly":
+        import plotly.io
+
+        return plotly.io.from_json(data.decode("utf-8"), skip_invalid=True)
+    if kind in ("text", "error", "snapshot"):
+        return data.decode("utf-8")
+    return data
+
+
+class ArtifactStore:
+    """Per-session store of serialized chat artifacts with a memory cap.
+
+    Plotly figures are kept as JSON, matplotlib figures as PNG and
+    DataFrames as zstd-compressed Arrow IPC. Once the serialized artifacts
+    exceed ``max_bytes``, the least recently used ones are written to a
+    private spill directory and read back on demand, so a session's memory
+    stays bounded however many charts it asks for. The directory is
+    removed when the store is cleared or garbage collected.
+
+    Decoded objects of the artifacts passed to pin(), those of the turns
+    rendered live, stay cached so reruns don't decode them again; up to
+    DECODED_CACHE_SIZE other recently used ones are cached as well.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, spill_dir=None):
+        self.max_bytes = max_bytes
+        self._spill_root = spill_dir
+        self._spill_dir = None
+        self._memory = OrderedDict()
+        self._spilled = {}
+        self._decoded = OrderedDict()
+        self._pinned = set()
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.spilled_bytes = 0
+        self._finalizer = None
+
+    def _spill_path(self, artifact_id):
+        if self._spill_dir is None:
+            self._spill_dir = tempfile.mkdtemp(prefix="datawhisperer-artifacts-", dir=self._spill_root)
+            self._finalizer = weakref.finalize(self, shutil.rmtree, self._spill_dir, True)
+        return os.path.join(self._spill_dir, f"{artifact_id}.bin")
+
+    def _evict(self):
+        while self.bytes > self.max_bytes and len(self._memory) > 1:
+            artifact_id, data = self._memory.popitem(last=False)
+            path = self._spill_path(artifact_id)
+            with open(path, "wb") as fh:
+                fh.write(data)
+            self._spilled[artifact_id] = path
+            self.bytes -= len(data)
+            self.spilled_bytes += len(data)
+
+    def put(self, obj, label=None, kind=None):
+        """Store ``obj`` and return its ArtifactRef; ``kind`` overrides the detected one"""
+        detected, data = _encode(obj)
+        with self._lock:
+            artifact_id = next(self._ids)
+            self._memory[artifact_id] = data
+            self.bytes += len(data)
+            self._evict()
+        return ArtifactRef(artifact_id, kind or detected, label, len(data))
+
+    def _read(self, ref):
+        with self._lock:
+            data = self._memory.get(ref.id)
+            if data is not None:
+                self._memory.move_to_end(ref.id)
+                return data
+            path = self._spilled.get(ref.id)
+        if path is None:
+            raise KeyError(f"Artifact {ref.id} is not in this store")
+        with open(path, "rb") as fh:
+            return fh.read()
+
+    def get(self, ref):
+        """The stored object: a DataFrame, plotly Figure, PNG bytes or text"""
+        with self._lock:
+            if ref.id in self._decoded:
+                self._decoded.move_to_end(ref.id)
+                return self._decoded[ref.id]
+        value = _decode(ref.kind, self._read(ref))
+        with self._lock:
+            self._decoded[ref.id] = value
+            self._trim_decoded()
+        return value
+
+    def pin(self, refs):
+        """Keep the decoded objects of ``refs``, and only those, cached regardless of use"""
+        with self._lock:
+            self._pinned = {ref.id for ref in refs}
+            self._trim_decoded()
+
+    def _trim_decoded(self):
+        unpinned = [artifact_id for artifact_id in self._decoded if artifact_id not in self._pinned]
+        for artifact_id in unpinned[:max(len(unpinned) - DECODED_CACHE_SIZE, 0)]:
+            del self._decoded[artifact_id]
+
+    def discard(self, refs):
+        """Forget artifacts that are no longer referenced"""
+        with self._lock:
+            for ref in refs:
+                self._decoded.pop(ref.id, None)
+                self._pinned.discard(ref.id)
+                data = self._memory.pop(ref.id, None)
+                if data is not None:
+                    self.bytes -= len(data)
+                path = self._spilled.pop(ref.id, None)
+                if path is not None:
+                    self.spilled_bytes -= ref.nbytes
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+
+    def stats(self):
+        return {
+            "artifacts": len(self._memory) + len(self._spilled),
+            "bytes": self.bytes,
+            "spilled": len(self._spilled),
+            "spilled_bytes": self.spilled_bytes,
+            "max_bytes": self.max_bytes,
+        }
+
+    def clear(self):
+        """Drop every artifact and the spill directory"""
+        with self._lock:
+            self._memory.clear()
+            self._spilled.clear()
+            self._decoded.clear()
+            self._pinned.clear()
+            self.bytes = self.spilled_bytes = 0
+        if self._finalizer is not None:
+            self._finalizer()
+            self._spill_dir = None
@@ -0,0 +1,124 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import is_bool_dtype, is_datetime64_any_dtype, is_numeric_dtype
+
+from datawhisperer.columns import name_tokens
+from datawhisperer.context import estimate_tokens
+
+EXAMPLE_VALUES = 3
+MAX_CACHED_PROFILES = 64
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def _fmt(value):
+    if isinstance(value, (float, np.floating)):
+        return f"{value:.4g}"
+    if isinstance(value, pd.Timestamp):
+        return value.isoformat()
+    text = str(value)
+    return text if len(text) <= 30 else text[:27] + "..."
+
+
+def profile_column(series):
+    """Compact description of one column"""
+    non_null = series.dropna()
+    profile = {
+        "name": str(series.name),
+        "dtype": str(series.dtype),
+        "null_rate": float(series.isna().mean()) if len(series) else 0.0,
+        "distinct": int(non_null.nunique()),
+    }
+    if len(non_null) == 0:
+        return profile
+    if is_numeric_dtype(series) and not is_bool_dtype(series):
+        q = non_null.quantile([0.25, 0.5, 0.75])
+        profile.update(min=non_null.min(), max=non_null.max(), quantiles=q.tolist())
+        # Range and quartiles already describe continuous columns
+        if profile["distinct"] > 20:
+            return profile
+    elif is_datetime64_any_dtype(series):
+        profile.update(min=non_null.min(), max=non_null.max())
+    profile["examples"] = non_null.value_counts().index[:EXAMPLE_VALUES].tolist()
+    return profile
+
+
+def profile_frame(df):
+    return {
+        "rows": len(df),
+        "columns": [profile_column(df[col]) for col in df.columns],
+    }
+
+
+def get_profile(key, df):
+    """Profile ``df`` once per dataset version ``key`` and cache the result"""
+    with _cache_lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            return _cache[key]
+    profile = profile_frame(df)
+    with _cache_lock:
+        _cache[key] = profile
+        while len(_cache) > MAX_CACHED_PROFILES:
+            _cache.popitem(last=False)
+    return profile
+
+
+def describe_column(column):
+    parts = [f"- {column['name']} ({column['dtype']}): {column['null_rate']:.1%} null, {column['distinct']} distinct"]
+    if "min" in column:
+        parts.append(f"range {_fmt(column['min'])} to {_fmt(column['max'])}")
+    if "quantiles" in column:
+        parts.append("quartiles " + "/".join(_fmt(v) for v in column["quantiles"]))
+    if column.get("examples"):
+        parts.append("e.g. " + ", ".join(_fmt(v) for v in column["examples"]))
+    return "; ".join(parts)
+
+
+def relevance(column_name, question_tokens):
+    """How many of the question's words appear in a column name"""
+    return len(set(name_tokens(column_name)) & question_tokens)
+
+
+def render_digest(name, profile, question="", max_tokens=1500):
+    """Render a profile as prompt text that stays within ``max_tokens``.
+
+    When not every column fits, columns whose names share words with the
+    question are described first, then the rest in their original order;
+    columns left over are listed by name only, as far as the budget allows.
+    """
+    columns = profile["columns"]
+    header = f"DataFrame '{name}': {profile['rows']} rows x {len(columns)} columns."
+    lines = [describe_column(c) for c in columns]
+    if estimate_tokens("\n".join([header] + lines)) <= max_tokens:
+        return "\n".join([header] + lines)
+
+    question_tokens = set(name_tokens(question))
+    order = sorted(range(len(columns)), key=lambda i: -relevance(columns[i]["name"], question_tokens))
+    used = estimate_tokens(header)
+    kept, skipped = [], []
+    for i in order:
+        cost = estimate_tokens(lines[i]) + 1
+        if used + cost <= max_tokens * 0.8:
+            kept.append(i)
+            used += cost
+        else:
+            skipped.append(i)
+
+    out = [header] + [lines[i] for i in sorted(kept)]
+    remaining = max_tokens - used
+    names = []
+    for i in sorted(skipped):
+        cost = estimate_tokens(columns[i]["name"]) + 1
+        if cost > remaining:
+            break
+        names.append(columns[i]["name"])
+        remaining -= cost
+    if skipped:
+        more = len(skipped) - len(names)
+        out.append(f"Other columns: {', '.join(names)}" + (f" and {more} more" if more else ""))
+    return "\n".join(out)
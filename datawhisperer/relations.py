@@ -0,0 +1,295 @@
+import os
+import threading
+from collections import OrderedDict, namedtuple
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import (is_bool_dtype, is_datetime64_any_dtype, is_float_dtype, is_integer_dtype,
+                              is_numeric_dtype)
+
+from datawhisperer import tracing
+from datawhisperer.columns import name_tokens
+from datawhisperer.sketches import MinHash
+
+# Estimated share of a column's values found in the other column for it to be a candidate key
+MIN_CONTAINMENT = 0.5
+# Distinct values / non-null rows above which a column counts as a key of its table
+MIN_KEY_UNIQUENESS = 0.95
+# Columns with fewer distinct values only pair up when their names match too
+MIN_KEY_DISTINCT = 20
+# Candidates reported per pair of tables; indexes are built for the best one
+MAX_CANDIDATES = 3
+# Name tokens that say "identifier" without saying of what
+GENERIC_TOKENS = {"id", "key", "code", "no", "nr", "num", "number", "uuid", "pk", "fk"}
+
+Relationship = namedtuple("Relationship", [
+    "left", "left_key", "right", "right_key", "score", "containment", "name_match",
+    "kind", "match_rate", "fan_out",
+])
+
+
+def _singular(token):
+    if token.endswith("ies") and len(token) > 4:
+        return token[:-3] + "y"
+    if token.endswith("s") and not token.endswith("ss") and len(token) > 3:
+        return token[:-1]
+    return token
+
+
+def _qualified_name(table, column):
+    """Name tokens of a column, prefixed with the table name when the column is just "id" or similar"""
+    tokens = name_tokens(column)
+    if tokens and all(token in GENERIC_TOKENS for token in tokens):
+        tokens = name_tokens(os.path.splitext(table)[0]) + tokens
+    return tuple(_singular(token) for token in tokens)
+
+
+def name_match(left_table, left_column, right_table, right_column):
+    """1 when the names agree (orders.customer_id and customers.id), 0.5 when they share a word, else 0"""
+    left = _qualified_name(left_table, left_column)
+    right = _qualified_name(right_table, right_column)
+    if left == right:
+        return 1.0
+    return 0.5 if (set(left) & set(right)) - GENERIC_TOKENS else 0.0
+
+
+def key_type(series):
+    """Which columns ``series`` can be joined with: "number", "text", "datetime", or None if it can't be a key"""
+    if is_bool_dtype(series):
+        return None
+    if is_datetime64_any_dtype(series):
+        return "datetime"
+    if is_integer_dtype(series):
+        return "number"
+    if is_float_dtype(series):
+        values = series.dropna()
+        return "number" if len(values) and (values == np.round(values)).all() else None
+    if is_numeric_dtype(series):
+        return None
+    return "text"
+
+
+class HashIndex:
+    """Hash table from the values of a key column to the rows holding them.
+
+    Built once per dataset column: the distinct values go into a pandas
+    Index, whose hash table is reused by every lookup, and the row
+    positions are grouped by value so that a probe gathers all matches
+    of a left row with one slice.
+    """
+
+    def __init__(self, series):
+        codes, uniques = pd.factorize(series, use_na_sentinel=True)
+        self.values = pd.Index(uniques)
+        self.rows = len(series)
+        self.counts = np.bincount(codes[codes >= 0], minlength=len(uniques))
+        self.offsets = np.concatenate([[0], np.cumsum(self.counts)])
+        order = np.argsort(codes, kind="stable")
+        self.positions = order[len(codes) - int(self.counts.sum()):]
+        # Build the value hash table now rather than on the first probe
+        self.values.get_indexer(self.values[:1])
+
+    @property
+    def unique(self):
+        return not len(self.counts) or int(self.counts.max()) <= 1
+
+    @property
+    def nbytes(self):
+        return int(self.values.memory_usage(deep=True) + self.counts.nbytes + self.offsets.nbytes
+                   + self.positions.nbytes)
+
+    def codes(self, values):
+        """Position of each of ``values`` among the distinct keys, -1 where absent"""
+        return self.values.get_indexer(values)
+
+    def match_counts(self, values):
+        """Rows of the indexed column matching each of ``values``"""
+        codes = self.codes(values)
+        return np.where(codes >= 0, self.counts[codes], 0)
+
+    def probe(self, values, keep_unmatched=False):
+        """(left, right) row positions of the inner join of ``values`` with the indexed column.
+
+        With ``keep_unmatched`` every position of ``values`` without a match
+        appears once, paired with -1, as in a left join.
+        """
+        codes = self.codes(values)
+        if self.unique:
+            # One row per key: positions[code] is the matching row
+            right = np.where(codes >= 0, self.positions[codes], -1)
+            left = np.arange(len(codes)) if keep_unmatched else np.flatnonzero(codes >= 0)
+            return left, right if keep_unmatched else right[left]
+        counts = np.where(codes >= 0, self.counts[codes], 0)
+        if keep_unmatched:
+            counts = np.maximum(counts, 1)
+        left = np.repeat(np.arange(len(codes)), counts)
+        starts = np.repeat(np.where(codes >= 0, self.offsets[codes], -1), counts)
+        within = np.arange(len(left)) - np.repeat(np.cumsum(counts) - counts, counts)
+        right = np.where(starts >= 0, self.positions[np.maximum(starts + within, 0)], -1)
+        return left, right
+
+
+class IndexCache:
+    """LRU cache of HashIndexes keyed by (dataset, column), bounded by their size in bytes.
+
+    Datasets are identified by a key that changes with their content, such
+    as the store digest, so an index never outlives the data it was built
+    from. Shared by all sessions of the process and guarded by a lock.
+    """
+
+    def __init__(self, max_bytes=512 * 1024 ** 2):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.nbytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, dataset, column, series):
+        """The index of ``series`` (column ``column`` of ``dataset``), built on a miss"""
+        key = (dataset, column)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            self.misses += 1
+        with tracing.span("relations.build_index", column=str(column), rows=len(series)):
+            index = HashIndex(series)
+        size = index.nbytes
+        with self._lock:
+            if key not in self._entries and size <= self.max_bytes:
+                self._entries[key] = index
+                self.nbytes += size
+                while self.nbytes > self.max_bytes:
+                    _, evicted = self._entries.popitem(last=False)
+                    self.nbytes -= evicted.nbytes
+        return index
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries),
+                    "bytes": self.nbytes, "max_bytes": self.max_bytes}
+
+
+def join(left, right, left_on, right_on=None, how="inner", suffixes=("_x", "_y"), index=None):
+    """Join two DataFrames on one key column, like ``left.merge(right, how=how, ...)``.
+
+    ``index`` is a HashIndex of ``right[right_on]``; passing one from an
+    IndexCache skips hashing the right table again. Rows come out in the
+    order of ``left``. Only "inner" and "left" joins are supported, and
+    unlike in pandas, null keys never match each other.
+    """
+    right_on = left_on if right_on is None else right_on
+    if how not in ("inner", "left"):
+        raise ValueError(f"Unsupported join type: {how}")
+    if index is None:
+        index = HashIndex(right[right_on])
+    elif index.rows != len(right):
+        raise ValueError("The index was built for a different table")
+    left_rows, right_rows = index.probe(left[left_on], keep_unmatched=how == "left")
+
+    right = right.drop(columns=right_on) if right_on == left_on else right
+    overlap = set(left.columns) & set(right.columns)
+    left_part = left.take(left_rows).reset_index(drop=True)
+    right_part = right.take(np.maximum(right_rows, 0)).reset_index(drop=True)
+    if how == "left" and (right_rows < 0).any():
+        right_part = right_part.mask(pd.Series(right_rows < 0), axis=0)
+    left_part.columns = [f"{c}{suffixes[0]}" if c in overlap else c for c in left_part.columns]
+    right_part.columns = [f"{c}{suffixes[1]}" if c in overlap else c for c in right_part.columns]
+    return pd.concat([left_part, right_part], axis=1)
+
+
+def _columns(df, sketches):
+    """{column: (key type, MinHash, non-null rows)} for the columns that could be keys"""
+    columns = {}
+    for col in df.columns:
+        kind = key_type(df[col])
+        if kind is None:
+            continue
+        sketch = sketches[col] if sketches is not None and col in sketches else None
+        if sketch is not None and sketch.signature is not None:
+            columns[col] = (kind, sketch.signature, sketch.rows - sketch.nulls)
+        else:
+            columns[col] = (kind, MinHash.from_series(df[col]), int(df[col].notna().sum()))
+    return columns
+
+
+def _candidates(left, left_columns, right, right_columns):
+    """Possible keys between two tables, best first, as (score, containment, name match, columns)"""
+    found = []
+    for left_key, (left_kind, left_sig, left_rows) in left_columns.items():
+        for right_key, (right_kind, right_sig, right_rows) in right_columns.items():
+            if left_kind != right_kind or not left_rows or not right_rows:
+                continue
+            names = name_match(left, left_key, right, right_key)
+            left_distinct, right_distinct = left_sig.cardinality(), right_sig.cardinality()
+            if min(left_distinct, right_distinct) < MIN_KEY_DISTINCT and names < 1:
+                continue
+            # The side with the more unique values is the one being referenced
+            swapped = left_distinct / left_rows > right_distinct / right_rows
+            if swapped:
+                containment = right_sig.containment(left_sig)
+                unique = left_distinct / left_rows >= MIN_KEY_UNIQUENESS
+            else:
+                containment = left_sig.containment(right_sig)
+                unique = right_distinct / right_rows >= MIN_KEY_UNIQUENESS
+            # Many-to-many pairs (two "Region" columns) multiply rows rather than look them up
+            if containment < MIN_CONTAINMENT or not unique:
+                continue
+            score = 0.6 * containment + 0.4 * names
+            pair = (right, right_key, left, left_key) if swapped else (left, left_key, right, right_key)
+            found.append((score, containment, names, pair))
+    found.sort(key=lambda c: -c[0])
+    return found[:MAX_CANDIDATES]
+
+
+@tracing.traced("relations.find")
+def find_relationships(tables, index_cache=None):
+    """Candidate join keys between every pair of ``tables``, best first.
+
+    ``tables`` maps a table name to (dataset key, DataFrame, DatasetSketch
+    or None). Columns are paired up by key type, name and the overlap of
+    their values, estimated from MinHash signatures (the sketches' when
+    available). For the best pair of each two tables the key indexes are
+    built, or taken from ``index_cache``, to measure exactly how many rows
+    match and how many rows each row joins to.
+    """
+    index_cache = IndexCache() if index_cache is None else index_cache
+    names = list(tables)
+    columns = {name: _columns(tables[name][1], tables[name][2]) for name in names}
+    relationships = []
+    for i, a in enumerate(names):
+        for b in names[i + 1:]:
+            for rank, (score, containment, names_score, pair) in enumerate(_candidates(a, columns[a], b, columns[b])):
+                left, left_key, right, right_key = pair
+                kind = match_rate = fan_out = None
+                if rank == 0:
+                    left_dataset, left_df, _ = tables[left]
+                    right_dataset, right_df, _ = tables[right]
+                    left_index = index_cache.get(left_dataset, left_key, left_df[left_key])
+                    right_index = index_cache.get(right_dataset, right_key, right_df[right_key])
+                    kind = f"{'one' if left_index.unique else 'many'}-to-{'one' if right_index.unique else 'many'}"
+                    matches = right_index.match_counts(left_df[left_key])
+                    present = int(left_df[left_key].notna().sum())
+                    match_rate = float(np.count_nonzero(matches)) / present if present else 0.0
+                    fan_out = float(matches.sum()) / len(left_df) if len(left_df) else 0.0
+                relationships.append(Relationship(left, left_key, right, right_key, score, containment,
+                                                  names_score, kind, match_rate, fan_out))
+    relationships.sort(key=lambda r: (r.kind is None, -r.score))
+    return relationships
+
+
+def describe_relationship(r, variable=str):
+    """One line about a relationship, naming tables with ``variable`` (e.g. their DataFrame variables)"""
+    text = f"{variable(r.left)}.{r.left_key} -> {variable(r.right)}.{r.right_key}"
+    if r.kind is None:
+        return f"{text} (possible; about {r.containment:.0%} of values match)"
+    return (f"{text} ({r.kind}; {r.match_rate:.0%} of {variable(r.left)} rows match, "
+            f"{r.fan_out:.2f} joined rows per row)")
@@ -0,0 +1,193 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+
+DEFAULT_PATH = os.environ.get(
+    "DATAWHISPERER_RESPONSE_CACHE", os.path.join(tempfile.gettempdir(), "datawhisperer-responses.sqlite3"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    dataset TEXT NOT NULL,
+    context TEXT NOT NULL,
+    prompt TEXT NOT NULL,
+    response TEXT NOT NULL,
+    embedding BLOB,
+    created REAL NOT NULL,
+    last_used REAL NOT NULL,
+    latency REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_dataset ON responses (dataset, context);
+CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used);
+"""
+
+
+# Words in any script, and the operators that change what a question asks ("> 50000" vs "< 50000")
+_PROMPT_TOKENS = re.compile(r"\w+|[<>!=]=|[<>=+\-*/%^]", re.UNICODE)
+
+
+def normalize_prompt(prompt):
+    """Lowercase a prompt and drop punctuation other than operators, and extra whitespace"""
+    return " ".join(_PROMPT_TOKENS.findall(prompt.lower()))
+
+
+def conversation_key(turns, model, schema=()):
+    """Hash of the stable inputs an answer depends on besides the question and the data.
+
+    ``turns`` are the chat messages before the question, ``model`` the LLM
+    and ``schema`` the (column, dtype) pairs of the loaded datasets, so a
+    follow-up such as "why?" is only answered from the cache within the
+    same conversation. The system prompt is left out on purpose: it
+    carries the findings of the background EDA, which change while it runs.
+    """
+    preceding = [{"role": m["role"], "content": m["content"]} for m in turns]
+    return hashlib.sha256(json.dumps([model, preceding, schema], default=str).encode()).hexdigest()
+
+
+def chunk_text(chunk):
+    """Text of a streamed LLM chunk, which may be a message chunk or a string"""
+    content = getattr(chunk, "content", chunk)
+    if isinstance(content, list):
+        return "".join(part if isinstance(part, str) else part.get("text", "") for part in content)
+    return str(content)
+
+
+def replay(text, words_per_chunk=3, delay=0.0):
+    """Yield a cached response in small pieces so st.write_stream renders it as usual"""
+    words = re.findall(r"\S+\s*", text)
+    for i in range(0, len(words), words_per_chunk):
+        if delay:
+            time.sleep(delay)
+        yield "".join(words[i:i + words_per_chunk])
+
+
+class ResponseCache:
+    """Persistent cache of LLM answers keyed by dataset digest, conversation and prompt.
+
+    ``context`` is a conversation_key() of what precedes the prompt. Lookups
+    first try the exact normalized prompt. When an ``embed`` function is
+    given, a miss falls back to the most similar cached prompt for the same
+    dataset and context if its cosine similarity reaches ``threshold``. Entries expire
+    after ``ttl`` seconds and the least recently used ones are evicted beyond
+    ``max_entries``.
+    """
+
+    def __init__(self, path=DEFAULT_PATH, ttl=7 * 24 * 3600, max_entries=10_000, embed=None, threshold=0.92):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.embed = embed
+        self.threshold = threshold
+        self.hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        columns = [row[1] for row in self._db.execute("PRAGMA table_info(responses)")]
+        if columns and "context" not in columns:
+            # Entries from before answers were keyed by conversation can't be told apart; drop them
+            self._db.execute("DROP TABLE responses")
+        self._db.executescript(SCHEMA)
+
+    @staticmethod
+    def make_key(dataset, prompt, context=""):
+        return hashlib.sha256(f"{dataset}\0{context}\0{normalize_prompt(prompt)}".encode()).hexdigest()
+
+    def _embedding(self, prompt):
+        import numpy as np
+
+        vector = np.asarray(self.embed(normalize_prompt(prompt)), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _lookup_similar(self, dataset, prompt, context, now):
+        rows = self._db.execute(
+            "SELECT key, response, embedding, latency FROM responses "
+            "WHERE dataset = ? AND context = ? AND embedding IS NOT NULL AND created >= ?",
+            (dataset, context, now - self.ttl)).fetchall()
+        if not rows:
+            return None
+        import numpy as np
+
+        query = self._embedding(prompt)
+        matrix = np.vstack([np.frombuffer(row[2], dtype=np.float32) for row in rows])
+        scores = matrix @ query
+        best = int(np.argmax(scores))
+        if scores[best] < self.threshold:
+            return None
+        return rows[best][0], rows[best][1], rows[best][3]
+
+    def get(self, dataset, prompt, context=""):
+        """Return the cached response text, or None on a miss"""
+        now = time.time()
+        key = self.make_key(dataset, prompt, context)
+        with self._lock:
+            row = self._db.execute(
+                "SELECT response, latency FROM responses WHERE key = ? AND created >= ?",
+                (key, now - self.ttl)).fetchone()
+            if row is not None:
+                found = (key, row[0], row[1])
+            elif self.embed is not None:
+                found = self._lookup_similar(dataset, prompt, context, now)
+            else:
+                found = None
+            if found is None:
+                self.misses += 1
+                return None
+            self._db.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, found[0]))
+            self._db.commit()
+            self.hits += 1
+            self.saved_seconds += found[2]
+            return found[1]
+
+    def put(self, dataset, prompt, response, latency, context=""):
+        now = time.time()
+        embedding = self._embedding(prompt).tobytes() if self.embed is not None else None
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (self.make_key(dataset, prompt, context), dataset, context, normalize_prompt(prompt), response,
+                 embedding, now, now, latency))
+            self._db.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl,))
+            self._db.execute(
+                "DELETE FROM responses WHERE key IN ("
+                "SELECT key FROM responses ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,))
+            self._db.commit()
+
+    def stream(self, dataset, prompt, generate, context=""):
+        """Stream a response, replaying it from the cache when possible.
+
+        ``generate`` is called without arguments on a miss and must return
+        an iterator of LLM chunks; the full answer is cached once the stream
+        is exhausted.
+        """
+        cached = self.get(dataset, prompt, context)
+        if cached is not None:
+            yield from replay(cached)
+            return
+        start = time.perf_counter()
+        parts = []
+        for chunk in generate():
+            text = chunk_text(chunk)
+            parts.append(text)
+            yield text
+        self.put(dataset, prompt, "".join(parts), time.perf_counter() - start, context)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "saved_seconds": self.saved_seconds,
+        }
+
+    def clear(self):
+        with self._lock:
+            self._db.execute("DELETE FROM responses")
+            self._db.commit()
@@ -0,0 +1,261 @@
+import atexit
+import multiprocessing
+import os
+import queue
+import re
+import time
+from collections import namedtuple
+
+RunResult = namedtuple("RunResult", ["ok", "stdout", "error", "frames", "figures", "seconds"])
+
+# Limits applied to every snippet unless the pool is configured otherwise
+DEFAULT_CPU_SECONDS = 30
+DEFAULT_WALL_SECONDS = 60
+DEFAULT_MEMORY_BYTES = 2 * 1024 ** 3
+
+MAX_STDOUT_CHARS = 20_000
+MAX_RESULT_ROWS = 50
+MAX_FIGURES = 5
+
+_CODE_BLOCK = re.compile(r"```(?:python|py)\s*\n(.*?)```", re.DOTALL | re.IGNORECASE)
+
+
+class CPUTimeExceeded(Exception):
+    pass
+
+
+def extract_code(text):
+    """Python code blocks in an LLM answer"""
+    return [block.strip() for block in _CODE_BLOCK.findall(text) if block.strip()]
+
+
+def dataset_variable(name):
+    """Variable name a dataset is bound to in generated code, e.g. customers.csv -> customers_df"""
+    stem = os.path.splitext(name)[0]
+    stem = re.sub(r"\W+", "_", stem).strip("_").lower() or "data"
+    if stem[0].isdigit():
+        stem = f"_{stem}"
+    return f"{stem}_df"
+
+
+def _rss_bytes(pid):
+    try:
+        with open(f"/proc/{pid}/statm") as fh:
+            return int(fh.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def _worker_main(conn):
+    """Worker loop: import the analysis stack once, then run snippets on request"""
+    import contextlib
+    import io
+    import resource
+    import signal
+    import traceback
+
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    import numpy as np
+    import pandas as pd
+    import pyarrow as pa
+    import pyarrow.ipc
+
+    from datawhisperer.relations import IndexCache
+    from datawhisperer.relations import join as hash_join
+
+    def on_cpu_limit(signum, frame):
+        raise CPUTimeExceeded("CPU time limit exceeded")
+
+    signal.signal(signal.SIGXCPU, on_cpu_limit)
+    if int(pd.__version__.split(".")[0]) < 3:
+        # Always on from pandas 3; the shallow copies below rely on it
+        pd.set_option("mode.copy_on_write", True)
+    # Loaded datasets by path; only those of the current and previous run
+    # are kept, so a long-lived worker's RSS stays within memory_bytes
+    frames = {}
+    previous = set()
+    # The frames handed to the current run, by path
+    current = {}
+
+    def load(path):
+        # Datasets are memory-mapped Arrow files, opened once per worker.
+        # Each run gets its own shallow copy: under Copy-on-Write, code that
+        # changes it (dropna(inplace=True), df["x"] = ...) copies what it
+        # touches instead of changing the frame later runs see
+        if path not in frames:
+            table = pa.ipc.open_file(pa.memory_map(path)).read_all()
+            frames[path] = table.to_pandas(split_blocks=True, self_destruct=False)
+        current[path] = frames[path].copy(deep=False)
+        return current[path]
+
+    # Key indexes of the loaded datasets, kept for the life of the worker
+    indexes = IndexCache(max_bytes=256 * 1024 ** 2)
+
+    def join(left, right, left_on, right_on=None, how="inner", suffixes=("_x", "_y")):
+        right_on = left_on if right_on is None else right_on
+        path = next((path for path, frame in current.items() if frame is right), None)
+        index = None
+        if path is not None:
+            # A sample of the keys notices code that sorted or changed the dataset in place
+            sample = right[right_on].iloc[::max(len(right) // 1000, 1)]
+            version = (path, len(right), int(pd.util.hash_pandas_object(sample, index=False).sum()))
+            index = indexes.get(version, right_on, right[right_on])
+        return hash_join(left, right, left_on, right_on, how, suffixes, index=index)
+
+    def to_ipc(df):
+        sink = pa.BufferOutputStream()
+        table = pa.Table.from_pandas(df.head(MAX_RESULT_ROWS))
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return sink.getvalue().to_pybytes()
+
+    conn.send("ready")
+    while True:
+        job = conn.recv()
+        if job is None:
+            return
+        code, datasets, cpu_seconds = job
+        start = time.perf_counter()
+        namespace = {"pd": pd, "np": np, "plt": plt, "join": join}
+        stdout = io.StringIO()
+        error = None
+        used = resource.getrusage(resource.RUSAGE_SELF)
+        soft_cpu = int(used.ru_utime + used.ru_stime + cpu_seconds) + 1
+        _, hard_cpu = resource.getrlimit(resource.RLIMIT_CPU)
+        resource.setrlimit(resource.RLIMIT_CPU, (soft_cpu, hard_cpu))
+        current.clear()
+        for path in [path for path in frames if path not in previous and path not in datasets.values()]:
+            del frames[path]
+        previous = set(datasets.values())
+        try:
+            for name, path in datasets.items():
+                namespace[name] = load(path)
+            with contextlib.redirect_stdout(stdout):
+                exec(compile(code, "<generated>", "exec"), namespace)
+        except BaseException:
+            error = traceback.format_exc(limit=-3)
+        finally:
+            resource.setrlimit(resource.RLIMIT_CPU, (resource.RLIM_INFINITY, hard_cpu))
+
+        figures = []
+        for num in plt.get_fignums()[:MAX_FIGURES]:
+            buffer = io.BytesIO()
+            plt.figure(num).savefig(buffer, format="png", bbox_inches="tight")
+            figures.append(buffer.getvalue())
+        plt.close("all")
+
+        results = {}
+        for key, value in namespace.items():
+            if isinstance(value, pd.DataFrame) and key not in datasets and not key.startswith("_"):
+                try:
+                    results[key] = to_ipc(value)
+                except Exception:
+                    continue
+        conn.send({
+            "stdout": stdout.getvalue()[-MAX_STDOUT_CHARS:],
+            "error": error,
+            "frames": results,
+            "figures": figures,
+            "seconds": time.perf_counter() - start,
+        })
+
+
+class _Worker:
+    def __init__(self, ctx):
+        self.conn, child = ctx.Pipe()
+        self.process = ctx.Process(target=_worker_main, args=(child,), daemon=True)
+        self.process.start()
+        child.close()
+        self.ready = False
+
+    def wait_ready(self, timeout):
+        if not self.ready:
+            if not self.conn.poll(timeout):
+                raise TimeoutError("Sandbox worker did not start in time")
+            self.conn.recv()
+            self.ready = True
+
+    def kill(self):
+        if self.process.is_alive():
+            self.process.kill()
+        self.process.join(1)
+        self.conn.close()
+
+
+class SandboxPool:
+    """Warm pool of worker processes that run LLM-generated pandas code.
+
+    Workers start once with pandas, NumPy, pyarrow and matplotlib already
+    imported, so running a snippet costs a pipe round trip rather than an
+    interpreter start. Datasets are passed as paths to memory-mapped Arrow
+    files and never pickled. Each run is bounded by CPU time (RLIMIT_CPU),
+    wall-clock time and resident memory; a worker that breaks a limit is
+    killed and replaced. Results come back as stdout, up to 50 rows of
+    each DataFrame the code created, and the figures it drew as PNG.
+    Code can call ``join(left, right, left_on, right_on)``, which keeps the
+    key index of a dataset for later joins with it.
+
+    This isolates the app from crashes and runaway code. It is not a
+    security boundary for untrusted users.
+    """
+
+    def __init__(self, size=2, cpu_seconds=DEFAULT_CPU_SECONDS, wall_seconds=DEFAULT_WALL_SECONDS,
+                 memory_bytes=DEFAULT_MEMORY_BYTES, start_timeout=60):
+        self.cpu_seconds = cpu_seconds
+        self.wall_seconds = wall_seconds
+        self.memory_bytes = memory_bytes
+        self.start_timeout = start_timeout
+        self._ctx = multiprocessing.get_context("spawn")
+        self._idle = queue.Queue()
+        self._closed = False
+        for _ in range(size):
+            self._idle.put(_Worker(self._ctx))
+        atexit.register(self.close)
+
+    def _replace(self, worker):
+        worker.kill()
+        if not self._closed:
+            self._idle.put(_Worker(self._ctx))
+
+    def run(self, code, datasets=None):
+        """Run ``code`` with ``datasets`` ({variable: arrow path}) bound as DataFrames"""
+        import pyarrow as pa
+        import pyarrow.ipc
+
+        start = time.perf_counter()
+        worker = self._idle.get()
+        try:
+            worker.wait_ready(self.start_timeout)
+            worker.conn.send((code, dict(datasets or {}), self.cpu_seconds))
+            deadline = time.monotonic() + self.wall_seconds
+            while not worker.conn.poll(0.05):
+                if not worker.process.is_alive():
+                    raise RuntimeError("The sandbox worker exited while running the code")
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f"The code ran longer than {self.wall_seconds}s")
+                if _rss_bytes(worker.process.pid) > self.memory_bytes:
+                    raise MemoryError(f"The code used more than {self.memory_bytes // 1024 ** 2} MB of memory")
+            reply = worker.conn.recv()
+        except (TimeoutError, MemoryError, RuntimeError, EOFError, OSError) as e:
+            self._replace(worker)
+            return RunResult(False, "", str(e), {}, [], time.perf_counter() - start)
+        self._idle.put(worker)
+
+        frames = {name: pa.ipc.open_stream(data).read_all().to_pandas() for name, data in reply["frames"].items()}
+        return RunResult(reply["error"] is None, reply["stdout"], reply["error"], frames,
+                         reply["figures"], reply["seconds"])
+
+    def close(self):
+        self._closed = True
+        while True:
+            try:
+                worker = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                worker.conn.send(None)
+            except OSError:
+                pass
+            worker.kill()
@@ -0,0 +1,475 @@
+import base64
+import json
+import math
+import zlib
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import is_bool_dtype, is_datetime64_any_dtype, is_float_dtype, is_integer_dtype, is_numeric_dtype
+
+# 2**14 registers: 16 KB per column, about 0.8% standard error
+HLL_PRECISION = 14
+# KLL accuracy parameter: about 0.3% rank error at 99% confidence (so p99 is
+# somewhere between p98.7 and p99.3) in about 3,000 values per column
+KLL_K = 1000
+# Values tracked per column for top-k; counts are within N / (capacity + 1)
+TOPK_CAPACITY = 1024
+# Smallest value hashes kept per column as its MinHash signature; overlaps
+# between the value sets of two columns are within about 1/sqrt(k)
+MINHASH_K = 256
+
+
+def _hashes(series):
+    """64-bit hashes of the non-null values, independent of the column's storage dtype"""
+    values = series.dropna()
+    if is_bool_dtype(values):
+        values = values.astype(np.int64)
+    elif is_integer_dtype(values):
+        values = values.astype(np.int64)
+    elif is_float_dtype(values):
+        values = values.astype(np.float64)
+        # Whole numbers hash like integers, so 42.0 in a column with nulls matches 42
+        whole = (values == np.round(values)) & (values.abs() < 2.0 ** 63)
+        hashes = pd.util.hash_pandas_object(values, index=False).to_numpy(copy=True)
+        if whole.any():
+            hashes[whole.to_numpy()] = pd.util.hash_pandas_object(values[whole].astype(np.int64), index=False).to_numpy()
+        return hashes
+    return pd.util.hash_pandas_object(values, index=False).to_numpy()
+
+
+def _leading_zeros(words):
+    """Leading zero bits of each uint64, exact (a float log2 of the full word would round)"""
+    high = (words >> np.uint64(32)).astype(np.float64)
+    low = (words & np.uint64(0xFFFFFFFF)).astype(np.float64)
+    with np.errstate(divide="ignore"):
+        zeros = np.where(high > 0, 31 - np.floor(np.log2(high)), 63 - np.floor(np.log2(low)))
+    return np.where((high == 0) & (low == 0), 64, zeros).astype(np.int64)
+
+
+class HyperLogLog:
+    """Mergeable distinct-count sketch over 64-bit hashes"""
+
+    def __init__(self, precision=HLL_PRECISION, registers=None):
+        self.precision = precision
+        m = 1 << precision
+        self.registers = np.zeros(m, dtype=np.uint8) if registers is None else registers
+
+    def add_hashes(self, hashes):
+        if not len(hashes):
+            return self
+        p = self.precision
+        index = (hashes >> np.uint64(64 - p)).astype(np.int64)
+        rank = np.minimum(_leading_zeros(hashes << np.uint64(p)) + 1, 64 - p + 1).astype(np.uint8)
+        np.maximum.at(self.registers, index, rank)
+        return self
+
+    def merge(self, other):
+        if other.precision != self.precision:
+            raise ValueError("Can only merge HyperLogLogs of the same precision")
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    def estimate(self):
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / np.sum(np.ldexp(1.0, -self.registers.astype(np.int64)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if raw <= 2.5 * m and zeros:
+            # Linear counting is more accurate while many registers are empty
+            return m * math.log(m / zeros)
+        return raw
+
+    def relative_error(self):
+        """Standard error of estimate() as a fraction of the true count"""
+        return 1.04 / math.sqrt(len(self.registers))
+
+
+def _smallest_distinct(values, k):
+    """The ``k`` smallest distinct values, sorted, without sorting all of ``values``"""
+    m = 4 * k
+    while True:
+        part = np.sort(np.partition(values, m)[:m] if len(values) > m else values)
+        part = part[np.concatenate([[True], part[1:] != part[:-1]])] if len(part) else part
+        if len(part) >= k or len(values) <= m:
+            return part[:k]
+        m *= 4
+
+
+class MinHash:
+    """Bottom-k MinHash signature: the k smallest distinct value hashes of a column.
+
+    Those hashes are a uniform sample of the column's distinct values, so
+    two signatures estimate how much the value sets overlap. Columns with
+    fewer than k distinct values are represented exactly.
+    """
+
+    def __init__(self, k=MINHASH_K, hashes=None):
+        self.k = k
+        self.hashes = np.empty(0, dtype=np.uint64) if hashes is None else hashes
+
+    @classmethod
+    def from_series(cls, series):
+        return cls().add_hashes(_hashes(series))
+
+    @property
+    def full(self):
+        return len(self.hashes) >= self.k
+
+    def add_hashes(self, hashes):
+        if self.full:
+            hashes = hashes[hashes < self.hashes[-1]]
+        if len(hashes):
+            self.hashes = _smallest_distinct(np.concatenate([self.hashes, hashes]), self.k)
+        return self
+
+    def merge(self, other):
+        return self.add_hashes(other.hashes)
+
+    def cardinality(self):
+        """Estimated distinct values, exact below k"""
+        if not self.full:
+            return len(self.hashes)
+        return (self.k - 1) * 2.0 ** 64 / float(self.hashes[-1])
+
+    def containment(self, other):
+        """Estimated fraction of this column's distinct values that also occur in ``other``"""
+        sample = self.hashes
+        if other.full:
+            # Membership in ``other`` is only known below its largest kept hash
+            sample = sample[sample <= other.hashes[-1]]
+        if not len(sample):
+            return 0.0
+        return float(np.isin(sample, other.hashes, assume_unique=True).mean())
+
+
+class KLL:
+    """Mergeable quantile sketch (Karnin, Lang and Liberty).
+
+    Values are kept in a stack of compactors; the one at level h holds items
+    of weight 2**h. A full compactor is sorted and every other item, from a
+    random offset, moves up a level. Capacities shrink geometrically towards
+    the bottom, so the sketch holds about 3k values however many it has
+    seen, and the rank of any value is off by at most rank_error() * n with
+    high probability.
+    """
+
+    def __init__(self, k=KLL_K, seed=0):
+        self.k = k
+        self.levels = [np.empty(0)]
+        self.n = 0
+        self.min = math.inf
+        self.max = -math.inf
+        self._rng = np.random.default_rng(seed)
+
+    def _capacity(self, level):
+        depth = len(self.levels) - level - 1
+        return max(int(math.ceil(self.k * (2 / 3) ** depth)), 2)
+
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        if not len(values):
+            return self
+        self.n += len(values)
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self._compress()
+        return self
+
+    def _compress(self):
+        level = 0
+        while level < len(self.levels):
+            items = self.levels[level]
+            if len(items) >= self._capacity(level):
+                if level + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                items = np.sort(items)
+                # An odd item out stays behind, keeping the total weight exact
+                keep = items[len(items) - len(items) % 2:]
+                promoted = items[self._rng.integers(2):len(items) - len(items) % 2:2]
+                self.levels[level] = keep
+                self.levels[level + 1] = np.concatenate([self.levels[level + 1], promoted])
+            level += 1
+
+    def merge(self, other):
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0))
+        for level, items in enumerate(other.levels):
+            self.levels[level] = np.concatenate([self.levels[level], items])
+        self.n += other.n
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._compress()
+        return self
+
+    def _weighted(self):
+        values = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(items), 2.0 ** level) for level, items in enumerate(self.levels)])
+        order = np.argsort(values, kind="stable")
+        return values[order], np.cumsum(weights[order])
+
+    def quantiles(self, qs):
+        """Approximate values at the quantiles ``qs`` (fractions between 0 and 1)"""
+        qs = np.clip(np.asarray(qs, dtype=np.float64), 0.0, 1.0)
+        if not self.n:
+            return np.full(len(qs), np.nan)
+        values, cumulative = self._weighted()
+        positions = np.searchsorted(cumulative, qs * cumulative[-1], side="left")
+        result = values[np.minimum(positions, len(values) - 1)]
+        # The extremes are tracked exactly
+        result = np.where(qs <= 0, self.min, np.where(qs >= 1, self.max, result))
+        return result
+
+    def rank_error(self):
+        """Bound on the normalized rank error of quantiles(), at 99% confidence"""
+        return 2.296 / self.k ** 0.9723
+
+
+class FrequentItems:
+    """Mergeable Misra-Gries summary of the most frequent values.
+
+    Keeps at most ``capacity`` counters. When more are needed, the
+    (capacity + 1)-th largest count is subtracted from all of them and the
+    non-positive ones dropped. Every stored count is a lower bound that is
+    at most ``offset`` (the total subtracted, never more than
+    N / (capacity + 1)) below the true count, and every value more frequent
+    than ``offset`` is guaranteed to be kept.
+    """
+
+    def __init__(self, capacity=TOPK_CAPACITY):
+        self.capacity = capacity
+        self.counts = pd.Series(dtype=np.int64)
+        self.offset = 0
+        self.n = 0
+
+    def update_counts(self, counts):
+        """Fold in exact counts of a batch, as a Series indexed by value"""
+        self.n += int(counts.sum())
+        merged = self.counts.add(counts, fill_value=0) if len(self.counts) else counts
+        self._trim(merged.astype(np.int64))
+        return self
+
+    def update(self, series):
+        values = series.dropna()
+        if is_datetime64_any_dtype(values):
+            # Counted as integer nanoseconds; formatting each timestamp is far slower
+            values = pd.Series(values.to_numpy(dtype="datetime64[ns]").astype(np.int64))
+        counts = values.value_counts(sort=False)
+        if isinstance(counts.index, pd.CategoricalIndex):
+            counts = counts[counts > 0]
+            counts.index = counts.index.astype(object)
+        return self.update_counts(counts)
+
+    def _trim(self, counts):
+        if len(counts) > self.capacity:
+            cut = int(counts.nlargest(self.capacity + 1).iloc[-1])
+            counts = counts[counts > cut] - cut
+            self.offset += cut
+        self.counts = counts
+
+    def merge(self, other):
+        self.n += other.n
+        self.offset += other.offset
+        merged = self.counts.add(other.counts, fill_value=0) if len(self.counts) else other.counts.copy()
+        self._trim(merged.astype(np.int64))
+        return self
+
+    def top(self, k):
+        """DataFrame of the ``k`` most frequent values with bounds on their counts"""
+        top = self.counts.nlargest(k)
+        return pd.DataFrame({"value": top.index, "count ≥": top.to_numpy(),
+                             "count ≤": top.to_numpy() + self.offset})
+
+
+def _encode_array(array):
+    return base64.b64encode(np.ascontiguousarray(array).tobytes()).decode("ascii")
+
+
+def _decode_array(text, dtype):
+    return np.frombuffer(base64.b64decode(text), dtype=dtype).copy()
+
+
+def _scalar(value):
+    return value.item() if isinstance(value, np.generic) else value
+
+
+class ColumnSketch:
+    """Row, null, distinct, quantile and top-k sketches of one column"""
+
+    def __init__(self, kind):
+        # "numeric", "datetime" or "other"
+        self.kind = kind
+        self.rows = 0
+        self.nulls = 0
+        self.distinct = HyperLogLog()
+        self.quantiles = KLL() if kind in ("numeric", "datetime") else None
+        self.frequent = FrequentItems()
+        self.signature = MinHash()
+
+    @classmethod
+    def for_series(cls, series):
+        if is_datetime64_any_dtype(series):
+            return cls("datetime")
+        if is_numeric_dtype(series) and not is_bool_dtype(series):
+            return cls("numeric")
+        return cls("other")
+
+    def update(self, series):
+        self.rows += len(series)
+        self.nulls += int(series.isna().sum())
+        hashes = _hashes(series)
+        self.distinct.add_hashes(hashes)
+        if self.signature is not None:
+            self.signature.add_hashes(hashes)
+        if self.quantiles is not None:
+            values = series.dropna()
+            if self.kind == "datetime":
+                values = values.to_numpy(dtype="datetime64[ns]").astype(np.int64)
+            self.quantiles.update(values)
+        self.frequent.update(series)
+        return self
+
+    def merge(self, other):
+        self.rows += other.rows
+        self.nulls += other.nulls
+        self.distinct.merge(other.distinct)
+        if self.quantiles is not None and other.quantiles is not None:
+            self.quantiles.merge(other.quantiles)
+        self.frequent.merge(other.frequent)
+        if self.signature is not None and other.signature is not None:
+            self.signature.merge(other.signature)
+        else:
+            self.signature = None
+        return self
+
+    def quantile_values(self, qs):
+        values = self.quantiles.quantiles(qs)
+        if self.kind == "datetime":
+            return [pd.Timestamp(int(v)) if not np.isnan(v) else pd.NaT for v in values]
+        return values.tolist()
+
+    def to_dict(self):
+        data = {"kind": self.kind, "rows": self.rows, "nulls": self.nulls,
+                "hll": [self.distinct.precision, _encode_array(self.distinct.registers)]}
+        if self.quantiles is not None:
+            q = self.quantiles
+            data["kll"] = {"k": q.k, "n": q.n, "min": q.min, "max": q.max,
+                           "levels": [_encode_array(items) for items in q.levels]}
+        f = self.frequent
+        data["topk"] = {"capacity": f.capacity, "offset": f.offset, "n": f.n,
+                        "items": [[_scalar(v), int(c)] for v, c in f.counts.items()]}
+        if self.signature is not None:
+            data["minhash"] = [self.signature.k, _encode_array(self.signature.hashes)]
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(data["kind"])
+        sketch.rows, sketch.nulls = data["rows"], data["nulls"]
+        precision, registers = data["hll"]
+        sketch.distinct = HyperLogLog(precision, _decode_array(registers, np.uint8))
+        if "kll" in data:
+            q = KLL(data["kll"]["k"])
+            q.n, q.min, q.max = data["kll"]["n"], data["kll"]["min"], data["kll"]["max"]
+            q.levels = [_decode_array(items, np.float64) for items in data["kll"]["levels"]]
+            sketch.quantiles = q
+        f = FrequentItems(data["topk"]["capacity"])
+        f.offset, f.n = data["topk"]["offset"], data["topk"]["n"]
+        items = data["topk"]["items"]
+        f.counts = pd.Series([c for _, c in items], index=[v for v, _ in items], dtype=np.int64)
+        sketch.frequent = f
+        # Sketches written before signatures were added don't have one
+        if "minhash" in data:
+            k, hashes = data["minhash"]
+            sketch.signature = MinHash(k, _decode_array(hashes, np.uint64))
+        else:
+            sketch.signature = None
+        return sketch
+
+
+class DatasetSketch:
+    """Per-column sketches of a dataset, built in one streaming pass.
+
+    ingest.read_csv feeds every chunk to update() before any sampling, so
+    the sketches describe the whole file even when the frame kept in memory
+    is a sample. Sketches of chunks, or of files with the same columns,
+    combine with merge(). Distinct counts come from HyperLogLog, quantiles
+    from KLL and top values from Misra-Gries, each with a stated error
+    bound; all of them together take a few tens of KB per column. A MinHash
+    signature per column lets relations find join keys between datasets.
+    """
+
+    def __init__(self):
+        self.columns = {}
+
+    def update(self, df):
+        for col in df.columns:
+            series = df[col]
+            sketch = self.columns.get(col)
+            if sketch is None:
+                sketch = self.columns[col] = ColumnSketch.for_series(series)
+            sketch.update(series)
+        return self
+
+    @classmethod
+    def from_frame(cls, df, chunk_rows=1_000_000):
+        sketch = cls()
+        for start in range(0, max(len(df), 1), chunk_rows):
+            sketch.update(df.iloc[start:start + chunk_rows])
+        return sketch
+
+    def merge(self, other):
+        for col, sketch in other.columns.items():
+            if col in self.columns:
+                self.columns[col].merge(sketch)
+            else:
+                self.columns[col] = ColumnSketch.from_dict(sketch.to_dict())
+        return self
+
+    def __contains__(self, col):
+        return col in self.columns
+
+    def __getitem__(self, col):
+        return self.columns[col]
+
+    @property
+    def rows(self):
+        return max((sketch.rows for sketch in self.columns.values()), default=0)
+
+    def to_bytes(self):
+        payload = {str(col): sketch.to_dict() for col, sketch in self.columns.items()}
+        return zlib.compress(json.dumps(payload, default=str).encode("utf-8"))
+
+    @classmethod
+    def from_bytes(cls, data):
+        sketch = cls()
+        sketch.columns = {col: ColumnSketch.from_dict(d) for col, d in json.loads(zlib.decompress(data)).items()}
+        return sketch
+
+    # Answers with error bounds, as (value, bound) pairs
+
+    def distinct(self, col):
+        """(estimated distinct values of ``col``, relative standard error)"""
+        hll = self.columns[col].distinct
+        return hll.estimate(), hll.relative_error()
+
+    def quantiles(self, col, qs):
+        """[(quantile, value, low, high)] where the true value lies in [low, high]"""
+        sketch = self.columns[col]
+        if sketch.quantiles is None:
+            raise ValueError(f"{col} is not numeric")
+        eps = sketch.quantiles.rank_error()
+        qs = list(qs)
+        values = sketch.quantile_values(qs)
+        lows = sketch.quantile_values([q - eps for q in qs])
+        highs = sketch.quantile_values([q + eps for q in qs])
+        return list(zip(qs, values, lows, highs)), eps
+
+    def top(self, col, k):
+        """(DataFrame of the top ``k`` values with count bounds, rows seen)"""
+        sketch = self.columns[col]
+        top = sketch.frequent.top(k)
+        if sketch.kind == "datetime":
+            top["value"] = pd.to_datetime(top["value"].astype(np.int64))
+        return top, sketch.frequent.n
@@ -0,0 +1,283 @@
+import threading
+import weakref
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+# Values per block in the moments passes, bounding the float64 working copy to 128 MB
+BLOCK_VALUES = 16_000_000
+
+_engines = {}
+_engines_lock = threading.Lock()
+
+# Integer columns keep an exact count, sum, min and max (Python ints); mean
+# and std, like every float column's moments, come from float64 arithmetic
+ColumnMoments = namedtuple("ColumnMoments", ["count", "sum", "mean", "m2", "std", "min", "max"])
+
+_LOW_BITS = 0xFFFFFFFF
+
+
+def _blocks(frame, columns):
+    """float64 arrays of consecutive row blocks of ``frame[columns]``, converted one block at a time"""
+    rows = max(BLOCK_VALUES // max(len(columns), 1), 1)
+    for start in range(0, len(frame), rows):
+        yield frame[columns].iloc[start:start + rows].to_numpy(dtype=np.float64, na_value=np.nan)
+
+
+def _exact_sum(values):
+    """Sum of an int64 or uint64 array as a Python int, without overflow.
+
+    The 32-bit halves of the values are summed separately; neither sum
+    can overflow int64 for a block of BLOCK_VALUES values.
+    """
+    high = (values >> 32).sum(dtype=np.int64)
+    low = (values & _LOW_BITS).sum(dtype=np.int64)
+    return (int(high) << 32) + int(low)
+
+
+def _moments(n, total, mean, m2, lo, hi):
+    with np.errstate(invalid="ignore", divide="ignore"):
+        std = np.sqrt(max(m2, 0.0) / (n - 1)) if n > 1 else np.nan
+    return ColumnMoments(n, total, mean, m2, std, lo, hi)
+
+
+def merge_moments(a, b):
+    """Moments of the rows of both ``a`` and ``b`` (Chan et al.'s parallel update)"""
+    if not b.count:
+        return a
+    if not a.count:
+        return b
+    n = a.count + b.count
+    total = a.sum + b.sum
+    delta = b.mean - a.mean
+    if isinstance(total, int):
+        mean = total / n
+    else:
+        mean = a.mean + delta * (b.count / n)
+    m2 = a.m2 + b.m2 + delta * delta * (a.count * b.count / n)
+    return _moments(n, total, mean, m2, min(a.min, b.min), max(a.max, b.max))
+
+
+def column_moments(series):
+    """Count, sum, mean, sample standard deviation, min and max of a numeric column in one blocked pass"""
+    integer = pd.api.types.is_integer_dtype(series.dtype)
+    if integer:
+        dtype = np.uint64 if pd.api.types.is_unsigned_integer_dtype(series.dtype) else np.int64
+    moments = _moments(0, 0 if integer else 0.0, np.nan, 0.0, np.nan, np.nan)
+    rows = BLOCK_VALUES
+    for start in range(0, len(series), rows):
+        part = series.iloc[start:start + rows]
+        if integer:
+            exact = part.dropna().to_numpy(dtype=dtype)
+            if not len(exact):
+                continue
+            block = exact.astype(np.float64)
+            total, lo, hi = _exact_sum(exact), int(exact.min()), int(exact.max())
+            mean = total / len(exact)
+        else:
+            block = part.to_numpy(dtype=np.float64, na_value=np.nan)
+            block = block[~np.isnan(block)]
+            if not len(block):
+                continue
+            total, lo, hi = block.sum(), block.min(), block.max()
+            mean = total / len(block)
+        centered = block - mean
+        block_moments = _moments(len(block), total, mean, (centered * centered).sum(), lo, hi)
+        moments = merge_moments(moments, block_moments)
+    return moments
+
+
+class PairwiseMoments:
+    """Pairwise moments of a set of numeric columns, for correlations.
+
+    For every pair of columns (i, j) the rows where both are present give
+    the count ``n``, the sum and sum of squares of column i (``sx``,
+    ``sxx``) and the cross product ``sxy``, all taken around a fixed
+    per-column ``shift`` for numerical stability. These are k x k sums, so
+    they are only built when a correlation is asked for.
+    """
+
+    def __init__(self, columns, shift):
+        k = len(columns)
+        self.columns = list(columns)
+        self.shift = shift
+        self.n = np.zeros((k, k))
+        self.sx = np.zeros((k, k))
+        self.sxx = np.zeros((k, k))
+        self.sxy = np.zeros((k, k))
+
+    @classmethod
+    def from_frame(cls, frame, columns):
+        moments = None
+        for block in _blocks(frame, list(columns)):
+            if moments is None:
+                # The first present value of each column keeps the sums small
+                present = ~np.isnan(block)
+                first = block[present.argmax(axis=0), np.arange(block.shape[1])]
+                moments = cls(columns, np.where(present.any(axis=0), first, 0.0))
+            moments._add_block(block)
+        return moments if moments is not None else cls(columns, np.zeros(len(columns)))
+
+    def add_frame(self, frame):
+        """Fold in the rows of ``frame``, keeping the shift of the rows seen so far"""
+        for block in _blocks(frame, self.columns):
+            self._add_block(block)
+        return self
+
+    def _add_block(self, block):
+        mask = ~np.isnan(block)
+        centered = np.where(mask, block - self.shift, 0.0)
+        weights = mask.astype(np.float64)
+        self.n += weights.T @ weights
+        self.sx += centered.T @ weights
+        self.sxx += (centered * centered).T @ weights
+        self.sxy += centered.T @ centered
+
+    def corr(self):
+        with np.errstate(invalid="ignore", divide="ignore"):
+            cov = self.sxy - self.sx * self.sx.T / self.n
+            var = self.sxx - self.sx * self.sx / self.n
+            corr = cov / np.sqrt(var * var.T)
+        corr[self.n < 2] = np.nan
+        corr = np.clip(corr, -1.0, 1.0)
+        diag = np.diag_indices_from(corr)
+        corr[diag] = np.where(np.diag(var) > 0, 1.0, np.nan)
+        return corr
+
+
+class StatsEngine:
+    """Per-dataset statistics served from cached moments.
+
+    Each numeric column's moments are computed the first time a statistic
+    of that column is asked for, converting it to float64 one block at a
+    time, and memoized while the dataset lives. Integer sums, mins and
+    maxes are kept exact. describe() and aggregates are derived from the
+    moments; the pairwise sums behind the correlation matrix are only
+    built when corr() is called. append() folds new rows into both.
+    """
+
+    def __init__(self, df):
+        self._frame = weakref.ref(df)
+        self._memo = {}
+        self._dtypes = df.dtypes
+        self._numeric = list(df.select_dtypes(include=[np.number]).columns)
+        self.rows = len(df)
+
+    def _memoized(self, key, compute):
+        if key not in self._memo:
+            self._memo[key] = compute()
+        return self._memo[key]
+
+    def _frame_or_raise(self):
+        df = self._frame()
+        if df is None:
+            raise ValueError("The dataset of these statistics no longer exists")
+        return df
+
+    def column(self, col):
+        """ColumnMoments of one numeric column"""
+        return self._memoized(("column", col), lambda: column_moments(self._frame_or_raise()[col]))
+
+    def _values(self, field, cols):
+        return pd.Series([getattr(self.column(c), field) for c in cols], index=cols, dtype=np.float64)
+
+    def _exact(self, field, cols):
+        """Integer sums, mins or maxes as int64, or as Python ints when one overflows int64"""
+        values = [getattr(self.column(c), field) for c in cols]
+        if all(-2 ** 63 <= v < 2 ** 63 for v in values):
+            return pd.Series(values, index=cols, dtype=np.int64)
+        return pd.Series(values, index=cols, dtype=object)
+
+    def numeric_columns(self):
+        return list(self._numeric)
+
+    def null_counts(self):
+        return self._memoized("nulls", lambda: self._frame_or_raise().isnull().sum())
+
+    def _quantiles(self):
+        df = self._frame()
+        if df is None or not self._numeric:
+            return pd.DataFrame(np.nan, index=[0.25, 0.5, 0.75], columns=self._numeric)
+        return df[self._numeric].quantile([0.25, 0.5, 0.75])
+
+    def describe(self):
+        """Same layout as DataFrame.describe() for the numeric columns"""
+        def compute():
+            cols = self._numeric
+            q = self._memoized("quantiles", self._quantiles)
+            rows = [self._values(field, cols) for field in ("count", "mean", "std", "min")]
+            rows += [q.iloc[0], q.iloc[1], q.iloc[2], self._values("max", cols)]
+            return pd.DataFrame(np.vstack([np.asarray(r, dtype=np.float64) for r in rows]),
+                                index=["count", "mean", "std", "min", "25%", "50%", "75%", "max"],
+                                columns=cols)
+        return self._memoized("describe", compute)
+
+    def corr(self):
+        def compute():
+            cols = self._numeric
+            pairwise = self._memoized("pairwise", lambda: PairwiseMoments.from_frame(self._frame_or_raise(), cols))
+            return pd.DataFrame(pairwise.corr(), index=cols, columns=cols)
+        return self._memoized("corr", compute)
+
+    def agg(self, func, cols=None):
+        """Mean, sum, max, min or count of numeric columns from the moments"""
+        cols = self._numeric if cols is None else list(cols)
+        if func == "count":
+            return self._values("count", cols).astype(np.int64)
+        if func == "mean":
+            return self._values(func, cols)
+        # Like pandas, all-integer selections give integer results, which
+        # the moments keep exact
+        integer = [pd.api.types.is_integer_dtype(self._dtypes[c]) for c in cols]
+        if integer and all(integer) and (func == "sum" or all(self.column(c).count for c in cols)):
+            return self._exact(func, cols)
+        return self._values(func, cols)
+
+    def append(self, rows, frame=None):
+        """Fold ``rows`` into the statistics without rescanning the rows already seen.
+
+        The moments of each column and the pairwise sums of corr() are
+        updated from ``rows`` alone; the quantiles of describe() are
+        recomputed on next use. ``frame`` is the combined dataset.
+        """
+        if frame is not None:
+            self._frame = weakref.ref(frame)
+            _register(frame, self)
+        kept = {}
+        for key, value in self._memo.items():
+            if key[0] == "column":
+                kept[key] = merge_moments(value, column_moments(rows[key[1]]))
+            elif key == "nulls":
+                kept[key] = value.add(rows.isnull().sum(), fill_value=0).astype(np.int64)
+            elif key == "pairwise":
+                kept[key] = value.add_frame(rows)
+        self._memo = kept
+        self.rows += len(rows)
+        return self
+
+
+def _register(df, engine):
+    key = id(df)
+    with _engines_lock:
+        _engines[key] = engine
+    weakref.finalize(df, _forget, key, engine)
+
+
+def _forget(key, engine):
+    with _engines_lock:
+        if _engines.get(key) is engine:
+            del _engines[key]
+
+
+def stats_for(df):
+    """The StatsEngine of ``df``, created on first use and kept while ``df`` lives"""
+    if not isinstance(df, pd.DataFrame):
+        # Out-of-core frames compute their statistics with pushed-down queries
+        return df.stats()
+    with _engines_lock:
+        engine = _engines.get(id(df))
+    if engine is None or engine._frame() is not df:
+        engine = StatsEngine(df)
+        _register(df, engine)
+    return engine
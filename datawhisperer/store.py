@@ -0,0 +1,209 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from datawhisperer.upload_cache import file_key
+
+DEFAULT_ROOT = os.environ.get(
+    "DATAWHISPERER_STORE_DIR", os.path.join(tempfile.gettempdir(), "datawhisperer-store"))
+
+# Datasets nobody opened for this long are removed by gc()
+DEFAULT_MAX_IDLE = 24 * 3600
+# A dataset's mtime, which gc() reads as its last use, is refreshed at most this often
+TOUCH_INTERVAL = 60
+
+METADATA_KEY = b"datawhisperer"
+
+# Deserialized column sketches kept in memory, by dataset digest
+MAX_CACHED_SKETCHES = 16
+
+DatasetHandle = namedtuple("DatasetHandle", ["digest", "name", "path", "rows", "columns", "info"])
+
+
+def frame_digest(df):
+    """Content digest for a frame that did not come from an upload"""
+    import pandas as pd
+
+    digest = hashlib.sha256(",".join(map(str, df.columns)).encode())
+    digest.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+class DatasetStore:
+    """Content-addressed store of uploaded datasets as Arrow IPC files.
+
+    Each dataset is written once, uncompressed, under its content digest and
+    read back memory-mapped, so sessions and processes that open the same
+    upload share its pages through the OS page cache. Sessions keep only a
+    DatasetHandle and ask the store for the frame when they need it. The
+    column sketches built while parsing an upload are kept next to it.
+    """
+
+    def __init__(self, root=DEFAULT_ROOT, max_idle_seconds=DEFAULT_MAX_IDLE, frame_cache=None):
+        self.root = root
+        self.max_idle_seconds = max_idle_seconds
+        self.frame_cache = frame_cache
+        self._lock = threading.Lock()
+        self._sketches = OrderedDict()
+        self._touched = {}
+        os.makedirs(root, exist_ok=True)
+
+    def _touch(self, path):
+        """Mark a dataset as used now, so gc() keeps it; rate-limited to one utime per TOUCH_INTERVAL"""
+        now = time.monotonic()
+        with self._lock:
+            if now - self._touched.get(path, -TOUCH_INTERVAL) < TOUCH_INTERVAL:
+                return
+            self._touched[path] = now
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+
+    def path_for(self, digest):
+        return os.path.join(self.root, f"{digest}.arrow")
+
+    def contains(self, digest):
+        return os.path.exists(self.path_for(digest))
+
+    def put(self, df, digest, name, info=None, sketches=None):
+        """Persist ``df`` (and its DatasetSketch) under ``digest`` unless it is already stored"""
+        import pyarrow as pa
+
+        path = self.path_for(digest)
+        if sketches is not None and not os.path.exists(self.sketch_path_for(digest)):
+            self._write(self.sketch_path_for(digest), sketches.to_bytes())
+        if not os.path.exists(path):
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            meta = dict(table.schema.metadata or {})
+            meta[METADATA_KEY] = json.dumps({
+                "name": name,
+                "info": info or {},
+                "dtypes": [[str(col), str(dtype)] for col, dtype in df.dtypes.items()],
+            }, default=str).encode()
+            table = table.replace_schema_metadata(meta)
+            # Write to a temporary file first so readers never see a partial dataset
+            fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as sink:
+                    with pa.ipc.new_file(sink, table.schema) as writer:
+                        writer.write_table(table)
+                os.replace(tmp_path, path)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+        return self.handle(digest, name)
+
+    def handle(self, digest, name=None):
+        """Build a handle for a stored dataset from its file metadata"""
+        import pyarrow as pa
+
+        path = self.path_for(digest)
+        with pa.memory_map(path) as source:
+            reader = pa.ipc.open_file(source)
+            schema = reader.schema
+            rows = sum(reader.get_batch(i).num_rows for i in range(reader.num_record_batches))
+        meta = json.loads((schema.metadata or {}).get(METADATA_KEY, b"{}"))
+        if "dtypes" in meta:
+            columns = tuple((col, dtype) for col, dtype in meta["dtypes"])
+        else:
+            columns = tuple((field.name, str(field.type)) for field in schema)
+        return DatasetHandle(digest, name or meta.get("name", digest), path, rows, columns, meta.get("info", {}))
+
+    def ingest_upload(self, uploaded_file, read):
+        """Store an upload, parsing it with ``read`` only if its content is new.
+
+        ``read`` is called with a ``sketches`` keyword argument to fill in
+        while it parses, like ingest.read_csv.
+        """
+        from datawhisperer.sketches import DatasetSketch
+
+        name, _, digest = file_key(uploaded_file)
+        if self.contains(digest):
+            self._touch(self.path_for(digest))
+            return self.handle(digest, name)
+        sketches = DatasetSketch()
+        df = read(uploaded_file, sketches=sketches)
+        handle = self.put(df, digest, name, info=df.attrs.get("ingest"), sketches=sketches)
+        self.gc()
+        return handle
+
+    def sketch_path_for(self, digest):
+        return os.path.join(self.root, f"{digest}.sketches")
+
+    def _write(self, path, data):
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as sink:
+                sink.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def sketches(self, handle):
+        """The DatasetSketch built when the dataset was ingested, or None"""
+        from datawhisperer.sketches import DatasetSketch
+
+        self._touch(handle.path)
+        with self._lock:
+            if handle.digest in self._sketches:
+                self._sketches.move_to_end(handle.digest)
+                return self._sketches[handle.digest]
+        try:
+            with open(self.sketch_path_for(handle.digest), "rb") as fh:
+                sketches = DatasetSketch.from_bytes(fh.read())
+        except FileNotFoundError:
+            return None
+        with self._lock:
+            self._sketches[handle.digest] = sketches
+            while len(self._sketches) > MAX_CACHED_SKETCHES:
+                self._sketches.popitem(last=False)
+        return sketches
+
+    def open_table(self, handle):
+        """Open a stored dataset as a zero-copy, memory-mapped Arrow table"""
+        import pyarrow as pa
+
+        self._touch(handle.path)
+        source = pa.memory_map(handle.path)
+        return pa.ipc.open_file(source).read_all()
+
+    def frame(self, handle):
+        """Return the dataset as a DataFrame backed by the mapped file where possible"""
+        def materialize():
+            return self.open_table(handle).to_pandas(split_blocks=True, self_destruct=False)
+
+        # Frame-cache hits are uses too: sessions, sandbox workers and
+        # sketches keep reading the file while the cached frame serves them
+        self._touch(handle.path)
+        if self.frame_cache is None:
+            return materialize()
+        return self.frame_cache.get_or_compute(handle.digest, materialize)
+
+    def gc(self, max_idle_seconds=None):
+        """Delete datasets that have not been opened recently, returning their digests"""
+        if max_idle_seconds is None:
+            max_idle_seconds = self.max_idle_seconds
+        cutoff = time.time() - max_idle_seconds
+        removed = []
+        with self._lock:
+            for entry in os.scandir(self.root):
+                if not entry.name.endswith((".arrow", ".tmp")):
+                    continue
+                try:
+                    if entry.stat().st_mtime < cutoff:
+                        # Mapped readers keep their pages after the unlink
+                        os.unlink(entry.path)
+                        self._touched.pop(entry.path, None)
+                        digest = entry.name.rsplit(".", 1)[0]
+                        removed.append(digest)
+                        if os.path.exists(self.sketch_path_for(digest)):
+                            os.unlink(self.sketch_path_for(digest))
+                except FileNotFoundError:
+                    continue
+        return removed
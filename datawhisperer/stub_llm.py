@@ -0,0 +1,174 @@
+import asyncio
+import json
+import re
+import threading
+import time
+from http import HTTPStatus
+from types import SimpleNamespace
+from urllib.parse import urlsplit
+
+
+class StubLLM:
+    """Offline stand-in for ChatGoogleGenerativeAI with the same call shape.
+
+    Answers are produced by ``respond(messages)`` (by default an echo of the
+    last user message) and streamed word by word, with optional delays to
+    mimic time-to-first-token and generation speed. Every call is recorded.
+    """
+
+    def __init__(self, respond=None, first_token_delay=0.0, token_delay=0.0):
+        self.respond = respond or (lambda messages: f"You asked: {messages[-1]['content']}")
+        self.first_token_delay = first_token_delay
+        self.token_delay = token_delay
+        self.calls = []
+
+    def stream(self, messages):
+        self.calls.append(messages)
+        if self.first_token_delay:
+            time.sleep(self.first_token_delay)
+        for i, piece in enumerate(re.findall(r"\S+\s*", self.respond(messages))):
+            if i and self.token_delay:
+                time.sleep(self.token_delay)
+            yield SimpleNamespace(content=piece)
+
+    def invoke(self, messages):
+        return SimpleNamespace(content="".join(chunk.content for chunk in self.stream(messages)))
+
+
+class HTTPStatusError(ConnectionError):
+    def __init__(self, status_code, reason=""):
+        super().__init__(f"HTTP {status_code} {reason}".strip())
+        self.status_code = status_code
+
+
+class FakeLLMServer:
+    """Local HTTP server that streams answers like a hosted chat model.
+
+    ``POST /v1/chat`` with ``{"messages": [...]}`` answers with server-sent
+    events, one ``data: {"content": ...}`` per word and ``data: [DONE]`` at
+    the end. The first ``fail_first`` requests get ``fail_status`` instead,
+    which makes retries, timeouts and overload testable without a network.
+    The server runs on its own event loop thread; use it as a context
+    manager or call start() and stop().
+    """
+
+    def __init__(self, respond=None, first_token_delay=0.0, token_delay=0.0, fail_first=0,
+                 fail_status=503, host="127.0.0.1", port=0):
+        self.respond = respond or (lambda messages: f"You asked: {messages[-1]['content']}")
+        self.first_token_delay = first_token_delay
+        self.token_delay = token_delay
+        self.fail_first = fail_first
+        self.fail_status = fail_status
+        self.host = host
+        self.port = port
+        self.requests = 0
+        self.active = 0
+        self.max_active = 0
+        self._loop = None
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}/v1/chat"
+
+    async def _handle(self, reader, writer):
+        try:
+            await reader.readline()
+            length = 0
+            while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+                name, _, value = line.decode("latin-1").partition(":")
+                if name.strip().lower() == "content-length":
+                    length = int(value)
+            messages = json.loads(await reader.readexactly(length))["messages"]
+            self.requests += 1
+            if self.requests <= self.fail_first:
+                reason = HTTPStatus(self.fail_status).phrase
+                writer.write(f"HTTP/1.1 {self.fail_status} {reason}\r\nContent-Length: 0\r\n"
+                             "Connection: close\r\n\r\n".encode())
+                await writer.drain()
+                return
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+            try:
+                writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nConnection: close\r\n\r\n")
+                await writer.drain()
+                await asyncio.sleep(self.first_token_delay)
+                for i, piece in enumerate(re.findall(r"\S+\s*", self.respond(messages))):
+                    if i:
+                        await asyncio.sleep(self.token_delay)
+                    writer.write(f"data: {json.dumps({'content': piece})}\n\n".encode())
+                    await writer.drain()
+                writer.write(b"data: [DONE]\n\n")
+                await writer.drain()
+            finally:
+                self.active -= 1
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+    def start(self):
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="fake-llm-server", daemon=True)
+        self._thread.start()
+        start = asyncio.start_server(self._handle, self.host, self.port)
+        self._server = asyncio.run_coroutine_threadsafe(start, self._loop).result()
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    def stop(self):
+        async def shutdown():
+            self._server.close()
+            # Handlers still streaming to a client that gave up are dropped
+            pending = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+            await self._server.wait_closed()
+
+        asyncio.run_coroutine_threadsafe(shutdown(), self._loop).result(5)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(5)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class HTTPChatModel:
+    """Minimal async client for FakeLLMServer with the ``astream`` call shape of a chat model"""
+
+    def __init__(self, url):
+        parts = urlsplit(url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.path = parts.path or "/"
+
+    async def astream(self, messages):
+        body = json.dumps({"messages": [{"role": m["role"], "content": m["content"]} for m in messages]}).encode()
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        try:
+            writer.write(f"POST {self.path} HTTP/1.1\r\nHost: {self.host}\r\nContent-Type: application/json\r\n"
+                         f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body)
+            await writer.drain()
+            status = (await reader.readline()).decode("latin-1").split(" ", 2)
+            if len(status) < 2:
+                raise ConnectionError("Empty response from the LLM server")
+            while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                pass
+            if status[1] != "200":
+                raise HTTPStatusError(int(status[1]), status[2].strip() if len(status) > 2 else "")
+            while line := await reader.readline():
+                line = line.strip()
+                if not line.startswith(b"data:"):
+                    continue
+                data = line[5:].strip()
+                if data == b"[DONE]":
+                    return
+                yield SimpleNamespace(content=json.loads(data)["content"])
+            raise ConnectionError("The LLM server closed the stream early")
+        finally:
+            writer.close()
@@ -0,0 +1,263 @@
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+from collections import deque
+
+# Tracing is off unless enabled here or with DATAWHISPERER_TRACE=1
+ENABLED = os.environ.get("DATAWHISPERER_TRACE", "") not in ("", "0", "false")
+# Finished spans kept in memory for the debug panel
+BUFFER_SIZE = 4096
+SERVICE_NAME = "datawhisperer"
+
+_buffer = deque(maxlen=BUFFER_SIZE)
+_lock = threading.Lock()
+_current = contextvars.ContextVar("datawhisperer_span", default=None)
+_session = contextvars.ContextVar("datawhisperer_session", default=None)
+_exporter = None
+_page_size = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def _rss_bytes():
+    try:
+        with open("/proc/self/statm") as fh:
+            return int(fh.read().split()[1]) * _page_size
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+class Span:
+    """A timed operation with attributes, a parent and the RSS change over it"""
+
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "session", "start_ns", "end_ns",
+                 "attributes", "error", "rss_start", "rss_delta", "_token")
+
+    def __init__(self, name, attributes, parent=None):
+        self.name = name
+        self.span_id = os.urandom(8).hex()
+        self.trace_id = parent.trace_id if parent is not None else os.urandom(16).hex()
+        self.parent_id = parent.span_id if parent is not None else None
+        self.session = _session.get()
+        self.attributes = attributes
+        self.error = None
+        self.end_ns = None
+        self.rss_delta = 0
+        self._token = None
+        self.rss_start = _rss_bytes()
+        self.start_ns = time.time_ns()
+
+    @property
+    def seconds(self):
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e9
+
+    def set(self, key, value):
+        self.attributes[key] = value
+
+    def end(self, error=None):
+        if self.end_ns is not None:
+            return
+        self.end_ns = time.time_ns()
+        self.rss_delta = _rss_bytes() - self.rss_start
+        if error is not None:
+            self.error = f"{type(error).__name__}: {error}"
+        with _lock:
+            _buffer.append(self)
+        if _exporter is not None and self.parent_id is None:
+            _exporter.export(self)
+
+    def __enter__(self):
+        self._token = _current.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _current.reset(self._token)
+        self.end(exc)
+        return False
+
+
+class _NoopSpan:
+    """Stands in for a Span while tracing is disabled"""
+
+    __slots__ = ()
+    seconds = 0.0
+
+    def set(self, key, value):
+        pass
+
+    def end(self, error=None):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+def span(name, **attributes):
+    """Context manager timing a block as a child of the current span.
+
+    Costs one global lookup while tracing is disabled.
+    """
+    if not ENABLED:
+        return NOOP_SPAN
+    return Span(name, attributes, _current.get())
+
+
+def start_span(name, **attributes):
+    """Start a span that is ended explicitly with ``end()``, e.g. around a stream.
+
+    The span is not made current, so it can outlive the block that started it.
+    """
+    if not ENABLED:
+        return NOOP_SPAN
+    return Span(name, attributes, _current.get())
+
+
+def current_span():
+    """The innermost active span, for adding attributes from inside it"""
+    current = _current.get() if ENABLED else None
+    return NOOP_SPAN if current is None else current
+
+
+def traced(name):
+    """Decorator running the function inside ``span(name)``"""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not ENABLED:
+                return fn(*args, **kwargs)
+            with Span(name, {}, _current.get()):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def enable(enabled=True, export_path=None):
+    """Turn tracing on or off, optionally appending finished traces to ``export_path``.
+
+    The exporter is kept when tracing is turned off, so turning it back on
+    exports to the same file. Without one, DATAWHISPERER_TRACE_FILE is used.
+    """
+    global ENABLED, _exporter
+    ENABLED = enabled
+    export_path = export_path or (os.environ.get("DATAWHISPERER_TRACE_FILE") if _exporter is None else None)
+    if export_path:
+        _exporter = FileExporter(export_path)
+
+
+def set_session(session_id):
+    """Tag spans started from this context with ``session_id``"""
+    _session.set(session_id)
+
+
+def finished_spans(session=None):
+    with _lock:
+        spans = list(_buffer)
+    if session is not None:
+        spans = [s for s in spans if s.session == session]
+    return spans
+
+
+def recent_traces(n=20, session=None):
+    """The last ``n`` root spans with their descendants: [(root, [spans])], newest first"""
+    spans = finished_spans()
+    by_trace = {}
+    for s in spans:
+        by_trace.setdefault(s.trace_id, []).append(s)
+    roots = [s for s in spans if s.parent_id is None and (session is None or s.session == session)]
+    return [(root, sorted(by_trace[root.trace_id], key=lambda s: s.start_ns)) for root in reversed(roots[-n:])]
+
+
+def summary_rows(traces):
+    """One row per trace for a debug table: start, name, duration, RSS change and slowest steps"""
+    rows = []
+    for root, spans in traces:
+        steps = sorted((s for s in spans if s is not root), key=lambda s: -s.seconds)[:3]
+        rows.append({
+            "time": time.strftime("%H:%M:%S", time.localtime(root.start_ns / 1e9)),
+            "request": root.name,
+            "ms": round(root.seconds * 1000, 1),
+            "rss MB": round(root.rss_delta / 1024 ** 2, 1),
+            "slowest steps": ", ".join(f"{s.name} {s.seconds * 1000:.0f}ms" for s in steps),
+            "error": root.error or "",
+        })
+    return rows
+
+
+def clear():
+    with _lock:
+        _buffer.clear()
+
+
+def _attribute_value(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _otlp_span(s):
+    attributes = dict(s.attributes)
+    attributes["process.rss_delta_bytes"] = s.rss_delta
+    if s.session is not None:
+        attributes["session.id"] = s.session
+    span = {
+        "traceId": s.trace_id,
+        "spanId": s.span_id,
+        "name": s.name,
+        "kind": 1,
+        "startTimeUnixNano": str(s.start_ns),
+        "endTimeUnixNano": str(s.end_ns),
+        "attributes": [{"key": k, "value": _attribute_value(v)} for k, v in attributes.items()],
+        "status": {"code": 2, "message": s.error} if s.error else {"code": 1},
+    }
+    if s.parent_id is not None:
+        span["parentSpanId"] = s.parent_id
+    return span
+
+
+def to_otlp(spans):
+    """OTLP/JSON ExportTraceServiceRequest for ``spans``"""
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]},
+            "scopeSpans": [{"scope": {"name": __name__}, "spans": [_otlp_span(s) for s in spans]}],
+        }]
+    }
+
+
+def export_json(path, spans=None):
+    """Write the buffered spans (or ``spans``) to ``path`` as one OTLP/JSON document"""
+    with open(path, "w") as fh:
+        json.dump(to_otlp(finished_spans() if spans is None else spans), fh)
+
+
+class FileExporter:
+    """Appends each finished trace to a file as one line of OTLP/JSON.
+
+    This is the layout the OpenTelemetry collector's file exporter writes
+    and its otlpjsonfile receiver reads.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, root):
+        spans = [s for s in finished_spans() if s.trace_id == root.trace_id]
+        line = json.dumps(to_otlp(spans))
+        with self._lock, open(self.path, "a") as fh:
+            fh.write(line + "\n")
+
+
+if ENABLED and os.environ.get("DATAWHISPERER_TRACE_FILE"):
+    enable(True, os.environ["DATAWHISPERER_TRACE_FILE"])
@@ -0,0 +1,90 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+def file_key(uploaded_file):
+    """Return a content key (name, size, sha256) for an uploaded file"""
+    digest = hashlib.sha256()
+    uploaded_file.seek(0)
+    for block in iter(lambda: uploaded_file.read(1 << 20), b""):
+        digest.update(block)
+    uploaded_file.seek(0)
+    return (uploaded_file.name, uploaded_file.size, digest.hexdigest())
+
+
+def frame_nbytes(df):
+    """Approximate in-memory size of a DataFrame in bytes"""
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+
+class UploadCache:
+    """LRU cache of parsed DataFrames keyed by upload content.
+
+    Entries are evicted least-recently-used first once the total size of
+    the cached frames goes over ``max_bytes``. The cache is shared by all
+    sessions of the process, so it is guarded by a lock.
+    """
+
+    def __init__(self, max_bytes=2 * 1024 ** 3):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.nbytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, df):
+        size = frame_nbytes(df)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.nbytes -= old[1]
+            # A frame bigger than the whole budget is returned but not kept
+            if size > self.max_bytes:
+                return df
+            self._entries[key] = (df, size)
+            self.nbytes += size
+            while self.nbytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.nbytes -= evicted
+        return df
+
+    def get_or_compute(self, key, compute):
+        """Return the cached frame for ``key``, calling ``compute()`` on a miss"""
+        df = self.get(key)
+        if df is None:
+            df = self.put(key, compute())
+        return df
+
+    def get_or_load(self, uploaded_file, loader):
+        """Return the cached frame for ``uploaded_file``, parsing it on a miss"""
+        return self.get_or_compute(file_key(uploaded_file), lambda: loader(uploaded_file))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._entries),
+                "bytes": self.nbytes,
+                "max_bytes": self.max_bytes,
+            }
+
+    def __len__(self):
+        return len(self._entries)
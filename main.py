@@ -1,17 +1,22 @@
-from http.client import responses
+import functools
+import json
+import uuid
 
 import streamlit as st
-import pandas as pd
-import pprint
-import numpy as np
-import matplotlib.pyplot as plt
-from langchain_experimental.graph_transformers.llm import system_prompt
-from langchain_experimental.plan_and_execute.planners.chat_planner import SYSTEM_PROMPT
-from streamlit import divider
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_experimental.agents import create_pandas_dataframe_agent
-
+from datawhisperer import tracing
+from datawhisperer.context import ChatContext, llm_summarizer
+from datawhisperer.history import TranscriptView
+from datawhisperer.llm_gateway import LLMGateway, LLMRequestError
+from datawhisperer.messages import ArtifactStore, Message
+from datawhisperer.loader import BackgroundLoader
+from datawhisperer.response_cache import ResponseCache, conversation_key
+from datawhisperer.sandbox import SandboxPool, dataset_variable, extract_code
+from datawhisperer.store import DatasetStore
+from datawhisperer.upload_cache import UploadCache
 
+# Heavy libraries (pandas, pyarrow, the Gemini client) are imported on first
+# use, so a cold worker can serve its first page quickly. Run
+# ``python -m datawhisperer.importtime`` to check the startup imports.
 
 # Set page configuration
 st.set_page_config(
@@ -21,35 +26,204 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-llm = ChatGoogleGenerativeAI(
-    model="gemini-2.0-flash",
-    temperature=0,
-    max_tokens=2000,
-    timeout=None,
-    max_retries=2,
-    api_key=st.secrets['GOOGLE_API_KEY']
-)
+LLM_MODEL = "gemini-2.0-flash"
+
+# One LLM client per process, created when the first question is asked
+@st.cache_resource
+def get_llm():
+    from langchain_google_genai import ChatGoogleGenerativeAI
+
+    return ChatGoogleGenerativeAI(
+        model=LLM_MODEL,
+        temperature=0,
+        max_tokens=2000,
+        timeout=None,
+        # Retries with jittered backoff are handled by the gateway
+        max_retries=0,
+        api_key=st.secrets['GOOGLE_API_KEY']
+    )
+
+# Every session streams through one gateway, which caps concurrent LLM calls,
+# merges identical in-flight requests and retries transient failures
+@st.cache_resource
+def get_gateway():
+    return LLMGateway(get_llm(), max_concurrency=4, timeout=120, first_token_timeout=30, max_attempts=3)
+
+# Parsed uploads are shared across reruns and sessions, keyed by file content
+@st.cache_resource
+def get_upload_cache():
+    return UploadCache(max_bytes=2 * 1024 ** 3)
+
+upload_cache = get_upload_cache()
+
+# Uploads are persisted once per content as memory-mapped Arrow files;
+# sessions only keep a handle and share the frames through upload_cache
+@st.cache_resource
+def get_store():
+    store = DatasetStore(frame_cache=upload_cache)
+    store.gc()
+    return store
+
+store = get_store()
+
+# Hash indexes of join keys, shared by sessions that load the same files
+@st.cache_resource
+def get_index_cache():
+    from datawhisperer.relations import IndexCache
+
+    return IndexCache(max_bytes=512 * 1024 ** 2)
+
+# Uploads are parsed concurrently off the script thread
+@st.cache_resource
+def get_loader():
+    return BackgroundLoader(max_workers=4)
+
+loader = get_loader()
+
+# Initialize system prompt to set up the role of DataWhisperer, read once per process
+@st.cache_resource
+def get_system_prompt():
+    with open('SYSTEM_PROMPT.txt', 'r') as file:
+        return file.read()
+
+sys_prompt = get_system_prompt()
+
+# Uploads are profiled and explored on background threads as soon as they
+# load, so the first question doesn't wait for the data description
+@st.cache_resource
+def get_eda():
+    from datawhisperer.eda import EDAScheduler
+
+    return EDAScheduler(max_workers=2)
+
+
+def start_eda(handle):
+    from datawhisperer.eda import DEFAULT_ARTIFACTS
+
+    return get_eda().submit(handle.digest, functools.partial(store.frame, handle),
+                            [col for col, _ in handle.columns], ("profile",) + DEFAULT_ARTIFACTS)
+
+# Answers are reused for the same question about the same data
+@st.cache_resource
+def get_response_cache():
+    return ResponseCache(ttl=7 * 24 * 3600, max_entries=10_000)
+
+response_cache = get_response_cache()
+
+# Generated code runs in warm worker processes, never in the app process
+@st.cache_resource
+def get_sandbox():
+    return SandboxPool(size=2)
+
+# Token budget for the description of the loaded DataFrames in the prompt
+DATA_DIGEST_TOKENS = 3000
+
+
+def dataset_relationships():
+    """Join keys between the loaded datasets, found once per set of datasets"""
+    from datawhisperer.relations import find_relationships
+
+    datasets = st.session_state.datasets
+    if len(datasets) < 2:
+        return []
+    key = ",".join(sorted(handle.digest for handle in datasets.values()))
+    cached = st.session_state.get("relationships")
+    if cached is None or cached[0] != key:
+        tables = {name: (handle.digest, store.frame(handle), store.sketches(handle))
+                  for name, handle in datasets.items()}
+        cached = (key, find_relationships(tables, get_index_cache()))
+        st.session_state["relationships"] = cached
+    return cached[1]
 
-# Initialize system prompt to set up the role of DataWhisperer
-open('SYSTEM_PROMPT.txt', 'r')
 
-with open('SYSTEM_PROMPT.txt', 'r') as file:
-    sys_prompt = file.read()
+def describe_datasets(question):
+    """Profile digest of every loaded dataset, computed once per dataset"""
+    from datawhisperer.eda import render_findings
+    from datawhisperer.profile import get_profile, render_digest
+
+    datasets = st.session_state.datasets
+    if not datasets:
+        return ""
+    budget = DATA_DIGEST_TOKENS // len(datasets)
+    digests = []
+    for name, handle in datasets.items():
+        eda = st.session_state.eda.get(name)
+        profile = eda.get("profile") if eda is not None else None
+        if profile is None:
+            profile = get_profile(handle.digest, store.frame(handle))
+        digest = render_digest(name, profile, question, budget)
+        findings = render_findings(eda) if eda is not None else ""
+        if findings:
+            digest += f"\nFound by the initial analysis:\n{findings}"
+        digests.append(digest)
+    variables = ", ".join(f"{dataset_variable(name)} ({name})" for name in datasets)
+    description = ("The user has loaded these DataFrames:\n\n" + "\n\n".join(digests)
+                   + f"\n\nIn generated Python code they are available as {variables}.")
+    relationships = dataset_relationships()
+    if relationships:
+        from datawhisperer.relations import describe_relationship
+
+        lines = [f"- {describe_relationship(r, dataset_variable)}" for r in relationships]
+        description += ("\n\nLikely join keys between them:\n" + "\n".join(lines)
+                        + "\nJoin on a key with join(left_df, right_df, left_on=..., right_on=..., how='inner' or 'left'), "
+                        "which reuses a cached index of the right DataFrame's key.")
+    return description
+
+
+def run_generated_code(text):
+    """Run the code blocks of an answer in the sandbox and store what they produce"""
+    artifacts = st.session_state.artifacts
+    datasets = {dataset_variable(name): handle.path for name, handle in st.session_state.datasets.items()}
+    refs = []
+    for code in extract_code(text):
+        result = get_sandbox().run(code, datasets)
+        if result.stdout:
+            refs.append(artifacts.put(result.stdout))
+        if result.error:
+            refs.append(artifacts.put(result.error, kind="error"))
+        refs.extend(artifacts.put(frame, label=name) for name, frame in result.frames.items())
+        refs.extend(artifacts.put(png) for png in result.figures)
+    return refs
+
+
+def show_artifacts(refs):
+    artifacts = st.session_state.artifacts
+    for ref in refs:
+        value = artifacts.get(ref)
+        if ref.kind == "text":
+            st.code(value, language="text")
+        elif ref.kind == "error":
+            st.error(value)
+        elif ref.kind == "frame":
+            st.caption(ref.label)
+            st.dataframe(value)
+        elif ref.kind == "png":
+            st.image(value)
+
+
+# Spans started by this session are tagged with its id for the performance panel
+if 'trace_session' not in st.session_state:
+    st.session_state['trace_session'] = uuid.uuid4().hex
+tracing.set_session(st.session_state.trace_session)
 
 # Header
 st.title(":rainbow[**DataWhisperer**]")
 
-if system_prompt not in st.session_state:
+if 'system_prompt' not in st.session_state:
     st.session_state['system_prompt'] = [{"role": "system", "content": sys_prompt}]
 
+# Results of generated code are serialized into a capped per-session store
+if 'artifacts' not in st.session_state:
+    st.session_state['artifacts'] = ArtifactStore()
+
 # Initialize chat history
 if 'messages' not in st.session_state:
     st.session_state['messages'] = [
-        {"role": "assistant", "content": "Hello! I'm your DataWhisperer. Upload a CSV file on the sidebar, and I'll help you analyze it."}
+        Message("assistant", "Hello! I'm your DataWhisperer. Upload a CSV file on the sidebar, and I'll help you analyze it.")
     ]
 
-if 'df' not in st.session_state:
-    st.session_state['df'] = {}
+if 'datasets' not in st.session_state:
+    st.session_state['datasets'] = {}
 
 if "file_uploader_key" not in st.session_state:
     st.session_state["file_uploader_key"] = 0
@@ -57,26 +231,67 @@ if "file_uploader_key" not in st.session_state:
 if "uploaded_files" not in st.session_state:
     st.session_state["uploaded_files"] = []
 
-if "model" not in st.session_state:
-    st.session_state['model'] = llm
+if "pending_loads" not in st.session_state:
+    st.session_state["pending_loads"] = {}
+
+if "load_results" not in st.session_state:
+    st.session_state["load_results"] = {}
+
+# Background EDA of each loaded dataset, by file name
+if "eda" not in st.session_state:
+    st.session_state["eda"] = {}
+
+# Only the last turns are live; older ones are static snapshots built once
+if "history" not in st.session_state:
+    st.session_state["history"] = TranscriptView(st.session_state.artifacts, live_turns=10)
 
 # Display chat messages from history on app rerun
-for message in st.session_state['messages']:
-    with st.chat_message(message["role"]):
-        st.markdown(message["content"])
+n_archived, live_messages = st.session_state.history.split(st.session_state['messages'])
+if n_archived and st.toggle(f"Show {n_archived} earlier messages"):
+    st.markdown(st.session_state.history.archive(), unsafe_allow_html=True)
+for message in live_messages:
+    with st.chat_message(message.role):
+        st.markdown(message.content)
+        show_artifacts(message.artifacts)
 
 # Accept user input
 if prompt := st.chat_input("What would you like to know?"):
     # Add user message to chat history
-    st.session_state['messages'].append({"role": "user", "content": prompt})
+    st.session_state['messages'].append(Message("user", prompt))
     # Display user message in chat message container
     with st.chat_message("user"):
         st.markdown(prompt)
 
-    with st.chat_message('assistant'):
-        response = llm.stream(st.session_state.system_prompt + st.session_state.messages)
-        full_response = st.write_stream(response)
-        st.session_state.messages.append({"role": "assistant", "content": full_response})
+    # Keeps each LLM request under a token budget by summarizing older turns
+    if "context" not in st.session_state:
+        st.session_state["context"] = ChatContext(budget_tokens=8000, keep_turns=6, summarize=llm_summarizer(get_gateway().complete))
+
+    with st.chat_message('assistant'), tracing.span("chat_turn", datasets=len(st.session_state.datasets)):
+        gateway = get_gateway()
+        system_messages = st.session_state.system_prompt
+        description = describe_datasets(prompt)
+        if description:
+            system_messages = [{"role": "system", "content": f"{sys_prompt}\n\n{description}"}]
+        payload = st.session_state.context.build(system_messages, st.session_state.messages)
+        dataset_key = ",".join(sorted(handle.digest for handle in st.session_state.datasets.values()))
+        if dataset_key:
+            # Keyed by the conversation too, so follow-ups like "why?" aren't answered from other chats
+            schema = [[name, handle.columns] for name, handle in sorted(st.session_state.datasets.items())]
+            context = conversation_key(st.session_state.messages[:-1], LLM_MODEL, schema)
+            response = response_cache.stream(dataset_key, prompt, lambda: gateway.stream(payload), context=context)
+        else:
+            response = gateway.stream(payload)
+        try:
+            full_response = st.write_stream(response)
+        except LLMRequestError as e:
+            full_response = f"Sorry, the model could not answer: {e}"
+            st.error(full_response)
+        refs = []
+        if st.session_state.get("run_code") and st.session_state.datasets:
+            with st.spinner("Running the generated code..."):
+                refs = run_generated_code(full_response)
+            show_artifacts(refs)
+        st.session_state.messages.append(Message("assistant", full_response, refs))
 
 # Sidebar
 with st.sidebar:
@@ -85,31 +300,133 @@ with st.sidebar:
 
     if path is not None:
         st.session_state["uploaded_files"] = path
-        try:
-            for i in range(len(path)):
-                df = pd.read_csv(path[i])
-                st.session_state.df.update({path[i].name: df})
-                st.success(f"Successfully loaded {path[i].name}")
-        except Exception as e:
-            st.error(f"Error loading file: {e}")
-
-    if st.session_state.df is not None:
+        pending = st.session_state["pending_loads"]
+        results = st.session_state["load_results"]
+        # Loads are keyed by upload, not by name, so a corrected file
+        # uploaded again under the same name is loaded again
+        uploaded = {file.file_id: file for file in path}
+        for file_id in [file_id for file_id in results if file_id not in uploaded]:
+            # Removed uploads, failed ones included, can be uploaded and tried again
+            del results[file_id]
+        for file_id in [file_id for file_id in pending if file_id not in uploaded]:
+            pending.pop(file_id).cancel()
+        for file_id, file in uploaded.items():
+            if file_id not in results and file_id not in pending:
+                pending[file_id] = loader.submit(file, store=store)
+
+        # Collect finished loads; one bad file no longer stops the others
+        for file_id, future in list(pending.items()):
+            if future.done():
+                result = future.result()
+                results[file_id] = result
+                del pending[file_id]
+                if result.error is None:
+                    st.session_state.datasets.update({result.name: result.handle})
+                    st.session_state.eda[result.name] = start_eda(result.handle)
+
+        for result in results.values():
+            name = result.name
+            if result.error is not None:
+                st.error(f"Error loading {name}: {result.error}")
+                continue
+            st.success(f"Successfully loaded {name} in {result.seconds:.1f}s")
+            if result.handle.info.get("sampled"):
+                st.warning(f"{name} is larger than the memory budget; "
+                           f"loaded a {result.handle.info['sample_fraction']:.0%} random sample")
+
+        if pending:
+            for file_id in pending:
+                st.info(f"Loading {uploaded[file_id].name}...")
+
+            # Poll in a fragment so the chat stays usable while files load
+            @st.fragment(run_every=1.0)
+            def wait_for_loads():
+                if all(future.done() for future in st.session_state["pending_loads"].values()):
+                    st.rerun()
+
+            wait_for_loads()
+
+    if st.session_state.datasets:
         st.markdown("---")
         st.subheader("📊 Dataset Information")
-        for key in st.session_state.df.keys():
+        for key, handle in st.session_state.datasets.items():
             st.write(f"**Name:** {key}")
-            st.write(f"**Size:** {st.session_state.df[key].shape[0]} rows, {st.session_state.df[key].shape[1]} columns")
+            st.write(f"**Size:** {handle.rows} rows, {len(handle.columns)} columns")
+            eda = st.session_state.eda.get(key)
+            if eda is not None and not eda.done:
+                ready, total = eda.progress()
+                st.caption(f"Analyzing in the background: {ready} of {total} results ready")
             st.write("**Column Types:**")
-            for col, dtype in st.session_state.df[key].dtypes.items():
-                st.write(f"- {col}: {dtype}")
+            sketches = store.sketches(handle)
+            for col, dtype in handle.columns:
+                if sketches is not None and col in sketches:
+                    st.write(f"- {col}: {dtype}, ~{sketches.distinct(col)[0]:,.0f} distinct")
+                else:
+                    st.write(f"- {col}: {dtype}")
+
+        if len(st.session_state.datasets) > 1:
+            from datawhisperer.relations import describe_relationship
+
+            st.subheader("🔗 Relationships")
+            with st.spinner("Looking for join keys..."):
+                relationships = dataset_relationships()
+            for r in relationships:
+                st.write(f"- {describe_relationship(r)}")
+            if not relationships:
+                st.caption("No shared keys found between the files")
+
+    st.toggle("Run generated code", key="run_code",
+              help="Execute the Python in answers against the loaded data in an isolated worker")
+
+    cache_stats = upload_cache.stats()
+    st.caption(f"Upload cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses, "
+               f"{cache_stats['bytes'] / 1024 ** 2:.1f} MB held")
+    if len(st.session_state.datasets) > 1:
+        index_stats = get_index_cache().stats()
+        st.caption(f"Join indexes: {index_stats['entries']} cached, {index_stats['hits']} reused, "
+                   f"{index_stats['bytes'] / 1024 ** 2:.1f} MB held")
+    answer_stats = response_cache.stats()
+    st.caption(f"Answer cache: {answer_stats['hit_rate']:.0%} hit rate, "
+               f"{answer_stats['saved_seconds']:.1f}s of LLM time saved")
+    # The gateway exists once this session has asked something; don't create it just for stats
+    llm_stats = get_gateway().metrics.snapshot() if "context" in st.session_state else None
+    if llm_stats and llm_stats["ttft_p50"] is not None:
+        st.caption(f"LLM: {llm_stats['queue_depth']} queued, {llm_stats['in_flight']} running, "
+                   f"first token {llm_stats['ttft_p50']:.1f}s (p50), "
+                   f"{llm_stats['tokens_per_second'] or 0:.0f} tokens/s")
+
+    # Per-session timings of the traced hot paths (load, analysis, LLM, charts)
+    with st.expander("⏱ Performance"):
+        st.toggle("Trace requests", value=tracing.ENABLED, key="trace_requests",
+                  on_change=lambda: tracing.enable(st.session_state.trace_requests),
+                  help="Turns tracing on or off for the whole process, every session included; "
+                       "set DATAWHISPERER_TRACE_FILE to export the spans")
+        rows = tracing.summary_rows(tracing.recent_traces(20, st.session_state.trace_session))
+        if rows:
+            st.dataframe(rows, hide_index=True)
+            st.download_button("Download traces (OTLP JSON)", file_name="traces.json", mime="application/json",
+                               data=json.dumps(tracing.to_otlp(tracing.finished_spans(st.session_state.trace_session))))
+        else:
+            st.caption("No traced requests yet")
 
     if st.button("Clear uploaded files"):
         st.session_state["file_uploader_key"] += 1
-        del st.session_state.df
+        for future in st.session_state["pending_loads"].values():
+            future.cancel()
+        del st.session_state.datasets
+        del st.session_state["pending_loads"]
+        del st.session_state["load_results"]
+        st.session_state.pop("relationships", None)
+        for eda in st.session_state.eda.values():
+            get_eda().release(eda)
+        del st.session_state["eda"]
         st.rerun()
 
 if st.button("Clear Chat"):
     del st.session_state['messages']
+    del st.session_state['history']
+    st.session_state.artifacts.clear()
+    st.session_state.pop('context', None)
     st.rerun()
 
 
@@ -1,11 +1,20 @@
+import functools
+import html
+import json
+import uuid
+
 import streamlit as st
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
-import plotly.express as px
-import re
-from io import StringIO
+from datawhisperer import ingest, tracing
+from datawhisperer.analysis import analyze_command
+from datawhisperer.eda import EDAScheduler
+from datawhisperer.export import COMPRESSIONS, FORMATS, ExportCache, file_name, mime_type
+from datawhisperer.filters import filtered, format_expr
+from datawhisperer.history import TranscriptView, artifacts_snapshot
+from datawhisperer.messages import ArtifactStore, Message
+from datawhisperer.store import DatasetStore, frame_digest
+from datawhisperer.upload_cache import UploadCache
 
 # Set page configuration
 st.set_page_config(
@@ -144,124 +153,87 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
+# Datasets live once per content in a memory-mapped store shared by all
+# sessions; each session only keeps a handle to its dataset
+@st.cache_resource
+def get_store():
+    store = DatasetStore(frame_cache=UploadCache(max_bytes=2 * 1024 ** 3))
+    store.gc()
+    return store
+
+store = get_store()
+
+# Summary, nulls, correlations, outliers and histograms of an upload are
+# computed on background threads, before the first question asks for them
+@st.cache_resource
+def get_eda():
+    return EDAScheduler(max_workers=2)
+
+eda = get_eda()
+
+
+# Downloads are serialized in chunks when clicked and kept on disk per
+# dataset, filter, format and compression, so a repeat download is a file read
+@st.cache_resource
+def get_exports():
+    return ExportCache()
+
+
+def export_rows(handle, node):
+    df = store.frame(handle)
+    return filtered(df, node) if node is not None else df
+
+
+def start_eda(handle):
+    """Release the previous dataset's background analysis and start this one's"""
+    previous = st.session_state.eda
+    if previous is not None:
+        if previous.key == handle.digest and not previous.cancelled:
+            return
+        eda.release(previous)
+    st.session_state.eda = eda.submit(handle.digest, functools.partial(store.frame, handle),
+                                      [col for col, _ in handle.columns])
+
 # Initialize session state
+# Spans started by this session are tagged with its id for the performance panel
+if 'trace_session' not in st.session_state:
+    st.session_state.trace_session = uuid.uuid4().hex
+tracing.set_session(st.session_state.trace_session)
+
+# Figures and tables of the chat are serialized into a capped per-session store
+if 'artifacts' not in st.session_state:
+    st.session_state.artifacts = ArtifactStore()
+
 if 'messages' not in st.session_state:
     st.session_state.messages = [
-        {"role": "assistant", "content": "Hello! I'm your Data Analysis Assistant. Upload a CSV file or use sample data, and I'll help you analyze it. What would you like to know?"}
+        Message("assistant", "Hello! I'm your Data Analysis Assistant. Upload a CSV file or use sample data, and I'll help you analyze it. What would you like to know?")
     ]
 
-if 'df' not in st.session_state:
-    st.session_state.df = None
+if 'dataset' not in st.session_state:
+    st.session_state.dataset = None
 
 if 'df_name' not in st.session_state:
     st.session_state.df_name = None
 
-# Helper functions for data analysis
-def analyze_command(command, df):
-    """Process natural language commands for data analysis"""
-    command = command.lower()
-    response = ""
-    fig = None
-    
-    # Show basic info
-    if any(x in command for x in ["describe", "summary", "statistics", "info"]):
-        response = f"Here's a summary of your data:\n\n{df.describe().to_string()}\n\n"
-        response += f"Dataset has {df.shape[0]} rows and {df.shape[1]} columns."
-        
-    # Show columns
-    elif any(x in command for x in ["columns", "features", "variables"]):
-        response = f"Your dataset contains the following columns:\n\n{', '.join(df.columns)}"
-    
-    # Show missing values
-    elif any(x in command for x in ["missing", "null", "na", "empty"]):
-        response = "Missing values in each column:\n\n"
-        missing = df.isnull().sum()
-        response += missing.to_string()
-        
-    # Create scatter plot
-    elif "scatter" in command:
-        cols = extract_columns(command, df.columns)
-        if len(cols) >= 2:
-            fig = px.scatter(df, x=cols[0], y=cols[1], title=f"{cols[0]} vs {cols[1]}")
-            response = f"Created scatter plot of {cols[0]} vs {cols[1]}"
-        else:
-            response = "Please specify which columns to use for the scatter plot."
-    
-    # Create histogram
-    elif "histogram" in command or "distribution" in command:
-        cols = extract_columns(command, df.columns)
-        if cols:
-            fig = px.histogram(df, x=cols[0], nbins=20, title=f"Distribution of {cols[0]}")
-            response = f"Created histogram for {cols[0]}"
-        else:
-            response = "Please specify which column to use for the histogram."
-    
-    # Create bar chart
-    elif "bar" in command:
-        cols = extract_columns(command, df.columns)
-        if len(cols) >= 2:
-            fig = px.bar(df, x=cols[0], y=cols[1], title=f"{cols[1]} by {cols[0]}")
-            response = f"Created bar chart of {cols[1]} by {cols[0]}"
-        else:
-            response = "Please specify which columns to use for the bar chart."
-    
-    # Correlation analysis
-    elif "correlation" in command or "corr" in command:
-        numeric_df = df.select_dtypes(include=[np.number])
-        if not numeric_df.empty:
-            corr = numeric_df.corr()
-            fig = px.imshow(corr, 
-                          color_continuous_scale='RdBu_r',
-                          title='Correlation Matrix')
-            response = "Generated correlation matrix for numeric columns."
-        else:
-            response = "No numeric columns available for correlation analysis."
-    
-    # Calculate aggregate statistics
-    elif any(x in command for x in ["mean", "average", "sum", "max", "min", "count"]):
-        agg_funcs = {
-            "mean": "mean", "average": "mean", "sum": "sum", 
-            "max": "max", "min": "min", "count": "count"
-        }
-        
-        for func_name, func in agg_funcs.items():
-            if func_name in command:
-                cols = extract_columns(command, df.columns)
-                if cols:
-                    result = getattr(df[cols], func)()
-                    response = f"{func_name.capitalize()} of {', '.join(cols)}:\n\n{result.to_string()}"
-                else:
-                    numeric_cols = df.select_dtypes(include=[np.number]).columns.tolist()
-                    result = getattr(df[numeric_cols], func)()
-                    response = f"{func_name.capitalize()} of numeric columns:\n\n{result.to_string()}"
-                break
-    
-    # Filter data
-    elif any(x in command for x in ["filter", "where", "query"]):
-        # This is a simplified filter implementation - would need more complex NLP for production
-        response = "Filtering functionality is available. Please specify column and condition."
-        
-    # Show sample data
-    elif any(x in command for x in ["sample", "show", "display", "head", "preview"]):
-        count = 5  # Default
-        match = re.search(r'(\d+)', command)
-        if match:
-            count = min(int(match.group(1)), 20)  # Limit to 20 rows
-        response = f"Here's a sample of {count} rows from your data:\n\n"
-        return response, df.head(count)
-        
-    else:
-        response = "I'm not sure how to process that command. Try asking for statistics, columns, correlations, or to create plots."
-    
-    return response, fig
+# Distinct-count, percentile and top-k sketches of the whole uploaded file
+if 'sketches' not in st.session_state:
+    st.session_state.sketches = None
+
+# Older turns are shown as static snapshots built once per message; the
+# archive is rendered as HTML, so the message text is escaped
+if 'history' not in st.session_state:
+    st.session_state.history = TranscriptView(
+        st.session_state.artifacts, live_turns=10,
+        snapshot=lambda m, store: (f'<div class="{m.role}-message">{html.escape(m.content, quote=False)}</div>'
+                                   f'\n\n{artifacts_snapshot(m, store)}'))
 
-def extract_columns(command, available_columns):
-    """Extract column names from the command"""
-    columns = []
-    for col in available_columns:
-        if col.lower() in command.lower():
-            columns.append(col)
-    return columns
+# Precomputed EDA artifacts of the current dataset, read by analyze_command
+if 'eda' not in st.session_state:
+    st.session_state.eda = None
+
+# Active row filter, applied to every command until it is cleared
+if 'filter' not in st.session_state:
+    st.session_state.filter = None
 
 # Sidebar
 with st.sidebar:
@@ -273,10 +245,17 @@ with st.sidebar:
     
     if uploaded_file is not None:
         try:
-            df = pd.read_csv(uploaded_file)
-            st.session_state.df = df
+            handle = store.ingest_upload(uploaded_file, ingest.read_csv)
+            if st.session_state.dataset is None or st.session_state.dataset.digest != handle.digest:
+                st.session_state.filter = None
+                start_eda(handle)
+            st.session_state.dataset = handle
+            st.session_state.sketches = store.sketches(handle)
             st.session_state.df_name = uploaded_file.name
             st.success(f"Successfully loaded {uploaded_file.name}")
+            if handle.info.get("sampled"):
+                st.warning(f"File is larger than the memory budget; "
+                           f"loaded a {handle.info['sample_fraction']:.0%} random sample")
         except Exception as e:
             st.error(f"Error loading file: {e}")
     
@@ -292,19 +271,50 @@ with st.sidebar:
             'Region': np.random.choice(['North', 'South', 'East', 'West'], 100)
         }
         df = pd.DataFrame(data)
-        st.session_state.df = df
+        st.session_state.dataset = store.put(df, frame_digest(df), "sample_data.csv")
+        start_eda(st.session_state.dataset)
+        st.session_state.sketches = None
+        st.session_state.filter = None
         st.session_state.df_name = "sample_data.csv"
         st.success("Sample data loaded!")
     
     # Display dataset info if loaded
-    if st.session_state.df is not None:
+    if st.session_state.dataset is not None:
+        handle = st.session_state.dataset
         st.markdown("---")
         st.subheader("Dataset Information")
         st.write(f"**Name:** {st.session_state.df_name}")
-        st.write(f"**Size:** {st.session_state.df.shape[0]} rows, {st.session_state.df.shape[1]} columns")
+        st.write(f"**Size:** {handle.rows} rows, {len(handle.columns)} columns")
         st.write("**Column Types:**")
-        for col, dtype in st.session_state.df.dtypes.items():
-            st.write(f"- {col}: {dtype}")
+        sketches = st.session_state.sketches
+        for col, dtype in handle.columns:
+            if sketches is not None and col in sketches:
+                st.write(f"- {col}: {dtype}, ~{sketches.distinct(col)[0]:,.0f} distinct")
+            else:
+                st.write(f"- {col}: {dtype}")
+        if st.session_state.eda is not None and not st.session_state.eda.done:
+            ready, total = st.session_state.eda.progress()
+            st.caption(f"Analyzing in the background: {ready} of {total} results ready")
+    
+        if st.session_state.filter is not None:
+            st.info(f"**Active filter:** {format_expr(st.session_state.filter)}")
+            if st.button("Clear filter"):
+                st.session_state.filter = None
+                st.rerun()
+
+        with st.expander("⬇️ Export data"):
+            export_format = st.selectbox("Format", list(FORMATS), key="export_format")
+            compression = st.selectbox("Compression", COMPRESSIONS, key="export_compression",
+                                       format_func=lambda c: c or "none")
+            node = st.session_state.filter
+            version = f"{handle.digest}:{format_expr(node) if node is not None else ''}"
+            st.download_button(
+                "Download filtered rows" if node is not None else "Download all rows",
+                data=get_exports().download(version, functools.partial(export_rows, handle, node),
+                                            export_format, compression),
+                file_name=file_name(st.session_state.df_name, export_format, compression),
+                mime=mime_type(export_format, compression),
+            )
     
     st.markdown("---")
     st.markdown("### Example Questions")
@@ -312,24 +322,44 @@ with st.sidebar:
     st.markdown("- Create a histogram of Age")
     st.markdown("- What's the correlation between columns?")
     st.markdown("- Show me a sample of 10 rows")
+    st.markdown("- How many unique Region values are there?")
+    st.markdown("- What is the p99 of Income?")
+    st.markdown("- Which columns have outliers?")
+    st.markdown("- Filter where Income > 50000 and Region is West")
+
+    # Per-session timings of the traced hot paths (load, analysis, LLM, charts)
+    with st.expander("⏱ Performance"):
+        st.toggle("Trace requests", value=tracing.ENABLED, key="trace_requests",
+                  on_change=lambda: tracing.enable(st.session_state.trace_requests),
+                  help="Turns tracing on or off for the whole process, every session included; "
+                       "set DATAWHISPERER_TRACE_FILE to export the spans")
+        rows = tracing.summary_rows(tracing.recent_traces(20, st.session_state.trace_session))
+        if rows:
+            st.dataframe(rows, hide_index=True)
+            st.download_button("Download traces (OTLP JSON)", file_name="traces.json", mime="application/json",
+                               data=json.dumps(tracing.to_otlp(tracing.finished_spans(st.session_state.trace_session))))
+        else:
+            st.caption("No traced requests yet")
 
 # Main chat interface
 st.title("💬 Data Analysis Chat")
 
 # Display chat messages
 st.markdown('<div class="chat-container">', unsafe_allow_html=True)
-for message in st.session_state.messages:
-    if message["role"] == "user":
-        st.markdown(f'<div class="user-message">{message["content"]}</div>', unsafe_allow_html=True)
+n_archived, live_messages = st.session_state.history.split(st.session_state.messages)
+if n_archived and st.toggle(f"Show {n_archived} earlier messages"):
+    st.markdown(st.session_state.history.archive(), unsafe_allow_html=True)
+for message in live_messages:
+    if message.role == "user":
+        st.markdown(f'<div class="user-message">{message.content}</div>', unsafe_allow_html=True)
     else:
-        st.markdown(f'<div class="assistant-message">{message["content"]}</div>', unsafe_allow_html=True)
-        # If the message contains a figure, try to display it
-        if "figure" in message:
-            fig = message["figure"]
-            st.plotly_chart(fig, use_container_width=True)
-        # If the message contains a dataframe, display it
-        if "dataframe" in message:
-            st.dataframe(message["dataframe"])
+        st.markdown(f'<div class="assistant-message">{message.content}</div>', unsafe_allow_html=True)
+        # Figures and tables are loaded back from the artifact store
+        for ref in message.artifacts:
+            if ref.kind == "plotly":
+                st.plotly_chart(st.session_state.artifacts.get(ref), use_container_width=True, key=f"artifact-{ref.id}")
+            elif ref.kind == "frame":
+                st.dataframe(st.session_state.artifacts.get(ref))
 st.markdown('</div>', unsafe_allow_html=True)
 
 # Input for user message
@@ -338,27 +368,23 @@ user_input = st.text_input("Type your analysis request here:", key="user_input")
 # Process user input
 if user_input:
     # Add user message to chat
-    st.session_state.messages.append({"role": "user", "content": user_input})
+    st.session_state.messages.append(Message("user", user_input))
     
     # Check if data is loaded
-    if st.session_state.df is None:
+    if st.session_state.dataset is None:
         response = "Please upload a CSV file or use sample data first."
-        st.session_state.messages.append({"role": "assistant", "content": response})
+        st.session_state.messages.append(Message("assistant", response))
     else:
-        # Process the command
-        response, result = analyze_command(user_input, st.session_state.df)
-        
-        # Add assistant response to chat
-        message = {"role": "assistant", "content": response}
-        
-        # If result is a figure, add it to the message
-        if isinstance(result, (plt.Figure)):
-            message["figure"] = result
-        # If result is a dataframe, add it to the message
-        elif isinstance(result, pd.DataFrame):
-            message["dataframe"] = result
-            
-        st.session_state.messages.append(message)
+        with tracing.span("chat_turn", dataset=st.session_state.df_name):
+            # Process the command
+            response, result = analyze_command(user_input, store.frame(st.session_state.dataset), st.session_state)
+
+            # Figures and tables are stored serialized; the message only references them
+            artifacts = ()
+            if result is not None:
+                with tracing.span("artifacts.put"):
+                    artifacts = (st.session_state.artifacts.put(result),)
+        st.session_state.messages.append(Message("assistant", response, artifacts))
     
     # Rerun to update the chat interface
     st.rerun()